@@ -21,4 +21,6 @@ admin.site.register(models.Notification)
 admin.site.register(models.Coupon)
 admin.site.register(models.Wishlist)
 admin.site.register(models.Country)
-
+admin.site.register(models.Job)
+admin.site.register(models.StripeEvent)
+admin.site.register(models.OutboxEmail)
@@ -0,0 +1,115 @@
+"""
+JWT authentication without a user lookup per request.
+
+``MyTokenObtainPairSerializer`` puts the user's id, name, email, username and
+staff flag in the access token, so most views can use the verified claims
+directly. ``ClaimsJWTAuthentication``, the default authentication class of
+every API view (``REST_FRAMEWORK`` setting), sets ``request.user`` to a
+``TokenUser`` built from those claims and makes no query. Views that need the
+``CustomUser`` model itself, e.g. to assign it to a foreign key, set
+``UserJWTAuthentication``, which loads it like simplejwt's
+``JWTAuthentication``.
+
+Both classes keep the tokens they verified in a small per-process LRU keyed
+by JTI, so a token sent with many requests is decoded and its signature
+checked once. A hit must be the exact same encoded token and not yet
+expired, so the cache never accepts a token that would fail verification.
+As with any stateless token, a user deactivated after login keeps access
+until the token expires (``ACCESS_TOKEN_LIFETIME``).
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+import jwt
+from django.conf import settings
+from rest_framework_simplejwt.authentication import JWTAuthentication, JWTStatelessUserAuthentication
+from rest_framework_simplejwt.settings import api_settings
+
+
+class TokenCache:
+    """
+    Thread-safe LRU of verified tokens, keyed by JTI.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.tokens = OrderedDict()  # JTI -> (encoded token, validated token)
+        self.lock = threading.Lock()
+
+    def get(self, jti, raw_token):
+        with self.lock:
+            cached = self.tokens.get(jti)
+            if cached is None or cached[0] != raw_token:
+                return None
+            if cached[1]["exp"] <= time.time():
+                del self.tokens[jti]
+                return None
+            self.tokens.move_to_end(jti)
+            return cached[1]
+
+    def set(self, jti, raw_token, validated_token):
+        if self.max_size <= 0:
+            return
+        with self.lock:
+            self.tokens[jti] = (raw_token, validated_token)
+            self.tokens.move_to_end(jti)
+            while len(self.tokens) > self.max_size:
+                self.tokens.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.tokens.clear()
+
+
+token_cache = TokenCache(settings.JWT_TOKEN_CACHE_SIZE)
+
+
+def unverified_jti(raw_token):
+    """
+    Read the JTI of an encoded token without verifying it.
+
+    Only used to look the token up in the cache; a hit still has to match the
+    whole encoded token.
+
+    :param raw_token: The encoded token from the Authorization header
+    :return: The JTI, or None if it cannot be read
+    :rtype: str
+    """
+    try:
+        return jwt.decode(raw_token, options={"verify_signature": False}).get(api_settings.JTI_CLAIM)
+    except jwt.PyJWTError:
+        return None
+
+
+class CachedTokenMixin:
+    def get_validated_token(self, raw_token):
+        """
+        Return the verified token, decoding it only on a cache miss.
+
+        :param raw_token: The encoded token from the Authorization header
+        :return: The validated token
+        :raises InvalidToken: If the token is malformed, forged or expired
+        """
+        jti = unverified_jti(raw_token)
+        if jti is not None:
+            validated_token = token_cache.get(jti, raw_token)
+            if validated_token is not None:
+                return validated_token
+        validated_token = super().get_validated_token(raw_token)
+        if jti is not None and validated_token.get(api_settings.JTI_CLAIM) == jti:
+            token_cache.set(jti, raw_token, validated_token)
+        return validated_token
+
+
+class ClaimsJWTAuthentication(CachedTokenMixin, JWTStatelessUserAuthentication):
+    """
+    Authenticate with a JWT and build ``request.user`` from its claims.
+    """
+
+
+class UserJWTAuthentication(CachedTokenMixin, JWTAuthentication):
+    """
+    Authenticate with a JWT and load the ``CustomUser`` it was issued to.
+    """
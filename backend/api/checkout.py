@@ -0,0 +1,68 @@
+"""
+Cached read model of an order for the payment page.
+
+The checkout payload (order, items, course titles and images, applied
+coupons) is built with a fixed number of queries and cached per order for
+``CHECKOUT_CACHE_TIMEOUT`` seconds. Everything that changes an order drops
+the cached copy: the CartOrder/CartOrderItem signal receivers for saves and
+M2M changes, and explicit ``invalidate_checkout`` calls in the services that
+write with ``update()`` (coupon redemption, payment finalization).
+
+Invalidation only reaches other worker processes through a shared cache
+(``CACHE_URL``). With the default local-memory cache the other workers would
+keep serving stale totals, so ``CHECKOUT_CACHE_TIMEOUT`` defaults to 0 and the
+payload is built on every request.
+"""
+
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Prefetch
+from rest_framework.renderers import JSONRenderer
+
+from api import models as api_models
+from api import serializer as api_serializers
+
+
+def load_order(order_id):
+    """
+    Load an order with everything the checkout shows, in four queries.
+
+    :param order_id: The public order id
+    :return: The CartOrder with ``prefetched_items``, or None
+    :rtype: CartOrder
+    """
+    items = (
+        api_models.CartOrderItem.objects.select_related("course")
+        .prefetch_related("coupons")
+        .order_by("date", "id")
+    )
+    return (
+        api_models.CartOrder.objects.filter(order_id=order_id)
+        .prefetch_related(Prefetch("orderitem", queryset=items, to_attr="prefetched_items"), "coupons")
+        .first()
+    )
+
+
+def get_checkout(order_id):
+    """
+    Return the checkout payload of an order, from the cache when possible.
+
+    File URLs are relative to the site; the view makes them absolute.
+
+    :param order_id: The public order id
+    :return: The payload as plain JSON data, or None if the order does not exist
+    :rtype: dict
+    """
+    key = api_models.checkout_cache_key(order_id)
+    data = cache.get(key) if settings.CHECKOUT_CACHE_TIMEOUT else None
+    if data is None:
+        order = load_order(order_id)
+        if order is None:
+            return None
+        serialized = api_serializers.CheckoutSerializer(order).data
+        data = json.loads(JSONRenderer().render(serialized))  # Plain types, safe to pickle
+        if settings.CHECKOUT_CACHE_TIMEOUT:
+            cache.set(key, data, settings.CHECKOUT_CACHE_TIMEOUT)
+    return data
@@ -0,0 +1,178 @@
+"""
+Coupon redemption for course orders.
+
+A coupon discounts every item of an order that belongs to the coupon's
+teacher. Applying it is one transaction:
+
+* the coupon is looked up by code through the cache (``COUPON_CACHE_TIMEOUT``),
+  which the Coupon signal receivers invalidate on every change. Without a
+  shared cache (``CACHE_URL``) only the process that made the change drops
+  its copy, so unknown codes are never cached (a new code works everywhere
+  at once) and the teacher and discount are read again inside the
+  transaction, so an edited coupon is applied with its current discount;
+* the coupon is linked to the eligible items first; the unique constraint of
+  that M2M table makes a concurrent second application of the same coupon to
+  the same order fail instead of discounting twice;
+* a use is reserved with a conditional ``F()`` UPDATE that also re-checks
+  ``active``, expiry and ``max_uses`` in the database, so a cached coupon that
+  was meanwhile disabled or used up cannot be redeemed;
+* the item and order amounts are reduced with ``F()`` updates, which bypass
+  the signal receivers, so the cached checkout of the order is dropped explicitly;
+* the order update is conditional on the order still waiting for payment
+  without a Stripe session. A session is created for the order's total, so a
+  coupon applied afterwards would make the paid amount differ from the order
+  and the payment could not be finalized.
+"""
+
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Case, DecimalField, F, Q, Value, When
+from django.utils import timezone
+
+from api import models as api_models
+
+# Results of apply_coupon
+APPLIED = "applied"
+ALREADY_APPLIED = "already_applied"
+NOT_FOUND = "not_found"
+EXPIRED = "expired"
+EXHAUSTED = "exhausted"
+NOT_APPLICABLE = "not_applicable"
+PAYMENT_STARTED = "payment_started"
+
+
+def get_active_coupon(code):
+    """
+    Return the active coupon with the given code, using the cache.
+
+    Only found coupons are cached; a code created after a miss would otherwise
+    stay "not found" in the other worker processes until the entry expires.
+
+    :param code: The coupon code entered by the student
+    :return: The Coupon, or None if no active coupon has this code
+    :rtype: Coupon
+    """
+    key = api_models.coupon_cache_key(code)
+    coupon = cache.get(key)
+    if coupon is None:
+        coupon = api_models.Coupon.objects.filter(code=code, active=True).first()
+        if coupon is not None:
+            cache.set(key, coupon, settings.COUPON_CACHE_TIMEOUT)
+    return coupon
+
+
+def payment_started(order):
+    return bool(order.stripe_session_id) or order.payment_status != "processing"
+
+
+def item_discount(item_total, percent):
+    return (item_total * Decimal(percent) / 100).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+
+
+def reserve_use(coupon, now):
+    """
+    Count one use of a coupon if it is still redeemable.
+
+    :return: None on success, otherwise ``EXPIRED`` or ``EXHAUSTED``
+    :rtype: str
+    """
+    reserved = (
+        api_models.Coupon.objects.filter(pk=coupon.pk, active=True)
+        .filter(Q(valid_from__isnull=True) | Q(valid_from__lte=now))
+        .filter(Q(expires_at__isnull=True) | Q(expires_at__gt=now))
+        .filter(Q(max_uses__isnull=True) | Q(times_used__lt=F("max_uses")))
+        .update(times_used=F("times_used") + 1)
+    )
+    if reserved:
+        return None
+    current = api_models.Coupon.objects.filter(pk=coupon.pk).first()
+    if current is not None and current.is_valid_at(now):
+        return EXHAUSTED
+    return EXPIRED
+
+
+def apply_coupon(order, code):
+    """
+    Apply a coupon to every eligible item of an order.
+
+    :param order: The CartOrder to discount
+    :param code: The coupon code
+    :return: One of ``APPLIED``, ``ALREADY_APPLIED``, ``NOT_FOUND``, ``EXPIRED``,
+        ``EXHAUSTED``, ``NOT_APPLICABLE`` or ``PAYMENT_STARTED``
+    :rtype: str
+    """
+    if payment_started(order):
+        return PAYMENT_STARTED
+    coupon = get_active_coupon(code)
+    if coupon is None:
+        return NOT_FOUND
+    now = timezone.now()
+    if not coupon.is_valid_at(now):
+        return EXPIRED
+
+    ItemCoupon = api_models.CartOrderItem.coupons.through
+    try:
+        with transaction.atomic():
+            current = api_models.Coupon.objects.filter(pk=coupon.pk).values("teacher_id", "discount").first()
+            if current is None:  # Deleted since it was cached
+                return NOT_FOUND
+            items = list(
+                api_models.CartOrderItem.objects.filter(order_id=order.pk, teacher_id=current["teacher_id"])
+                .exclude(coupons=coupon)
+                .values_list("id", "total")
+            )
+            if not items:
+                applied = ItemCoupon.objects.filter(cartorderitem__order_id=order.pk, coupon_id=coupon.pk)
+                return ALREADY_APPLIED if applied.exists() else NOT_APPLICABLE
+
+            # Claim the items; a concurrent application of this coupon hits the unique constraint
+            ItemCoupon.objects.bulk_create([
+                ItemCoupon(cartorderitem_id=item_id, coupon_id=coupon.pk) for item_id, _ in items
+            ])
+
+            failure = reserve_use(coupon, now)
+            if failure:
+                transaction.set_rollback(True)
+                return failure
+
+            discounts = {item_id: item_discount(total, current["discount"]) for item_id, total in items}
+            discount = Case(
+                *[When(pk=item_id, then=Value(amount)) for item_id, amount in discounts.items()],
+                output_field=DecimalField(max_digits=12, decimal_places=2),
+            )
+            api_models.CartOrderItem.objects.filter(pk__in=discounts).update(
+                total=F("total") - discount,
+                price=F("price") - discount,
+                saved=F("saved") + discount,
+                applied_coupon=True,
+            )
+
+            order_discount = sum(discounts.values(), Decimal("0.00"))
+            awaiting_payment = (
+                api_models.CartOrder.objects.filter(pk=order.pk, payment_status="processing")
+                .filter(Q(stripe_session_id__isnull=True) | Q(stripe_session_id=""))
+            )
+            updated = awaiting_payment.update(
+                total=F("total") - order_discount,
+                subtotal=F("subtotal") - order_discount,
+                saved=F("saved") + order_discount,
+            )
+            if not updated:  # A checkout session was created meanwhile
+                transaction.set_rollback(True)
+                return PAYMENT_STARTED
+            api_models.CartOrder.coupons.through.objects.bulk_create(
+                [api_models.CartOrder.coupons.through(cartorder_id=order.pk, coupon_id=coupon.pk)],
+                ignore_conflicts=True,
+            )
+            if order.student_id:
+                api_models.Coupon.used_by.through.objects.bulk_create(
+                    [api_models.Coupon.used_by.through(coupon_id=coupon.pk, customuser_id=order.student_id)],
+                    ignore_conflicts=True,
+                )
+            api_models.invalidate_checkout(order.order_id)
+    except IntegrityError:  # Another request applied the coupon to these items first
+        return ALREADY_APPLIED
+    return APPLIED
@@ -0,0 +1,80 @@
+"""
+Database routing and connection tuning.
+
+When a ``replica`` database is configured (``DATABASE_REPLICA_URL``), the
+public catalog views read from it inside ``replica_reads()``. Everything
+else, writes and reads outside the catalog (e.g. right after a checkout),
+stays on the primary, so a lagging replica can only make the catalog
+briefly stale.
+
+SQLite connections are switched to WAL mode so readers no longer block the
+writer, and wait for locks instead of failing with "database is locked".
+"""
+
+import contextvars
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+REPLICA_DB_ALIAS = "replica"
+
+_use_replica = contextvars.ContextVar("use_replica", default=False)
+
+
+@contextmanager
+def replica_reads():
+    """Route the reads made inside the block to the replica, if one is configured."""
+    token = _use_replica.set(True)
+    try:
+        yield
+    finally:
+        _use_replica.reset(token)
+
+
+class ReplicaRouter:
+    """
+    Send reads to the replica inside ``replica_reads()``; always write to the primary.
+
+    Without a replica database this router has no effect.
+    """
+
+    def db_for_read(self, model, **hints):
+        if _use_replica.get() and REPLICA_DB_ALIAS in connections.databases:
+            return REPLICA_DB_ALIAS
+        return None
+
+    def db_for_write(self, model, **hints):
+        # Objects read from the replica must still be saved to the primary
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, REPLICA_DB_ALIAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == REPLICA_DB_ALIAS:
+            return False  # The replica is migrated through replication
+        return None
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    """
+    Signal receiver that applies the SQLite PRAGMAs to every new connection.
+
+    :param sender: The database wrapper class.
+    :param connection: The new database connection.
+    :param \*\*kwargs: Additional keyword arguments.
+    :return: None
+    """
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"PRAGMA journal_mode = {settings.SQLITE_JOURNAL_MODE}")
+        cursor.execute(f"PRAGMA synchronous = {settings.SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA busy_timeout = {int(settings.SQLITE_BUSY_TIMEOUT_MS)}")
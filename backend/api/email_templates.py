@@ -0,0 +1,109 @@
+"""
+Rendering of transactional email templates.
+
+An email is a pair of templates, ``email/<name>.txt`` and ``email/<name>.html``.
+They are fetched through the template engine's cached loader. The first time
+a template is seen, the rules of the HTML template's ``<style>`` block are
+inlined into ``style`` attributes (most email clients ignore style sheets) by
+``css_inline``, which parses the HTML properly, and the result is compiled
+once; later renders reuse the compiled templates until the loader reloads the
+file. ``render_batch`` renders the messages of many recipients from the same
+compiled templates.
+
+Rules that cannot be inlined (media queries, pseudo-classes) stay in a
+``<style>`` block for the clients that support it. Django template tags are
+set aside while the HTML is parsed, so they may appear in text and attribute
+values, but not in place of an attribute.
+"""
+
+import re
+
+import css_inline
+from django.template import Context, engines
+from django.template.base import tag_re
+
+PLACEHOLDER = "dj-template-tag-{}-end"  # Stands in for a template tag while the HTML is parsed
+PLACEHOLDER_RE = re.compile(r'dj-template-tag-(\d+)-end(="")?')
+
+inliner = css_inline.CSSInliner(remove_inlined_selectors=True, load_remote_stylesheets=False)
+
+_compiled = {}  # Template name -> (source template from the loader, compiled inlined template)
+
+
+def inline_css(html):
+    """
+    Move the ``<style>`` rules of an HTML email into ``style`` attributes.
+
+    Declarations are applied in CSS specificity order, and a tag's own
+    ``style`` attribute still wins over the style sheet.
+
+    :param html: The HTML source (a template or a rendered message)
+    :return: The HTML document with the inlinable rules inlined
+    :rtype: str
+    :raises ValueError: If a template tag stands in place of an attribute
+    """
+    tags = []
+
+    def set_aside(match):
+        tags.append(match.group(0))
+        return PLACEHOLDER.format(len(tags) - 1)
+
+    def restore(match):
+        if match.group(2):  # The parser read the placeholder as an attribute name
+            raise ValueError(f"Template tag inside an HTML tag cannot be inlined: {tags[int(match.group(1))]}")
+        return tags[int(match.group(1))]
+
+    return PLACEHOLDER_RE.sub(restore, inliner.inline(tag_re.sub(set_aside, html)))
+
+
+def get_template(template_name):
+    """
+    Return the compiled template, with CSS inlined for HTML templates.
+
+    :param template_name: Template path, e.g. ``email/password_reset.html``
+    :return: The compiled template
+    :rtype: django.template.base.Template
+    """
+    engine = engines["django"].engine
+    source_template = engine.get_template(template_name)  # Cached by the loader
+    cached = _compiled.get(template_name)
+    if cached and cached[0] is source_template:
+        return cached[1]
+    compiled = source_template
+    if template_name.endswith(".html"):
+        compiled = engine.from_string(inline_css(source_template.source))
+    _compiled[template_name] = (source_template, compiled)
+    return compiled
+
+
+def render(name, context):
+    """
+    Render the text and HTML bodies of an email.
+
+    :param name: Name of the email, e.g. ``"password_reset"``
+    :param context: Template variables
+    :return: The text body and the HTML body
+    :rtype: tuple
+    """
+    return render_batch(name, [context])[0]
+
+
+def render_batch(name, contexts):
+    """
+    Render the text and HTML bodies of one email for many recipients.
+
+    The templates are looked up and compiled once for the whole batch. The
+    text body is rendered without HTML autoescaping, so links keep their
+    ``&`` separators.
+
+    :param name: Name of the email, e.g. ``"password_reset"``
+    :param contexts: Template variables of each recipient
+    :return: A ``(text, html)`` pair per context, in order
+    :rtype: list
+    """
+    text_template = get_template(f"email/{name}.txt")
+    html_template = get_template(f"email/{name}.html")
+    return [
+        (text_template.render(Context(context, autoescape=False)), html_template.render(Context(context)))
+        for context in contexts
+    ]
@@ -0,0 +1,195 @@
+"""
+A small database-backed job queue.
+
+Jobs are rows in ``api.Job`` created inside the caller's transaction, so a
+job only becomes visible to workers once the data it refers to is committed.
+Workers (``python manage.py run_jobs``) claim jobs with a conditional UPDATE,
+which lets several worker processes share one queue without double-running a
+job. Workers can be limited to some tasks (``run_jobs --names`` and
+``--exclude``), so long transcodes run in their own worker and never hold up
+webhook processing or email delivery. Tests run the queue in-process with
+``run_pending_jobs()``.
+
+A running job whose worker died is claimed again after ``JOB_LOCK_TIMEOUT``
+seconds; ``JOB_LOCK_TIMEOUTS`` sets a longer timeout for slow tasks such as
+transcodes, so short jobs are not delayed by it.
+"""
+
+import logging
+import traceback
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+TASKS = {}
+PERIODIC_TASKS = {}  # Task name -> seconds between runs
+
+
+def task(func):
+    """
+    Register a function as a background task under its name.
+
+    :param func: The task function; it receives the job payload as keyword arguments
+    :return: The function unchanged
+    """
+    TASKS[func.__name__] = func
+    return func
+
+
+def periodic(seconds):
+    """
+    Register a task that runs every ``seconds``.
+
+    A periodic task has a single Job row: when a run finishes, the same row is
+    set back to pending for the next run instead of inserting a new one.
+    ``schedule_periodic_jobs`` queues the first run.
+
+    :param seconds: Interval between the end of a run and the next run
+    :return: A decorator registering the task
+    """
+    def decorator(func):
+        PERIODIC_TASKS[func.__name__] = seconds
+        return task(func)
+    return decorator
+
+
+def schedule_periodic_jobs():
+    """
+    Queue every periodic task that has no pending or running job.
+
+    :return: Names of the tasks that were queued
+    :rtype: list
+    """
+    queued = []
+    for name in PERIODIC_TASKS:
+        active = job_model().objects.filter(name=name, status__in=["pending", "running"])
+        if not active.exists():
+            enqueue(name)
+            queued.append(name)
+    return queued
+
+
+def job_model():
+    return apps.get_model("api", "Job")
+
+
+def enqueue(name, run_at=None, max_attempts=None, **payload):
+    """
+    Queue a registered task to run in the background.
+
+    :param name: Name of the task function
+    :param run_at: Earliest time the job may run; defaults to now
+    :param max_attempts: Number of tries before the job is marked failed
+    :param payload: JSON-serializable keyword arguments for the task
+    :return: The created Job
+    :rtype: Job
+    """
+    return job_model().objects.create(
+        name=name,
+        payload=payload,
+        run_at=run_at or timezone.now(),
+        max_attempts=max_attempts or settings.JOB_MAX_ATTEMPTS,
+    )
+
+
+def lock_timeout(name):
+    return settings.JOB_LOCK_TIMEOUTS.get(name, settings.JOB_LOCK_TIMEOUT)
+
+
+def stale_claims(now, names=None):
+    """
+    Return a filter matching running jobs whose lock has expired.
+
+    :param now: The current time
+    :param names: Task names the caller runs; all tasks when None
+    :return: The filter
+    :rtype: Q
+    """
+    overrides = {
+        name: seconds for name, seconds in settings.JOB_LOCK_TIMEOUTS.items() if names is None or name in names
+    }
+    default = now - timedelta(seconds=settings.JOB_LOCK_TIMEOUT)
+    stale = Q(status="running", started_at__lt=default) & ~Q(name__in=overrides)
+    for name, seconds in overrides.items():
+        stale |= Q(status="running", name=name, started_at__lt=now - timedelta(seconds=seconds))
+    return stale
+
+
+def claim_job(job, now):
+    """
+    Atomically mark a job as running for this worker.
+
+    A running job whose lock has expired (its worker died) can be claimed
+    again.
+
+    :return: True if this worker won the job
+    :rtype: bool
+    """
+    stale = now - timedelta(seconds=lock_timeout(job.name))
+    claimed = (
+        job_model()
+        .objects.filter(pk=job.pk)
+        .filter(Q(status="pending") | Q(status="running", started_at__lt=stale))
+        .update(status="running", started_at=now, attempts=F("attempts") + 1)
+    )
+    return claimed == 1
+
+
+def run_job(job):
+    """
+    Run one claimed job and record the outcome.
+
+    Failures are retried with exponential backoff until ``max_attempts`` is
+    reached, then the job is marked failed with the traceback. A periodic
+    job is then rescheduled on the same row, whatever the outcome.
+    """
+    job.refresh_from_db()
+    try:
+        TASKS[job.name](**job.payload)
+    except Exception:
+        logger.exception("Job %s (%s) failed", job.pk, job.name)
+        job.last_error = traceback.format_exc()
+        if job.attempts < job.max_attempts:
+            delay = settings.JOB_RETRY_BACKOFF * 2 ** (job.attempts - 1)
+            job.status = "pending"
+            job.run_at = timezone.now() + timedelta(seconds=delay)
+        else:
+            job.status = "failed"
+    else:
+        job.status = "done"
+    job.finished_at = timezone.now()
+    if job.name in PERIODIC_TASKS and job.status != "pending":  # Not waiting for a retry
+        job.status = "pending"
+        job.attempts = 0
+        job.run_at = job.finished_at + timedelta(seconds=PERIODIC_TASKS[job.name])
+    job.save(update_fields=["status", "attempts", "run_at", "last_error", "finished_at", "updated_at"])
+
+
+def run_pending_jobs(limit=None, names=None, exclude=None):
+    """
+    Run the jobs that are due, oldest first.
+
+    :param limit: Maximum number of jobs to run; all due jobs when None
+    :param names: Only run jobs for these task names
+    :param exclude: Never run jobs for these task names
+    :return: Number of jobs run
+    :rtype: int
+    """
+    now = timezone.now()
+    due = job_model().objects.filter(Q(status="pending", run_at__lte=now) | stale_claims(now, names))
+    if names is not None:
+        due = due.filter(name__in=names)
+    if exclude:
+        due = due.exclude(name__in=exclude)
+
+    ran = 0
+    for job in due.order_by("run_at")[:limit]:
+        if claim_job(job, now):
+            run_job(job)
+            ran += 1
+    return ran
@@ -0,0 +1,173 @@
+"""
+Outgoing email through a database outbox.
+
+Requests only insert a row into ``api.OutboxEmail`` with ``queue_email``, so
+they never wait on the email provider. The periodic ``send_queued_emails``
+job delivers the due messages in batches:
+
+* a batch is claimed with a conditional UPDATE, so several workers never
+  send the same message; a message left in ``sending`` by a dead worker is
+  claimed again after ``EMAIL_CLAIM_TIMEOUT``;
+* the whole batch goes through one backend connection, paced to at most
+  ``EMAIL_RATE_LIMIT`` messages per second;
+* a message that fails is retried with exponential backoff
+  (``EMAIL_RETRY_BACKOFF``) until ``EMAIL_MAX_ATTEMPTS``, then marked failed.
+
+Message bodies are rendered by ``api.email_templates``; ``queue_templated_emails``
+renders and queues a whole list of recipients at once. Which provider is
+used is up to ``EMAIL_BACKEND``; the console and file backends work for
+local development, and tests use Django's in-memory backend.
+"""
+
+import logging
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db.models import F, Q
+from django.utils import timezone
+
+from api import email_templates
+from api import models as api_models
+
+logger = logging.getLogger(__name__)
+
+
+def queue_email(subject, to, body, html_body=None, from_email=None):
+    """
+    Queue an email for background delivery.
+
+    The row is part of the caller's transaction, so the email is only sent if
+    the transaction commits.
+
+    :param subject: Subject line
+    :param to: List of recipient addresses
+    :param body: Plain text body
+    :param html_body: Optional HTML alternative
+    :param from_email: Sender; ``EMAIL`` by default
+    :return: The queued OutboxEmail
+    :rtype: OutboxEmail
+    """
+    return api_models.OutboxEmail.objects.create(
+        subject=subject,
+        to=list(to),
+        body=body,
+        html_body=html_body,
+        from_email=from_email or settings.EMAIL,
+    )
+
+
+def queue_templated_emails(name, subject, recipients, from_email=None):
+    """
+    Render an email for many recipients and queue all of them.
+
+    :param name: Name of the email templates, e.g. ``"password_reset"``
+    :param subject: Subject line
+    :param recipients: ``(address, context)`` pairs
+    :param from_email: Sender; ``EMAIL`` by default
+    :return: The queued OutboxEmail rows
+    :rtype: list
+    """
+    recipients = list(recipients)
+    bodies = email_templates.render_batch(name, [context for _, context in recipients])
+    return api_models.OutboxEmail.objects.bulk_create(
+        [
+            api_models.OutboxEmail(
+                subject=subject,
+                to=[address],
+                body=body,
+                html_body=html_body,
+                from_email=from_email or settings.EMAIL,
+            )
+            for (address, _), (body, html_body) in zip(recipients, bodies)
+        ],
+        batch_size=500,
+    )
+
+
+def claim_batch(limit, now):
+    """
+    Mark up to ``limit`` due messages as sending for this worker.
+
+    :return: The claimed messages, oldest first
+    :rtype: list
+    """
+    stale = now - timedelta(seconds=settings.EMAIL_CLAIM_TIMEOUT)
+    due = Q(status="queued", send_after__lte=now) | Q(status="sending", claimed_at__lt=stale)
+    ids = list(api_models.OutboxEmail.objects.filter(due).values_list("pk", flat=True)[:limit])
+    if not ids:
+        return []
+    token = uuid.uuid4().hex
+    api_models.OutboxEmail.objects.filter(due, pk__in=ids).update(
+        status="sending", claim_token=token, claimed_at=now, attempts=F("attempts") + 1
+    )
+    return list(api_models.OutboxEmail.objects.filter(claim_token=token, status="sending"))
+
+
+def record_failure(email, error):
+    email.last_error = str(error)
+    if email.attempts >= settings.EMAIL_MAX_ATTEMPTS:
+        email.status = "failed"
+    else:
+        email.status = "queued"
+        delay = settings.EMAIL_RETRY_BACKOFF * 2 ** (email.attempts - 1)
+        email.send_after = timezone.now() + timedelta(seconds=delay)
+    email.claim_token = None
+    email.save(update_fields=["status", "send_after", "last_error", "claim_token"])
+    logger.warning("Email %s to %s failed (attempt %s): %s", email.pk, email.to, email.attempts, error)
+
+
+def send_queued(batch_size=None):
+    """
+    Deliver one batch of due messages.
+
+    :param batch_size: Messages to send; ``EMAIL_BATCH_SIZE`` by default
+    :return: The number of messages sent and the number that failed
+    :rtype: tuple
+    """
+    batch = claim_batch(batch_size or settings.EMAIL_BATCH_SIZE, timezone.now())
+    if not batch:
+        return 0, 0
+
+    connection = get_connection(fail_silently=False)
+    try:
+        connection.open()
+    except Exception as error:  # Provider unreachable: retry the whole batch later
+        for email in batch:
+            record_failure(email, error)
+        return 0, len(batch)
+
+    interval = 1 / settings.EMAIL_RATE_LIMIT if settings.EMAIL_RATE_LIMIT else 0
+    sent_ids, failed = [], 0
+    next_send = time.monotonic()
+    try:
+        for email in batch:
+            wait = next_send - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            next_send = time.monotonic() + interval
+
+            message = EmailMultiAlternatives(
+                subject=email.subject,
+                body=email.body,
+                from_email=email.from_email,
+                to=email.to,
+                connection=connection,
+            )
+            if email.html_body:
+                message.attach_alternative(email.html_body, "text/html")
+            try:
+                message.send()
+            except Exception as error:
+                record_failure(email, error)
+                failed += 1
+            else:
+                sent_ids.append(email.pk)
+    finally:
+        connection.close()
+        api_models.OutboxEmail.objects.filter(pk__in=sent_ids).update(
+            status="sent", sent_at=timezone.now(), claim_token=None, last_error=None
+        )
+    return len(sent_ids), failed
@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.template.loader import render_to_string
+
+from api import email_templates
+
+
+class Command(BaseCommand):
+    help = (
+        "Time rendering an email for many recipients: render_to_string per message "
+        "(the plain template engine path), against api.email_templates.render_batch."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--count", type=int, default=10000, help="Number of messages to render.")
+        parser.add_argument("--template", default="password_reset", help="Name of the email templates.")
+
+    def handle(self, *args, **options):
+        name = options["template"]
+        contexts = [
+            {"username": f"student{index}", "link": f"https://example.com/create-new-password/?uuid={index}&token=abc-{index}"}
+            for index in range(options["count"])
+        ]
+
+        def per_message():
+            for context in contexts:
+                render_to_string(f"email/{name}.txt", context)
+                render_to_string(f"email/{name}.html", context)
+
+        def batch():
+            email_templates.render_batch(name, contexts)
+
+        for label, run in (("render_to_string per message", per_message), ("render_batch", batch)):
+            start = time.perf_counter()
+            run()
+            elapsed = time.perf_counter() - start
+            self.stdout.write(
+                f"{label}: {elapsed * 1000:.0f} ms for {len(contexts)} messages "
+                f"({elapsed * 1e6 / max(len(contexts), 1):.1f} us/message)"
+            )
@@ -0,0 +1,192 @@
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, models, transaction
+from django.utils import timezone
+
+from api import models as api_models
+from userauth.models import CustomUser
+
+# Indexes added for the hot lookup paths (migrations 0019 and 0021), by model
+HOT_PATH_INDEXES = [
+    (api_models.Course, "course_catalog_idx"),
+    (api_models.Review, "review_active_course_idx"),
+    (api_models.CompletedCourse, "completed_user_course_idx"),
+    (api_models.Note, "note_user_course_idx"),
+    (api_models.Notification, "notification_teacher_date_idx"),
+    (api_models.Notification, "notification_user_date_idx"),
+    (api_models.EnrolledCourse, "unique_enrollment_per_user"),
+    (api_models.EnrolledCourse, "enrollment_user_date_idx"),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a throwaway dataset and compare the query plans and timings of the "
+        "hot lookup paths without and with their indexes. Nothing is kept: the "
+        "data and the dropped indexes are rolled back at the end."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--courses", type=int, default=500, help="Number of courses to seed.")
+        parser.add_argument("--students", type=int, default=2000, help="Number of students to seed.")
+        parser.add_argument(
+            "--per-student",
+            type=int,
+            default=5,
+            help="Enrollments per student; lessons, notes and notifications scale with it.",
+        )
+        parser.add_argument("--repeat", type=int, default=20, help="Runs per query; the median is reported.")
+        parser.add_argument("--seed", type=int, default=0, help="Random seed of the dataset.")
+
+    def handle(self, *args, **options):
+        """
+        Seed, measure with the indexes, drop them, measure again, roll back.
+
+        Plans come from the backend's EXPLAIN (``EXPLAIN QUERY PLAN`` on
+        SQLite), so the output shows whether each query searches an index or
+        scans the table and sorts.
+        """
+        rng = random.Random(options["seed"])
+        with transaction.atomic():
+            samples = self.seed(rng, options)
+            if connection.vendor in ("sqlite", "postgresql"):
+                with connection.cursor() as cursor:
+                    cursor.execute("ANALYZE")  # Let the planner see the seeded distribution
+
+            queries = self.hot_queries(**samples)
+            after = {label: self.measure(queryset, "after", options["repeat"]) for label, queryset in queries}
+            self.drop_indexes()
+            before = {label: self.measure(queryset, "before", options["repeat"]) for label, queryset in queries}
+
+            for label, _ in queries:
+                self.stdout.write(self.style.MIGRATE_HEADING(label))
+                for name, (plan, elapsed) in (("before", before[label]), ("after", after[label])):
+                    self.stdout.write(f"  {name}: {elapsed:.3f} ms")
+                    for line in plan.splitlines():
+                        self.stdout.write(f"    {line}")
+            transaction.set_rollback(True)
+
+    def seed(self, rng, options):
+        now = timezone.now()
+        prefix = f"bench{rng.randrange(10 ** 6)}-"  # Unique fields must not clash with real rows
+
+        users = CustomUser.objects.bulk_create([
+            CustomUser(username=f"{prefix}{index}", email=f"{prefix}{index}@example.com")
+            for index in range(options["students"] + options["courses"] // 10 + 1)
+        ])
+        teacher_users, students = users[: options["courses"] // 10 + 1], users[options["courses"] // 10 + 1:]
+        teachers = api_models.Teacher.objects.bulk_create([
+            api_models.Teacher(user=user, full_name=user.username) for user in teacher_users
+        ])
+        statuses = ["Published"] * 8 + ["Draft", "Disabled"]
+        courses = api_models.Course.objects.bulk_create([
+            api_models.Course(
+                teacher=rng.choice(teachers),
+                title=f"{prefix}course {index}",
+                slug=f"{prefix}course-{index}",
+                course_id=f"{prefix}{index}",
+                platform_status=rng.choice(statuses),
+                teacher_course_status=rng.choice(statuses),
+            )
+            for index in range(options["courses"])
+        ])
+
+        enrollments, reviews, lessons, notes, notifications = [], [], [], [], []
+        for student in students:
+            for course in rng.sample(courses, min(options["per_student"], len(courses))):
+                counter = len(enrollments)
+                date = now - timedelta(minutes=rng.randrange(500000))
+                enrollments.append(api_models.EnrolledCourse(
+                    course=course, user=student, teacher_id=course.teacher_id,
+                    enrollment_id=f"{prefix}{counter}", date=date,
+                ))
+                reviews.append(api_models.Review(
+                    course=course, user=student, review="Review", rating=rng.randint(1, 5),
+                    active=rng.random() < 0.9, review_id=f"{prefix}{counter}",
+                ))
+                lessons += [
+                    api_models.CompletedCourse(course=course, user=student, date=date + timedelta(hours=hour))
+                    for hour in range(4)
+                ]
+                notes.append(api_models.Note(
+                    course=course, user=student, title="Note", note="Note", note_id=f"{prefix}{counter}",
+                ))
+                notifications += [
+                    api_models.Notification(
+                        user=student, type="Course Enrollment Completed", date=date,
+                        notification_id=f"{prefix}{counter}s",
+                    ),
+                    api_models.Notification(
+                        teacher_id=course.teacher_id, type="New Order", date=date,
+                        notification_id=f"{prefix}{counter}t",
+                    ),
+                ]
+        for model, rows in (
+            (api_models.EnrolledCourse, enrollments),
+            (api_models.Review, reviews),
+            (api_models.CompletedCourse, lessons),
+            (api_models.Note, notes),
+            (api_models.Notification, notifications),
+        ):
+            model.objects.bulk_create(rows, batch_size=1000)
+
+        self.stdout.write(
+            f"Seeded {len(courses)} courses, {len(students)} students, {len(enrollments)} enrollments, "
+            f"{len(lessons)} completed lessons, {len(notifications)} notifications"
+        )
+        enrollment = rng.choice(enrollments)
+        return {"course": enrollment.course, "student": enrollment.user, "teacher": enrollment.course.teacher}
+
+    def hot_queries(self, course, student, teacher):
+        """Return the lookups the views and signal receivers run, as (label, queryset) pairs."""
+        return [
+            ("Catalog page", api_models.Course.objects.published().order_by("slug")[:20]),
+            (
+                "Course rating aggregates",
+                api_models.Review.objects.filter(course=course, active=True)
+                .values("rating").annotate(count=models.Count("id")).order_by(),
+            ),
+            ("Enrollment check", api_models.EnrolledCourse.objects.filter(course=course, user=student)[:1]),
+            ("Student dashboard", api_models.EnrolledCourse.objects.filter(user=student).order_by("-date")),
+            (
+                "Last completed lesson",
+                api_models.CompletedCourse.objects.filter(course=course, user=student).order_by("-date", "-id")[:1],
+            ),
+            ("Student notes", api_models.Note.objects.filter(user=student, course=course)),
+            ("Teacher notifications", api_models.Notification.objects.filter(teacher=teacher).order_by("-date")[:20]),
+            ("Student notifications", api_models.Notification.objects.filter(user=student).order_by("-date")[:20]),
+        ]
+
+    def measure(self, queryset, phase, repeat):
+        """
+        Return the plan and median run time in milliseconds of a query's SQL.
+
+        The SQL is tagged with the phase because SQLite keeps prepared
+        statements per SQL text and would otherwise explain the query with
+        the plan prepared before the indexes were dropped.
+        """
+        sql, params = queryset.query.sql_with_params()
+        sql = f"{sql} /* {phase} */"
+        timings = []
+        with connection.cursor() as cursor:
+            cursor.execute(f"{connection.ops.explain_query_prefix()} {sql}", params)
+            plan = "\n".join(" ".join(str(value) for value in row) for row in cursor.fetchall())
+            for _ in range(repeat):
+                start = time.perf_counter()
+                cursor.execute(sql, params)
+                cursor.fetchall()
+                timings.append((time.perf_counter() - start) * 1000)
+        return plan, statistics.median(timings)
+
+    def drop_indexes(self):
+        schema_editor = connection.SchemaEditorClass(connection)
+        with connection.cursor() as cursor:
+            for model, name in HOT_PATH_INDEXES:
+                cursor.execute(schema_editor.sql_delete_index % {
+                    "name": schema_editor.quote_name(name),
+                    "table": schema_editor.quote_name(model._meta.db_table),
+                })
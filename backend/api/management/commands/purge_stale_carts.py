@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from api.tasks import purge_stale_carts
+
+
+class Command(BaseCommand):
+    help = "Delete guest carts that were not touched for CART_GUEST_TTL_DAYS."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=None,
+            help="Rows deleted per transaction (CART_PURGE_BATCH_SIZE by default).",
+        )
+
+    def handle(self, *args, **options):
+        deleted = purge_stale_carts(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} stale cart rows"))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from api import models as api_models
+
+
+class Command(BaseCommand):
+    help = "Recompute the stored rating average, count and histogram of every course."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Number of courses written per UPDATE batch.",
+        )
+
+    def handle(self, *args, **options):
+        """
+        Rebuild the denormalized rating fields in bulk.
+        """
+        rebuilt = api_models.rebuild_rating_stats(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt ratings for {rebuilt} courses"))
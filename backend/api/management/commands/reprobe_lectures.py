@@ -0,0 +1,57 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from api import media
+from api import models as api_models
+
+
+class Command(BaseCommand):
+    help = "Re-read the duration of every lecture file from its container header."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--missing-only",
+            action="store_true",
+            help="Only probe lectures that have no duration yet.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=200,
+            help="Number of lectures written per UPDATE batch.",
+        )
+
+    def handle(self, *args, **options):
+        """
+        Probe the lecture media library in-process and store the durations.
+
+        Each file is probed from its header only, and results are written
+        back with ``bulk_update`` in batches.
+        """
+        items = api_models.VariantItem.objects.exclude(file="").only("id", "file")
+        if options["missing_only"]:
+            items = items.filter(duration__isnull=True)
+
+        fields = ["duration", "content_duration", "processing_status"]
+        batch = []
+        probed = failed = 0
+        for item in items.iterator(chunk_size=options["batch_size"]):
+            try:
+                duration_seconds = media.probe_file_duration(item.file)
+            except Exception as error:
+                self.stderr.write(f"{item.file.name}: {error}")
+                item.processing_status = "failed"
+                failed += 1
+            else:
+                item.duration = timedelta(seconds=duration_seconds)
+                item.content_duration = media.format_duration(duration_seconds)
+                item.processing_status = "ready"
+                probed += 1
+            batch.append(item)
+            if len(batch) >= options["batch_size"]:
+                api_models.VariantItem.objects.bulk_update(batch, fields)
+                batch = []
+        api_models.VariantItem.objects.bulk_update(batch, fields)
+
+        self.stdout.write(self.style.SUCCESS(f"Probed {probed} lecture(s), {failed} failed"))
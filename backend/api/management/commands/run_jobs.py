@@ -0,0 +1,59 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.jobs import TASKS, run_pending_jobs, schedule_periodic_jobs
+
+
+class Command(BaseCommand):
+    help = (
+        "Run queued background jobs. By default a worker runs every task. Long "
+        "transcodes would then hold up webhook processing and email delivery, so "
+        "production should run them in a worker of their own: "
+        "'run_jobs --names transcode_variant_item' next to "
+        "'run_jobs --exclude transcode_variant_item'."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Run the jobs that are due and exit instead of polling.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=10,
+            help="Maximum number of jobs run per poll.",
+        )
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=1.0,
+            help="Seconds to wait when the queue is empty.",
+        )
+        parser.add_argument(
+            "--names",
+            nargs="+",
+            help="Only run jobs of these tasks.",
+        )
+        parser.add_argument(
+            "--exclude",
+            nargs="+",
+            help="Never run jobs of these tasks.",
+        )
+
+    def handle(self, *args, **options):
+        unknown = (set(options["names"] or []) | set(options["exclude"] or [])) - set(TASKS)
+        if unknown:
+            raise CommandError(f"Unknown task(s): {', '.join(sorted(unknown))}")
+        for name in schedule_periodic_jobs():
+            self.stdout.write(f"Scheduled periodic job {name}")
+        while True:
+            ran = run_pending_jobs(limit=options["batch_size"], names=options["names"], exclude=options["exclude"])
+            if ran:
+                self.stdout.write(f"Ran {ran} job(s)")
+            if options["once"]:
+                break
+            if not ran:
+                time.sleep(options["sleep"])
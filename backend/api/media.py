@@ -0,0 +1,358 @@
+"""
+Helpers for reading metadata out of uploaded lecture media.
+
+Durations are read straight from the container header: the ``mvhd`` atom of
+MP4/MOV files and the ``Segment/Info`` element of WebM/Matroska files. Only
+the few header bytes are touched (memory-mapped for local files, HTTP range
+requests for remote storage), so probing does not depend on the file size.
+Other formats fall back to ``ffprobe``.
+"""
+
+import math
+import mmap
+import os
+import shutil
+import struct
+import subprocess
+
+import requests
+from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos
+
+
+class MediaReader:
+    """
+    Random-access reader over a media file.
+
+    Subclasses implement ``read_raw``; reads are served from a single cached
+    block so walking consecutive headers does not cost a round trip each.
+    """
+
+    block_size = 64 * 1024
+    size = 0
+
+    def __init__(self):
+        self._block_start = None
+        self._block = b""
+
+    def read(self, offset, size):
+        end = offset + size
+        block_end = (self._block_start or 0) + len(self._block)
+        if self._block_start is None or offset < self._block_start or end > block_end:
+            self._block_start = offset
+            self._block = self.read_raw(offset, max(size, self.block_size))
+        start = offset - self._block_start
+        return self._block[start:start + size]
+
+    def read_raw(self, offset, size):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class LocalFileReader(MediaReader):
+    """Memory-mapped reader for a file on the local filesystem."""
+
+    def __init__(self, path):
+        super().__init__()
+        self._file = open(path, "rb")
+        self._map = None
+        self.size = os.fstat(self._file.fileno()).st_size
+        if self.size:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def read(self, offset, size):
+        if self._map is None:
+            return b""
+        return self._map[offset:offset + size]
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+        self._file.close()
+
+
+class StorageFileReader(MediaReader):
+    """Reader over an open, seekable file object from a storage backend."""
+
+    def __init__(self, file, size):
+        super().__init__()
+        self._file = file
+        self.size = size
+
+    def read_raw(self, offset, size):
+        self._file.seek(offset)
+        return self._file.read(size)
+
+
+class HTTPRangeReader(MediaReader):
+    """Reader that fetches byte ranges of a remote file over HTTP."""
+
+    def __init__(self, url, session=None, timeout=10):
+        super().__init__()
+        self.url = url
+        self.timeout = timeout
+        self._session = session or requests.Session()
+        self._block_start = 0
+        self._block = self._get(0, self.block_size)
+
+    def _get(self, offset, size):
+        # Streamed so that a server ignoring Range (200 with the whole file)
+        # is refused before its body is downloaded
+        response = self._session.get(
+            self.url,
+            headers={"Range": f"bytes={offset}-{offset + size - 1}"},
+            timeout=self.timeout,
+            stream=True,
+        )
+        try:
+            response.raise_for_status()
+            if response.status_code != 206:
+                raise OSError(f"{self.url} does not support range requests")
+            self.size = int(response.headers["Content-Range"].rsplit("/", 1)[1])
+            return response.raw.read(size, decode_content=True)
+        finally:
+            response.close()
+
+    def read_raw(self, offset, size):
+        if offset >= self.size:
+            return b""
+        return self._get(offset, size)
+
+
+MP4_TOP_LEVEL_BOXES = {b"ftyp", b"moov", b"mdat", b"free", b"skip", b"wide", b"pnot"}
+
+
+def iter_mp4_boxes(reader, start, end):
+    """
+    Yield ``(type, body_start, box_end)`` for the MP4 boxes between two offsets.
+
+    Box bodies are never read, so large ``mdat`` boxes are skipped for free.
+    """
+    offset = start
+    while offset + 8 <= end:
+        header = reader.read(offset, 16)
+        size, box_type = struct.unpack(">I4s", header[:8])
+        header_size = 8
+        if size == 1:  # 64-bit size follows the type
+            size = struct.unpack(">Q", header[8:16])[0]
+            header_size = 16
+        elif size == 0:  # Box extends to the end of the file
+            size = end - offset
+        if size < header_size:
+            return
+        yield box_type, offset + header_size, offset + size
+        offset += size
+
+
+def mp4_duration(reader):
+    """
+    Return the duration stored in the ``moov/mvhd`` atom of an MP4/MOV file.
+
+    :return: Duration in seconds, or None when the header has none
+    :rtype: float
+    """
+    for box_type, body_start, box_end in iter_mp4_boxes(reader, 0, reader.size):
+        if box_type != b"moov":
+            continue
+        for child_type, child_start, _ in iter_mp4_boxes(reader, body_start, box_end):
+            if child_type != b"mvhd":
+                continue
+            data = reader.read(child_start, 32)
+            if data[0] == 1:  # Version 1 uses 64-bit times
+                timescale, duration = struct.unpack(">IQ", data[20:32])
+            else:
+                timescale, duration = struct.unpack(">II", data[12:20])
+                if duration == 0xFFFFFFFF:
+                    return None
+            return duration / timescale if timescale else None
+    return None
+
+
+EBML_MAGIC = b"\x1a\x45\xdf\xa3"
+MKV_SEGMENT = 0x18538067
+MKV_INFO = 0x1549A966
+MKV_CLUSTER = 0x1F43B675
+MKV_TIMECODE_SCALE = 0x2AD7B1
+MKV_DURATION = 0x4489
+
+
+def read_vint(data, position, keep_marker):
+    """
+    Decode an EBML variable-length integer.
+
+    :param keep_marker: Keep the length marker bit (element ids) or strip it (sizes)
+    :return: The value and its length in bytes
+    :rtype: tuple
+    """
+    first = data[position]
+    if first == 0:
+        raise ValueError("Invalid EBML variable-length integer")
+    length = 9 - first.bit_length()
+    value = first if keep_marker else first & ((1 << (8 - length)) - 1)
+    for byte in data[position + 1:position + length]:
+        value = (value << 8) | byte
+    return value, length
+
+
+def iter_ebml_elements(reader, start, end):
+    """Yield ``(id, body_start, element_end)`` for the EBML elements between two offsets."""
+    offset = start
+    while offset < end:
+        header = reader.read(offset, 16)
+        if len(header) < 2:
+            return
+        element_id, id_length = read_vint(header, 0, keep_marker=True)
+        size, size_length = read_vint(header, id_length, keep_marker=False)
+        body_start = offset + id_length + size_length
+        if size == (1 << (7 * size_length)) - 1:  # Unknown size: runs to the parent's end
+            element_end = end
+        else:
+            element_end = body_start + size
+        yield element_id, body_start, element_end
+        offset = element_end
+
+
+def matroska_duration(reader):
+    """
+    Return the duration stored in the ``Segment/Info`` element of a WebM/MKV file.
+
+    :return: Duration in seconds, or None when the header has none
+    :rtype: float
+    """
+    for element_id, body_start, element_end in iter_ebml_elements(reader, 0, reader.size):
+        if element_id != MKV_SEGMENT:
+            continue
+        for child_id, child_start, child_end in iter_ebml_elements(reader, body_start, element_end):
+            if child_id == MKV_CLUSTER:  # Info always precedes the media clusters
+                return None
+            if child_id != MKV_INFO:
+                continue
+            timecode_scale = 1_000_000  # Nanoseconds per tick, the Matroska default
+            duration = None
+            for info_id, info_start, info_end in iter_ebml_elements(reader, child_start, child_end):
+                value = reader.read(info_start, info_end - info_start)
+                if info_id == MKV_TIMECODE_SCALE:
+                    timecode_scale = int.from_bytes(value, "big")
+                elif info_id == MKV_DURATION:
+                    duration = struct.unpack(">f" if len(value) == 4 else ">d", value)[0]
+            if duration is None:
+                return None
+            return duration * timecode_scale / 1_000_000_000
+    return None
+
+
+def header_duration(reader):
+    """
+    Return the duration read from a supported container header.
+
+    :return: Duration in seconds, or None if the format is unknown or has no duration
+    :rtype: float
+    """
+    head = reader.read(0, 8)
+    try:
+        if head[:4] == EBML_MAGIC:
+            return matroska_duration(reader)
+        if head[4:8] in MP4_TOP_LEVEL_BOXES:
+            return mp4_duration(reader)
+    except (ValueError, IndexError, struct.error):
+        return None
+    return None
+
+
+def ffprobe_duration(source):
+    """
+    Return the duration reported by ``ffprobe`` for a path or URL.
+
+    Falls back to parsing ``ffmpeg -i`` when ``ffprobe`` is not installed.
+
+    :param source: Local path or URL of the media file
+    :return: Duration in seconds
+    :rtype: float
+    """
+    ffprobe = shutil.which("ffprobe")
+    if ffprobe is None:
+        return ffmpeg_parse_infos(source)["duration"]
+    output = subprocess.run(
+        [
+            ffprobe,
+            "-v", "error",
+            "-show_entries", "format=duration",
+            "-of", "default=noprint_wrappers=1:nokey=1",
+            source,
+        ],
+        capture_output=True,
+        check=True,
+        text=True,
+    ).stdout
+    return float(output.strip())
+
+
+def probe_duration(path):
+    """
+    Return the duration of a local media file in seconds.
+
+    :param path: Local filesystem path of the media file
+    :return: Duration in seconds
+    :rtype: float
+    """
+    with LocalFileReader(path) as reader:
+        duration = header_duration(reader)
+    if duration is None:
+        duration = ffprobe_duration(path)
+    return duration
+
+
+def probe_file_duration(field_file):
+    """
+    Return the duration of a stored media file in seconds.
+
+    Local files are memory-mapped; files on remote storage are read with
+    HTTP range requests against their URL, or through the storage's own file
+    object when it has no absolute URL.
+
+    :param field_file: The ``FieldFile`` of the upload, e.g. ``VariantItem.file``
+    :return: Duration in seconds
+    :rtype: float
+    """
+    try:
+        path = field_file.path
+    except NotImplementedError:  # Remote storage has no local path
+        path = None
+    if path:
+        return probe_duration(path)
+
+    url = field_file.url
+    if url.startswith(("http://", "https://")):
+        try:
+            with HTTPRangeReader(url) as reader:
+                duration = header_duration(reader)
+        except (OSError, requests.RequestException):
+            duration = None
+        return duration if duration is not None else ffprobe_duration(url)
+
+    with field_file.open("rb") as file:
+        duration = header_duration(StorageFileReader(file, field_file.size))
+    if duration is None:
+        raise ValueError(f"Could not read the duration of {field_file.name}")
+    return duration
+
+
+def format_duration(duration_seconds):
+    """
+    Format a duration for display, e.g. 100 seconds -> "01m:40s".
+
+    :param duration_seconds: Duration in seconds
+    :return: The duration formatted as minutes and seconds
+    :rtype: str
+    """
+    minutes, remainder = divmod(duration_seconds, 60)  # 60 seconds in a minute
+    minutes = math.floor(minutes)
+    seconds = math.floor(remainder)
+    return f"{minutes:02d}m:{seconds:02d}s"
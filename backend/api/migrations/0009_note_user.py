@@ -0,0 +1,26 @@
+# Generated by Django 4.2.7 on 2026-10-18 18:12
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('api', '0008_cartorder_total'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='note',
+            name='user',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='notification',
+            name='type',
+            field=models.CharField(choices=[('New Course', 'New Course'), ('New Course Question', 'New Course Question'), ('New Course Published', 'New Course Published'), ('New Review', 'New Review'), ('Draft Course', 'Draft Course'), ('Course Enrollment Completed', 'Course Enrollment Completed'), ('New Order', 'New Order')], default=None, max_length=100),
+        ),
+    ]
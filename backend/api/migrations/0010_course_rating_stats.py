@@ -0,0 +1,68 @@
+# Generated by Django 4.2.7 on 2026-10-18 18:14
+
+from decimal import Decimal
+
+import api.models
+from django.db import migrations, models
+
+
+def backfill_rating_stats(apps, schema_editor):
+    # Self-contained on purpose: the live api.models helpers may change after
+    # this migration was written.
+    Course = apps.get_model('api', 'Course')
+    Review = apps.get_model('api', 'Review')
+
+    histograms = {}
+    rows = (
+        Review.objects.filter(active=True)
+        .values_list('course_id', 'rating')
+        .annotate(count=models.Count('id'))
+        .order_by()
+    )
+    for course_id, rating, count in rows:
+        histograms.setdefault(course_id, {str(star): 0 for star in range(1, 6)})[str(rating)] = count
+
+    courses = list(Course.objects.only('id'))
+    for course in courses:
+        histogram = histograms.get(course.id, {str(star): 0 for star in range(1, 6)})
+        course.rating_count = sum(histogram.values())
+        total = sum(int(star) * count for star, count in histogram.items())
+        if course.rating_count:
+            course.rating_avg = (Decimal(total) / course.rating_count).quantize(Decimal('0.01'))
+        else:
+            course.rating_avg = Decimal('0.00')
+        course.rating_histogram = histogram
+    Course.objects.bulk_update(
+        courses, ['rating_avg', 'rating_count', 'rating_histogram'], batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_note_user'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='rating_avg',
+            field=models.DecimalField(db_index=True, decimal_places=2, default=0.0, max_digits=3),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='rating_histogram',
+            field=models.JSONField(blank=True, default=api.models.empty_rating_histogram),
+        ),
+        migrations.AlterField(
+            model_name='review',
+            name='rating',
+            field=models.PositiveSmallIntegerField(choices=[(1, '1 Star'), (2, '2 Star'), (3, '3 Star'), (4, '4 Star'), (5, '5 Star')], default=None),
+        ),
+        migrations.RunPython(backfill_rating_stats, migrations.RunPython.noop),
+    ]
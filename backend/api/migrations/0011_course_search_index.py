@@ -0,0 +1,30 @@
+from django.db import migrations
+
+from api.search import SQLiteFTS5SearchBackend
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    backend = SQLiteFTS5SearchBackend()
+    with schema_editor.connection.cursor() as cursor:
+        backend.create_index(cursor)
+        backend.rebuild(cursor)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        SQLiteFTS5SearchBackend().drop_index(cursor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_course_rating_stats'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,79 @@
+# Generated by Django 4.2.7 on 2026-10-18 18:25
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+import api.models
+
+
+def backfill_progress(apps, schema_editor):
+    EnrolledCourse = apps.get_model('api', 'EnrolledCourse')
+    CompletedCourse = apps.get_model('api', 'CompletedCourse')
+    VariantItem = apps.get_model('api', 'VariantItem')
+
+    totals = dict(
+        VariantItem.objects.values_list('variant__course_id')
+        .annotate(count=models.Count('id'))
+        .order_by()
+    )
+    completed = {}
+    last = {}
+    rows = (
+        CompletedCourse.objects.filter(variant_item__isnull=False)
+        .order_by('date', 'id')
+        .values_list('course_id', 'user_id', 'variant_item_id', 'date')
+    )
+    for course_id, user_id, variant_item_id, date in rows:
+        completed.setdefault((course_id, user_id), set()).add(variant_item_id)
+        last[(course_id, user_id)] = (variant_item_id, date)  # Rows are oldest first
+
+    enrollments = list(EnrolledCourse.objects.only('id', 'course_id', 'user_id'))
+    for enrollment in enrollments:
+        key = (enrollment.course_id, enrollment.user_id)
+        enrollment.completed_lessons_count = len(completed.get(key, ()))
+        enrollment.total_lectures = totals.get(enrollment.course_id, 0)
+        enrollment.progress_percent = api.models.progress_percent(
+            enrollment.completed_lessons_count, enrollment.total_lectures
+        )
+        enrollment.last_lesson_id, enrollment.last_lesson_date = last.get(key, (None, None))
+    EnrolledCourse.objects.bulk_update(
+        enrollments,
+        ['completed_lessons_count', 'total_lectures', 'progress_percent', 'last_lesson', 'last_lesson_date'],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_variantitem_hls'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='enrolledcourse',
+            name='completed_lessons_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='enrolledcourse',
+            name='last_lesson',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='api.variantitem'),
+        ),
+        migrations.AddField(
+            model_name='enrolledcourse',
+            name='last_lesson_date',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='enrolledcourse',
+            name='progress_percent',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='enrolledcourse',
+            name='total_lectures',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_progress, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.2.7 on 2026-10-18 18:33
+
+from django.db import migrations, models
+import shortuuid.django_fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0017_coupon_limits'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cart',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='cart',
+            name='cart_id',
+            field=shortuuid.django_fields.ShortUUIDField(alphabet='1234567890', db_index=True, length=6, max_length=20, prefix=''),
+        ),
+    ]
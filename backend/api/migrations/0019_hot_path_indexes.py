@@ -0,0 +1,67 @@
+# Generated by Django 4.2.7 on 2026-10-18 18:37
+
+from django.db import migrations, models
+
+
+def check_duplicate_enrollments(apps, schema_editor):
+    # Duplicate enrollments may each belong to a paid order item, so they are
+    # not deleted here: the migration stops and lists them for an operator.
+    EnrolledCourse = apps.get_model('api', 'EnrolledCourse')
+    duplicates = (
+        EnrolledCourse.objects.filter(user__isnull=False)
+        .values('user_id', 'course_id')
+        .annotate(count=models.Count('id'))
+        .filter(count__gt=1)
+        .order_by()
+    )
+    lines = []
+    for row in duplicates:
+        enrollments = EnrolledCourse.objects.filter(user_id=row['user_id'], course_id=row['course_id'])
+        lines.append(
+            f"user {row['user_id']}, course {row['course_id']}: enrollments "
+            + ", ".join(str(pk) for pk in enrollments.order_by('id').values_list('id', flat=True))
+        )
+    if lines:
+        raise RuntimeError(
+            "Cannot add unique_enrollment_per_user, students are enrolled more than once in a course. "
+            "Delete the extra EnrolledCourse rows, then run migrate again:\n" + "\n".join(lines)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0018_cart_key_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicate_enrollments, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='completedcourse',
+            index=models.Index(fields=['user', 'course', 'date'], name='completed_user_course_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(fields=['platform_status', 'teacher_course_status', 'slug'], name='course_catalog_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='note',
+            index=models.Index(fields=['user', 'course'], name='note_user_course_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['teacher', '-date'], name='notification_teacher_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', '-date'], name='notification_user_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(condition=models.Q(('active', True)), fields=['course', 'rating'], name='review_active_course_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='enrolledcourse',
+            constraint=models.UniqueConstraint(condition=models.Q(('user__isnull', False)), fields=('user', 'course'), name='unique_enrollment_per_user'),
+        ),
+    ]
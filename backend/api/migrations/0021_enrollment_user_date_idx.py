@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-18 19:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0020_outbox_email'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='enrolledcourse',
+            index=models.Index(fields=['user', '-date'], name='enrollment_user_date_idx'),
+        ),
+    ]
@@ -1,10 +1,18 @@
 from django.db import models
-from userauth.models import CustomUser, Profile
+from userauth.models import CustomUser
 from django.utils.text import slugify
 from shortuuid.django_fields import ShortUUIDField
 from django.utils import timezone
-from moviepy.editor import VideoFileClip
-import math
+from django.db.models.functions import Coalesce, Least
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+from django.urls import reverse
+from django.core.cache import cache
+from api.search import get_search_backend
+from api.jobs import enqueue
+from api import tax
+from decimal import Decimal
 
 LANGUAGE_CHOICES = (
     ("en", "English"),
@@ -49,6 +57,33 @@ PLATFORM_STATUS = (
     ("Rejected", "Rejected"),
     ("Pending", "Pending"),
 )
+PROCESSING_STATUS = (
+    ("pending", "Pending"),
+    ("processing", "Processing"),
+    ("ready", "Ready"),
+    ("failed", "Failed"),
+)
+
+JOB_STATUS = (
+    ("pending", "Pending"),
+    ("running", "Running"),
+    ("done", "Done"),
+    ("failed", "Failed"),
+)
+
+EMAIL_STATUS = (
+    ("queued", "Queued"),
+    ("sending", "Sending"),
+    ("sent", "Sent"),
+    ("failed", "Failed"),
+)
+
+WEBHOOK_EVENT_STATUS = (
+    ("received", "Received"),
+    ("processed", "Processed"),
+    ("ignored", "Ignored"),
+)
+
 PAYMENT_STATUS = (
     ("processing", "Processing"),
     ("Paid", "Paid"),
@@ -148,6 +183,118 @@ class Category(models.Model):
         super(Category, self).save(*args, **kwargs)
 
 
+def empty_rating_histogram():
+    return {str(star): 0 for star, _ in RATING}
+
+
+def rating_stats(counts):
+    """
+    Build the stored rating fields of a course from per-star review counts.
+
+    :param counts: Mapping of star rating (1-5) to the number of active reviews
+    :return: Values for ``rating_avg``, ``rating_count`` and ``rating_histogram``
+    :rtype: dict
+    """
+    histogram = empty_rating_histogram()
+    for star, count in counts.items():
+        histogram[str(star)] = count
+
+    rating_count = sum(histogram.values())
+    total = sum(int(star) * count for star, count in histogram.items())
+    if rating_count:
+        rating_avg = (Decimal(total) / rating_count).quantize(Decimal("0.01"))
+    else:
+        rating_avg = Decimal("0.00")
+    return {
+        "rating_avg": rating_avg,
+        "rating_count": rating_count,
+        "rating_histogram": histogram,
+    }
+
+
+def rebuild_rating_stats(batch_size=500):
+    """
+    Recompute the stored rating fields of every course in bulk.
+
+    All active reviews are counted per course and star in one grouped query,
+    then the courses are written back with ``bulk_update``.
+
+    :param batch_size: Number of courses written per UPDATE batch
+    :return: Number of courses rebuilt
+    :rtype: int
+    """
+    counts = {}
+    rows = (
+        Review.objects.filter(active=True)
+        .values_list("course_id", "rating")
+        .annotate(count=models.Count("id"))
+        .order_by()
+    )
+    for course_id, rating, count in rows:
+        counts.setdefault(course_id, {})[rating] = count
+
+    courses = list(Course.objects.only("id"))
+    for course in courses:
+        for field, value in rating_stats(counts.get(course.id, {})).items():
+            setattr(course, field, value)
+
+    with transaction.atomic():
+        Course.objects.bulk_update(
+            courses, ["rating_avg", "rating_count", "rating_histogram"], batch_size=batch_size
+        )
+    return len(courses)
+
+
+class CourseQuerySet(models.QuerySet):
+    def published(self):
+        """
+        Return the courses that are visible in the public catalog.
+
+        :return: Queryset of courses published by both the platform and the teacher
+        :rtype: QuerySet
+        """
+        return self.filter(platform_status="Published", teacher_course_status="Published")
+
+    def with_card_data(self):
+        """
+        Load only what ``CourseCardSerializer`` needs for a listing.
+
+        The rating comes from the stored ``rating_avg``/``rating_count``
+        columns and the teacher is joined in, so a page of cards costs one
+        query.
+
+        :return: Queryset with the teacher selected
+        :rtype: QuerySet
+        """
+        return self.select_related("teacher")
+
+    def with_related(self):
+        """
+        Attach the prefetch plan used by ``CourseSerializer``.
+
+        Every relation the serializer walks (curriculum and reviews) is
+        loaded once for the whole page of courses, so the number of queries
+        stays constant no matter how many courses are serialized. The model
+        methods below read these prefetched attributes when they are present
+        and fall back to a query otherwise.
+
+        :return: Queryset with the serializer prefetch plan applied
+        :rtype: QuerySet
+        """
+        return self.select_related("teacher", "category").prefetch_related(
+            models.Prefetch(
+                "variant_set",
+                queryset=Variant.objects.prefetch_related("variant_items"),
+                to_attr="prefetched_variants",
+            ),
+            models.Prefetch(
+                "review_set",
+                queryset=Review.objects.select_related("user__profile"),
+                to_attr="prefetched_reviews",
+            ),
+        )
+
+
 class Course(models.Model):
     teacher = models.ForeignKey(Teacher, on_delete=models.CASCADE)
     category = models.ForeignKey(
@@ -176,10 +323,22 @@ class Course(models.Model):
         unique=True, max_length=20, alphabet="1234567890", length=6
     )
     date = models.DateTimeField(default=timezone.now)
+    # Denormalized from active reviews by update_rating_stats()
+    rating_avg = models.DecimalField(
+        max_digits=3, decimal_places=2, default=0.00, db_index=True
+    )
+    rating_count = models.PositiveIntegerField(default=0)
+    rating_histogram = models.JSONField(default=empty_rating_histogram, blank=True)
+
+    objects = CourseQuerySet.as_manager()
 
     class Meta:
         verbose_name_plural = "Courses"
         ordering = ("title",)
+        indexes = [
+            # Catalog: published() filtered, paginated by slug
+            models.Index(fields=["platform_status", "teacher_course_status", "slug"], name="course_catalog_idx"),
+        ]
 
     def __str__(self):
         return self.title
@@ -213,7 +372,7 @@ class Course(models.Model):
         :return: Queryset of VariantItem objects for this course
         :rtype: QuerySet
         """
-        return VariantItem.objects.filter(variant__course=self)
+        return self.lectures()
 
     def lectures(self):
         """
@@ -226,36 +385,48 @@ class Course(models.Model):
         :return: Queryset of VariantItem objects for this course
         :rtype: QuerySet
         """
+        if hasattr(self, "prefetched_variants"):
+            items = [
+                item
+                for variant in self.prefetched_variants
+                for item in variant.variant_items.all()
+            ]
+            return sorted(items, key=lambda item: item.title)  # Same order as VariantItem.Meta
         return VariantItem.objects.filter(variant__course=self)
 
     def average_rating(self):
         """
         Return the average rating for the course.
 
-        This method aggregates the average of all CourseReview objects
-        associated with the current course instance, providing an overview
-        of the course's overall rating.
+        The value is read from the stored ``rating_avg`` column, which is
+        kept current whenever a review is saved or deleted.
 
         :return: Average rating for this course
-        :rtype: float
+        :rtype: Decimal
         """
-        average_rating = Review.objects.filter(course=self, active=True).aggregate(
-            avg_rating=models.Avg("rating")
-        )
-        return average_rating["avg_rating"]
+        return self.rating_avg
 
-    def rating_count(self):
+    def update_rating_stats(self):
         """
-        Return the count of CourseReview objects associated with this course.
+        Recompute the stored rating aggregates from the active reviews.
 
-        This method filters and retrieves all reviews where the course
-        is the current instance, allowing access to all reviews for
-        the course.
+        Runs one grouped query over the course's reviews and writes the
+        average, count and per-star histogram with a single UPDATE, without
+        going through ``save()``.
 
-        :return: Count of CourseReview objects for this course
-        :rtype: int
+        :return: None
+        :rtype: NoneType
         """
-        return Review.objects.filter(course=self, active=True).count()
+        counts = (
+            Review.objects.filter(course=self, active=True)
+            .values_list("rating")
+            .annotate(count=models.Count("id"))
+            .order_by()
+        )
+        stats = rating_stats(dict(counts))
+        Course.objects.filter(pk=self.pk).update(**stats)
+        for field, value in stats.items():
+            setattr(self, field, value)
 
     def reviews(self):
         """
@@ -268,8 +439,102 @@ class Course(models.Model):
         :return: Queryset of CourseReview objects for this course
         :rtype: QuerySet
         """
+        if hasattr(self, "prefetched_reviews"):
+            return [review for review in self.prefetched_reviews if review.active]
         return Review.objects.filter(course=self, active=True)
 
+    def completed_lessons_for(self, user_id):
+        """
+        Return the CompletedCourse objects of one user for this course.
+
+        :param user_id: The id of the user whose completed lessons are requested
+        :return: CompletedCourse objects for this course and user
+        :rtype: QuerySet
+        """
+        return CompletedCourse.objects.filter(user_id=user_id, course=self)
+
+    def notes_for(self, user_id):
+        """
+        Return the Note objects of one user for this course.
+
+        :param user_id: The id of the user whose notes are requested
+        :return: Note objects for this course and user
+        :rtype: QuerySet
+        """
+        return Note.objects.filter(user_id=user_id, course=self)
+
+    def review_for(self, user_id):
+        """
+        Return the review left by one user on this course.
+
+        :param user_id: The id of the user whose review is requested
+        :return: The first Review of the user for this course, or None
+        :rtype: Review
+        """
+        if hasattr(self, "prefetched_reviews"):
+            return next(
+                (review for review in self.prefetched_reviews if review.user_id == user_id),
+                None,
+            )
+        return Review.objects.filter(user_id=user_id, course=self).first()
+
+    def question_answers(self):
+        """
+        Return the Question_Answer objects asked on this course.
+
+        :return: Queryset of Question_Answer objects for this course
+        :rtype: QuerySet
+        """
+        return Question_Answer.objects.filter(course=self)
+
+
+@receiver(post_save, sender=Course)
+def index_course(sender, instance, **kwargs):
+    """
+    Signal receiver that refreshes the search index entry of a saved course.
+
+    :param sender: The model class that sent the signal.
+    :param instance: The Course instance being saved.
+    :param \*\*kwargs: Additional keyword arguments.
+    :return: None
+    """
+    get_search_backend().index_courses([instance])
+
+
+@receiver(post_delete, sender=Course)
+def unindex_course(sender, instance, **kwargs):
+    """
+    Signal receiver that drops a deleted course from the search index.
+
+    :param sender: The model class that sent the signal.
+    :param instance: The Course instance being deleted.
+    :param \*\*kwargs: Additional keyword arguments.
+    :return: None
+    """
+    get_search_backend().remove_course(instance.id)
+
+
+@receiver(post_save, sender=Teacher)
+@receiver(post_save, sender=Category)
+def reindex_related_courses(sender, instance, created, **kwargs):
+    """
+    Signal receiver that reindexes the courses of a renamed teacher or category.
+
+    The teacher name and category title are part of each course's index
+    entry, so they are refreshed whenever either is saved.
+
+    :param sender: The model class that sent the signal.
+    :param instance: The Teacher or Category instance being saved.
+    :param created: Boolean; True if a new record was created.
+    :param \*\*kwargs: Additional keyword arguments.
+    :return: None
+    """
+    if created:
+        return
+    lookup = "teacher" if sender is Teacher else "category"
+    courses = Course.objects.filter(**{lookup: instance}).select_related("teacher", "category")
+    get_search_backend().index_courses(courses)
+
 
 class Variant(models.Model):
     course = models.ForeignKey(Course, on_delete=models.CASCADE)
@@ -317,6 +582,14 @@ class VariantItem(models.Model):
     file = models.FileField(upload_to="course-file")
     duration = models.DurationField(null=True, blank=True)
     content_duration = models.CharField(max_length=1000, null=True, blank=True)
+    processing_status = models.CharField(
+        choices=PROCESSING_STATUS, max_length=20, default="ready"
+    )
+    hls_status = models.CharField(
+        choices=PROCESSING_STATUS, max_length=20, null=True, blank=True
+    )
+    hls_playlist = models.CharField(max_length=255, null=True, blank=True)  # "<version>/master.m3u8"
+    hls_renditions = models.JSONField(default=list, blank=True)
     preview = models.BooleanField(default=False)
     variant_item_id = ShortUUIDField(
         unique=True, max_length=20, alphabet="1234567890", length=6
@@ -332,12 +605,21 @@ class VariantItem(models.Model):
     def __str__(self):
         return f"{self.variant.title} - {self.title}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_file_name = instance.__dict__.get("file")  # Name of the stored file
+        return instance
+
     def save(self, *args, **kwargs):
         """
-        Save the VariantItem and calculate the duration of the file.
+        Save the VariantItem and queue a probe of a newly uploaded file.
 
-        This method overrides the default save method to calculate the duration
-        of the uploaded file and save it in the content_duration field.
+        Reading the media duration is slow for large uploads, so it is not done
+        in the request. When the file changes, the item is marked ``pending``
+        and a ``probe_variant_item`` job fills in ``duration`` and
+        ``content_duration`` in the background. The HLS renditions of the old
+        file are dropped; the probe job queues a new transcode.
 
         :param \*args: Additional positional arguments to be passed to the parent class's
             ``save()`` method.
@@ -346,28 +628,56 @@ class VariantItem(models.Model):
         :return: None
         :rtype: NoneType
         """
+        update_fields = kwargs.get("update_fields")
+        file_changed = bool(self.file) and self.file.name != getattr(self, "_loaded_file_name", None)
+        if update_fields is not None and "file" not in update_fields:
+            file_changed = False
+
+        if file_changed:
+            self.processing_status = "pending"
+            self.duration = None
+            self.content_duration = None
+            self.hls_status = None
+            self.hls_playlist = None
+            self.hls_renditions = []
+            if update_fields is not None:
+                kwargs["update_fields"] = set(update_fields) | {
+                    "processing_status",
+                    "duration",
+                    "content_duration",
+                    "hls_status",
+                    "hls_playlist",
+                    "hls_renditions",
+                }
+
         super().save(*args, **kwargs)
+        self._loaded_file_name = self.file.name
 
-        if self.file:
-            clip = VideoFileClip(
-                self.file.path
-            )  # Replace with the path to your video file
-            duration_seconds = clip.duration  # Get the duration in seconds
-
-            minutes, remainder = divmod(
-                duration_seconds, 60
-            )  # 60 seconds in a minute example: 100 seconds = 1 minute and 40 seconds
-            minutes = math.floor(minutes)  # Convert the minutes to an integer
-            seconds = math.floor(remainder)  # Convert the seconds to an integer
-
-            duration = f"{minutes:02d}m:{seconds:02d}s"  # Format the duration as "mm:ss" example: 1m:40s
-            self.content_duration = (
-                duration  # Save the duration in the content_duration field
-            )
+        if file_changed:
+            enqueue("probe_variant_item", variant_item_id=self.pk)
+
+    def hls_path(self, name=""):
+        """
+        Return a path relative to the lecture's HLS directory under ``MEDIA_ROOT``.
+
+        :param name: Path inside the directory, e.g. ``"<version>/master.m3u8"``
+        :return: The path relative to ``MEDIA_ROOT``
+        :rtype: str
+        """
+        return f"hls/{self.variant_item_id}/{name}"
+
+    def hls_url(self):
+        """
+        Return the URL of the master playlist, or None until the lecture is transcoded.
 
-            super().save(
-                update_fields=["content_duration"]
-            )  # Update only the content_duration field
+        :return: Path of the ``lecture-hls`` endpoint for the master playlist
+        :rtype: str
+        """
+        if self.hls_status != "ready" or not self.hls_playlist:
+            return None
+        return reverse(
+            "lecture_hls", kwargs={"variant_item_id": self.variant_item_id, "path": self.hls_playlist}
+        )
 
 
 class Question_Answer(models.Model):
@@ -388,7 +698,9 @@ class Question_Answer(models.Model):
         return Question_Answer_Message.objects.filter(question=self)
 
     def profile(self):
-        return Profile.objects.get(user=self.user)
+        if self.user is None:
+            return None
+        return self.user.profile
 
 
 class Question_Answer_Message(models.Model):
@@ -403,12 +715,84 @@ class Question_Answer_Message(models.Model):
         return f"{self.user.username} - {self.course.title}"
 
     def profile(self):
-        return Profile.objects.get(user=self.user)
+        if self.user is None:
+            return None
+        return self.user.profile
 
     class Meta:
         ordering = ("-date",)
 
 
+CART_TOTAL_FIELDS = {"price": "price", "tax": "tax_fee", "total": "total"}
+
+
+def cart_totals(items):
+    """
+    Sum the price, tax and total of already loaded cart items.
+
+    :param items: Cart objects
+    :return: Dictionary with ``price``, ``tax`` and ``total`` as Decimals
+    :rtype: dict
+    """
+    totals = {key: Decimal("0.00") for key in CART_TOTAL_FIELDS}
+    for item in items:
+        for key, field in CART_TOTAL_FIELDS.items():
+            totals[key] += getattr(item, field)
+    return totals
+
+
+class CartQuerySet(models.QuerySet):
+    def totals(self):
+        """
+        Sum the price, tax and total of the cart items with one aggregate query.
+
+        :return: Dictionary with ``price``, ``tax`` and ``total`` as Decimals
+        :rtype: dict
+        """
+        zero = models.Value(Decimal("0.00"), output_field=models.DecimalField(max_digits=12, decimal_places=2))
+        return self.aggregate(
+            **{key: Coalesce(models.Sum(field), zero) for key, field in CART_TOTAL_FIELDS.items()}
+        )
+
+    def stale_guest_carts(self, cutoff):
+        """
+        Return the guest cart rows not touched since ``cutoff``.
+
+        :param cutoff: Rows last updated before this time are stale
+        :return: Queryset of stale guest cart rows
+        :rtype: QuerySet
+        """
+        return self.filter(user__isnull=True, updated_at__lt=cutoff)
+
+    def merge_guest_cart(self, cart_id, user):
+        """
+        Attach a guest cart to a user who just logged in.
+
+        The guest rows are claimed by the user, and the user's rows saved under
+        other cart ids (e.g. from another device) are moved into this cart. A
+        course that is in both keeps the most recently updated row.
+
+        :param cart_id: The cart id of the browser the user logged in from
+        :param user: The authenticated user
+        :return: Number of rows in the merged cart
+        :rtype: int
+        """
+        with transaction.atomic():
+            # Rows of another user's cart are never taken over
+            self.filter(cart_id=cart_id, user__isnull=True).update(user=user, updated_at=timezone.now())
+            rows = list(
+                self.filter(user=user)
+                .order_by("-updated_at", "-id")
+                .values_list("id", "course_id")
+            )
+            keep = {}
+            for row_id, course_id in rows:
+                keep.setdefault(course_id, row_id)
+            self.filter(user=user).exclude(id__in=keep.values()).delete()
+            self.filter(id__in=keep.values()).exclude(cart_id=cart_id).update(cart_id=cart_id)
+        return len(keep)
+
+
 class Cart(models.Model):
     course = models.ForeignKey(Course, on_delete=models.CASCADE)
     user = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True)
@@ -417,15 +801,33 @@ class Cart(models.Model):
     total = models.DecimalField(max_digits=12, decimal_places=2, default=0.00)
     country = models.CharField(max_length=100, null=True, blank=True)
     cart_id = ShortUUIDField(
-         max_length=20, alphabet="1234567890", length=6
+         max_length=20, alphabet="1234567890", length=6, db_index=True
     )
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)  # Stale guest carts are purged by age
     date = models.DateTimeField(default=timezone.now)
 
+    objects = CartQuerySet.as_manager()
+
     def __str__(self):
         return self.course.title
 
 
+def checkout_cache_key(order_id):
+    return f"checkout:{order_id}"
+
+
+def invalidate_checkout(order_id):
+    """
+    Drop the cached checkout of an order (see ``api.checkout``) once the
+    current transaction commits.
+
+    :param order_id: The public order id
+    :return: None
+    """
+    transaction.on_commit(lambda: cache.delete(checkout_cache_key(order_id)))
+
+
 class CartOrder(models.Model):
     student = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True)
     teacher = models.ManyToManyField(Teacher, blank=True)
@@ -442,6 +844,8 @@ class CartOrder(models.Model):
     country = models.CharField(max_length=100, null=True, blank=True)
     coupons = models.ManyToManyField("api.Coupon", blank=True)
     stripe_session_id = models.CharField(max_length=1000, null=True, blank=True)
+    payment_idempotency_key = models.CharField(max_length=255, unique=True, null=True, blank=True)
+    paid_at = models.DateTimeField(null=True, blank=True)
     order_id = ShortUUIDField(
         unique=True, max_length=20, alphabet="1234567890", length=6
     )
@@ -494,6 +898,41 @@ class CartOrderItem(models.Model):
         return self.oid
 
 
+@receiver(post_save, sender=CartOrder)
+@receiver(post_delete, sender=CartOrder)
+@receiver(m2m_changed, sender=CartOrder.coupons.through)
+def invalidate_order_checkout(sender, instance, **kwargs):
+    """
+    Signal receiver that drops the cached checkout of a changed order.
+
+    :param sender: The model class that sent the signal.
+    :param instance: The CartOrder instance being saved, deleted or relinked.
+    :param \*\*kwargs: Additional keyword arguments.
+    :return: None
+    """
+    if isinstance(instance, CartOrder):  # The reverse side of m2m_changed sends a Coupon
+        invalidate_checkout(instance.order_id)
+
+
+@receiver(post_save, sender=CartOrderItem)
+@receiver(post_delete, sender=CartOrderItem)
+@receiver(m2m_changed, sender=CartOrderItem.coupons.through)
+def invalidate_order_item_checkout(sender, instance, **kwargs):
+    """
+    Signal receiver that drops the cached checkout of the order of a changed item.
+
+    :param sender: The model class that sent the signal.
+    :param instance: The CartOrderItem instance being saved, deleted or relinked.
+    :param \*\*kwargs: Additional keyword arguments.
+    :return: None
+    """
+    if not isinstance(instance, CartOrderItem):
+        return
+    order_id = CartOrder.objects.filter(pk=instance.order_id).values_list("order_id", flat=True).first()
+    if order_id:
+        invalidate_checkout(order_id)
+
+
 class Certificate(models.Model):
     course = models.ForeignKey(
         Course, on_delete=models.CASCADE
@@ -514,10 +953,30 @@ class CompletedCourse(models.Model):
     date = models.DateTimeField(default=timezone.now)
     variant_item = models.ForeignKey(VariantItem, on_delete=models.CASCADE, null=True)
 
+    class Meta:
+        indexes = [
+            # A student's lessons in a course, latest first (EnrolledCourse.update_progress)
+            models.Index(fields=["user", "course", "date"], name="completed_user_course_idx"),
+        ]
+
     def __str__(self):
         return self.course.title
 
 
+def progress_percent(completed, total):
+    """
+    Return the share of completed lectures as a whole percentage.
+
+    :param completed: Number of completed lectures
+    :param total: Number of lectures in the course
+    :return: Percentage between 0 and 100
+    :rtype: int
+    """
+    if not total:
+        return 0
+    return min(completed * 100 // total, 100)
+
+
 class EnrolledCourse(models.Model):
     course = models.ForeignKey(Course, on_delete=models.CASCADE)
     user = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True)
@@ -528,30 +987,214 @@ class EnrolledCourse(models.Model):
     teacher = models.ForeignKey(Teacher, on_delete=models.CASCADE, null=True)
     order_item = models.ForeignKey(CartOrderItem, on_delete=models.SET_NULL, null=True)
 
+    # Stored progress, kept current by the CompletedCourse and VariantItem signal receivers
+    completed_lessons_count = models.PositiveIntegerField(default=0)
+    total_lectures = models.PositiveIntegerField(default=0)
+    progress_percent = models.PositiveSmallIntegerField(default=0)
+    last_lesson = models.ForeignKey(
+        VariantItem, on_delete=models.SET_NULL, null=True, blank=True, related_name="+"
+    )
+    last_lesson_date = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            # Enrollments of deleted users (user NULL) are kept and never conflict
+            models.UniqueConstraint(
+                fields=["user", "course"],
+                condition=models.Q(user__isnull=False),
+                name="unique_enrollment_per_user",
+            ),
+        ]
+        indexes = [
+            # Student dashboard: a student's enrollments, newest first
+            models.Index(fields=["user", "-date"], name="enrollment_user_date_idx"),
+        ]
+
     def __str__(self):
         return self.course.title
 
+    def update_progress(self):
+        """
+        Recompute the stored progress of this enrollment.
+
+        Counts the distinct lectures the student has completed in the course
+        and finds the most recently completed one, then writes the counters
+        with a single UPDATE, without going through ``save()``.
+
+        :return: None
+        :rtype: NoneType
+        """
+        completed = CompletedCourse.objects.filter(
+            course_id=self.course_id, user_id=self.user_id, variant_item__isnull=False
+        )
+        completed_count = completed.aggregate(
+            count=models.Count("variant_item", distinct=True)
+        )["count"]
+        last = completed.order_by("-date", "-id").values("variant_item_id", "date").first() or {}
+        total = VariantItem.objects.filter(variant__course_id=self.course_id).count()
+
+        progress = {
+            "completed_lessons_count": completed_count,
+            "total_lectures": total,
+            "progress_percent": progress_percent(completed_count, total),
+            "last_lesson_id": last.get("variant_item_id"),
+            "last_lesson_date": last.get("date"),
+        }
+        EnrolledCourse.objects.filter(pk=self.pk).update(**progress)
+        for field, value in progress.items():
+            setattr(self, field, value)
+
+    @classmethod
+    def bulk_enroll(cls, enrollments):
+        """
+        Insert new enrollments with one query, their progress already filled in.
+
+        A student has at most one enrollment per course, so enrollments in
+        courses the student already has (e.g. bought again) are skipped.
+        ``bulk_create`` skips the ``post_save`` receiver that initialises the
+        progress, so the lecture totals are read with one grouped query
+        beforehand. Students who completed lessons of a course before (e.g. in
+        an enrollment of a since deleted account) get their counters
+        recomputed afterwards.
+
+        :param enrollments: Unsaved EnrolledCourse objects
+        :return: The created enrollments
+        :rtype: list
+        """
+        course_ids = {enrollment.course_id for enrollment in enrollments}
+        user_ids = {enrollment.user_id for enrollment in enrollments if enrollment.user_id}
+        existing = set(
+            cls.objects.filter(user_id__in=user_ids, course_id__in=course_ids).values_list("course_id", "user_id")
+        ) if user_ids else set()
+        new_enrollments = []
+        for enrollment in enrollments:
+            key = (enrollment.course_id, enrollment.user_id)
+            if enrollment.user_id and key in existing:
+                continue
+            existing.add(key)
+            new_enrollments.append(enrollment)
+        if not new_enrollments:
+            return []
+
+        totals = dict(
+            VariantItem.objects.filter(variant__course_id__in=course_ids)
+            .values_list("variant__course_id")
+            .annotate(count=models.Count("id"))
+            .order_by()
+        )
+        for enrollment in new_enrollments:
+            enrollment.total_lectures = totals.get(enrollment.course_id, 0)
+        created = cls.objects.bulk_create(new_enrollments)
+
+        started = set(
+            CompletedCourse.objects.filter(user_id__in=user_ids, course_id__in=course_ids)
+            .values_list("course_id", "user_id")
+            .distinct()
+        ) if user_ids else set()
+        for enrollment in created:
+            if (enrollment.course_id, enrollment.user_id) in started:
+                enrollment.update_progress()
+        return created
+
+    @classmethod
+    def update_course_totals(cls, course_id):
+        """
+        Refresh the lecture total and percentage of every enrollment in a course.
+
+        Used when a lecture is added or removed; the completed counts are not
+        touched, so this is a single UPDATE whatever the number of students.
+
+        :param course_id: The id of the course whose lectures changed
+        :return: None
+        :rtype: NoneType
+        """
+        total = VariantItem.objects.filter(variant__course_id=course_id).count()
+        if total:
+            percent = Least(models.F("completed_lessons_count") * 100 / total, 100)
+        else:
+            percent = 0
+        cls.objects.filter(course_id=course_id).update(total_lectures=total, progress_percent=percent)
+
+    # The methods below delegate to the course's per-user lookups.
+
     def lectures(self):
-        return VariantItem.objects.filter(variant__course=self.course)
+        return self.course.lectures()
 
     def completedLessons(self):
-        return CompletedCourse.objects.filter(user=self.user, course=self.course)
+        return self.course.completed_lessons_for(self.user_id)
 
     def curriculum(self):
         return Variant.objects.filter(course=self.course)
 
     def note(self):
-        return Note.objects.filter(user=self.user, course=self.course)
+        return self.course.notes_for(self.user_id)
 
     def question_answer(self):
-        return Question_Answer.objects.filter(course=self.course)
+        return self.course.question_answers()
 
     def review(self):
-        return Review.objects.filter(user=self.user, course=self.course).first()
+        return self.course.review_for(self.user_id)
+
+
+@receiver(post_save, sender=EnrolledCourse)
+def init_enrollment_progress(sender, instance, created, **kwargs):
+    """
+    Signal receiver that fills in the progress of a new enrollment.
+
+    :param sender: The model class that sent the signal.
+    :param instance: The EnrolledCourse instance being saved.
+    :param created: Whether the enrollment was just created.
+    :param \*\*kwargs: Additional keyword arguments.
+    :return: None
+    """
+    if created:
+        instance.update_progress()
+
+
+@receiver(post_save, sender=CompletedCourse)
+@receiver(post_delete, sender=CompletedCourse)
+def update_enrollment_progress(sender, instance, **kwargs):
+    """
+    Signal receiver that refreshes a student's progress when a lesson is
+    marked or unmarked as completed.
+
+    :param sender: The model class that sent the signal.
+    :param instance: The CompletedCourse instance being saved or deleted.
+    :param \*\*kwargs: Additional keyword arguments.
+    :return: None
+    """
+    enrollments = EnrolledCourse.objects.filter(
+        course_id=instance.course_id, user_id=instance.user_id
+    )
+    for enrollment in enrollments:
+        enrollment.update_progress()
+
+
+@receiver(post_save, sender=VariantItem)
+@receiver(post_delete, sender=VariantItem)
+def update_course_lecture_totals(sender, instance, created=False, **kwargs):
+    """
+    Signal receiver that refreshes the enrollments' lecture totals when a
+    lecture is added to or removed from a course.
+
+    :param sender: The model class that sent the signal.
+    :param instance: The VariantItem instance being saved or deleted.
+    :param created: Whether the lecture was just created (post_save only).
+    :param \*\*kwargs: Additional keyword arguments.
+    :return: None
+    """
+    if kwargs["signal"] is post_save and not created:
+        return
+    course_id = (
+        Variant.objects.filter(pk=instance.variant_id).values_list("course_id", flat=True).first()
+    )
+    if course_id is not None:  # The whole course may be being deleted
+        EnrolledCourse.update_course_totals(course_id)
 
 
 class Note(models.Model):
     course = models.ForeignKey(Course, on_delete=models.CASCADE)
+    user = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True)
     teacher = models.ForeignKey(Teacher, on_delete=models.CASCADE, null=True)
     date = models.DateTimeField(default=timezone.now)
     title = models.CharField(max_length=100, null=True, blank=True)
@@ -560,6 +1203,11 @@ class Note(models.Model):
         unique=True, max_length=20, alphabet="1234567890", length=6
     )
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "course"], name="note_user_course_idx"),
+        ]
+
     def __str__(self):
         return self.title
 
@@ -568,7 +1216,7 @@ class Review(models.Model):
     course = models.ForeignKey(Course, on_delete=models.CASCADE)
     user = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True)
     review = models.TextField()
-    rating = models.CharField(max_length=100, choices=RATING, default=None)
+    rating = models.PositiveSmallIntegerField(choices=RATING, default=None)
     reply = models.CharField(null=True, blank=True, max_length=100)
     active = models.BooleanField(default=True)
     date = models.DateTimeField(default=timezone.now)
@@ -576,11 +1224,38 @@ class Review(models.Model):
         unique=True, max_length=20, alphabet="1234567890", length=6
     )
 
+    class Meta:
+        indexes = [
+            # Rating aggregates only read active reviews (Course.update_rating_stats)
+            models.Index(
+                fields=["course", "rating"],
+                condition=models.Q(active=True),
+                name="review_active_course_idx",
+            ),
+        ]
+
     def __str__(self):
         return self.course.title
 
     def profile(self):
-        return Profile.objects.get(user=self.user)
+        if self.user is None:
+            return None
+        return self.user.profile
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def update_course_rating(sender, instance, **kwargs):
+    """
+    Signal receiver that refreshes the course rating aggregates when a
+    review is created, edited, deactivated or deleted.
+
+    :param sender: The model class that sent the signal.
+    :param instance: The Review instance being saved or deleted.
+    :param \*\*kwargs: Additional keyword arguments.
+    :return: None
+    """
+    instance.course.update_rating_stats()
 
 
 class Notification(models.Model):
@@ -596,10 +1271,21 @@ class Notification(models.Model):
         unique=True, max_length=20, alphabet="1234567890", length=6
     )
 
+    class Meta:
+        indexes = [
+            # Teacher and student notification feeds, newest first
+            models.Index(fields=["teacher", "-date"], name="notification_teacher_date_idx"),
+            models.Index(fields=["user", "-date"], name="notification_user_date_idx"),
+        ]
+
     def __str__(self) -> str:
         return self.type
 
 
+def coupon_cache_key(code):
+    return f"coupon:{code}"
+
+
 class Coupon(models.Model):
     teacher = models.ForeignKey(Teacher, on_delete=models.SET_NULL, null=True)
     used_by = models.ManyToManyField(CustomUser, blank=True)
@@ -607,10 +1293,53 @@ class Coupon(models.Model):
     discount = models.IntegerField(default=1)
     active = models.BooleanField(default=True)
     date = models.DateTimeField(default=timezone.now)
+    valid_from = models.DateTimeField(null=True, blank=True)
+    expires_at = models.DateTimeField(null=True, blank=True)
+    max_uses = models.PositiveIntegerField(null=True, blank=True)  # Unlimited when empty
+    times_used = models.PositiveIntegerField(default=0)
 
     def __str__(self):
         return self.code
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_code = instance.__dict__.get("code")  # To invalidate a renamed code
+        return instance
+
+    def is_valid_at(self, when):
+        """
+        Return whether the coupon may be used at the given time.
+
+        Usage limits are not checked here; they are enforced when a use is
+        reserved (see ``api.coupons.apply_coupon``).
+
+        :param when: The time of use
+        :return: True if the coupon is active and within its validity window
+        :rtype: bool
+        """
+        if not self.active:
+            return False
+        if self.valid_from and when < self.valid_from:
+            return False
+        return self.expires_at is None or when < self.expires_at
+
+
+@receiver(post_save, sender=Coupon)
+@receiver(post_delete, sender=Coupon)
+def invalidate_coupon_cache(sender, instance, **kwargs):
+    """
+    Signal receiver that drops the cached lookup of a changed or deleted coupon.
+
+    :param sender: The model class that sent the signal.
+    :param instance: The Coupon instance being saved or deleted.
+    :param \*\*kwargs: Additional keyword arguments.
+    :return: None
+    """
+    codes = {instance.code, getattr(instance, "_loaded_code", None)} - {None}
+    cache.delete_many([coupon_cache_key(code) for code in codes])
+    instance._loaded_code = instance.code
+
 
 class Wishlist(models.Model):
     user = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True)
@@ -628,3 +1357,91 @@ class Country(models.Model):
 
     def __str__(self):
         return self.name
+
+
+@receiver(post_save, sender=Country)
+@receiver(post_delete, sender=Country)
+def invalidate_tax_table(sender, instance, **kwargs):
+    """
+    Signal receiver that makes every worker reload its tax-rate table once
+    the country change is committed.
+
+    :param sender: The model class that sent the signal.
+    :param instance: The Country instance being saved or deleted.
+    :param \*\*kwargs: Additional keyword arguments.
+    :return: None
+    """
+    transaction.on_commit(tax.bump_version)
+
+
+class Job(models.Model):
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(choices=JOB_STATUS, max_length=10, default="pending")
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    run_at = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ("run_at",)
+        indexes = [models.Index(fields=["status", "run_at"])]
+
+    def __str__(self):
+        return f"{self.name} ({self.status})"
+
+
+class StripeEvent(models.Model):
+    """
+    A Stripe webhook event, stored as received before it is processed.
+
+    The unique ``event_id`` deduplicates Stripe's at-least-once deliveries;
+    the ``process_stripe_event`` job handles each event once.
+    """
+
+    event_id = models.CharField(max_length=255, unique=True)
+    type = models.CharField(max_length=100)
+    payload = models.JSONField()
+    status = models.CharField(choices=WEBHOOK_EVENT_STATUS, max_length=20, default="received")
+    result = models.CharField(max_length=50, null=True, blank=True)  # Outcome of the payment finalization
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ("-created_at",)
+
+    def __str__(self):
+        return f"{self.type} ({self.event_id})"
+
+
+class OutboxEmail(models.Model):
+    """
+    An email waiting to be delivered by the ``send_queued_emails`` job.
+
+    See ``api.mail`` for how messages are queued, claimed and retried.
+    """
+
+    subject = models.CharField(max_length=255)
+    from_email = models.CharField(max_length=255)
+    to = models.JSONField(default=list)
+    body = models.TextField()
+    html_body = models.TextField(null=True, blank=True)
+    status = models.CharField(choices=EMAIL_STATUS, max_length=10, default="queued")
+    attempts = models.PositiveIntegerField(default=0)
+    send_after = models.DateTimeField(default=timezone.now)
+    claim_token = models.CharField(max_length=32, null=True, blank=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ("send_after", "id")
+        indexes = [models.Index(fields=["status", "send_after"], name="outbox_due_idx")]
+
+    def __str__(self):
+        return f"{self.subject} ({self.status})"
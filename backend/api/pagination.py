@@ -0,0 +1,160 @@
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, _reverse_ordering
+
+
+class CourseCursorPagination(CursorPagination):
+    """
+    Keyset pagination for the public course catalog.
+
+    Pages are addressed by an opaque cursor on ``Course.slug`` (unique and
+    indexed, and derived from the title so the catalog keeps its alphabetical
+    order). Fetching a deep page is a single indexed range scan instead of an
+    ``OFFSET`` that grows with the page number.
+
+    Other orderings (``?ordering=-rating_avg``, search rank) are not unique,
+    and DRF's cursor only holds the first ordering field, falling back to
+    offsets inside a run of ties, which repeats or skips courses once the
+    run is longer than a page. Here ``slug`` is always appended as a
+    tiebreaker and the cursor holds the value of every ordering field, so
+    each page starts strictly after the last course of the previous one.
+    """
+
+    ordering = "slug"
+    tiebreaker = "slug"
+    page_size_query_param = "page_size"  # ?page_size=50
+
+    def __init__(self):
+        # Read per request so the limits can be tuned without a code change
+        self.page_size = settings.COURSE_PAGE_SIZE
+        self.max_page_size = settings.COURSE_MAX_PAGE_SIZE
+
+    def get_ordering(self, request, queryset, view):
+        """
+        Return the requested ordering, ending with the unique tiebreaker.
+
+        :return: Tuple of ordering fields
+        :rtype: tuple
+        """
+        ordering = tuple(super().get_ordering(request, queryset, view))
+        if self.tiebreaker not in [field.lstrip("-") for field in ordering]:
+            ordering += (self.tiebreaker,)
+        return ordering
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """
+        Return one page of the queryset, filtered on the whole ordering key.
+
+        Follows ``CursorPagination.paginate_queryset``, except that the
+        cursor position is compared as a tuple and no offset is ever needed.
+
+        :return: The page of results
+        :rtype: list
+        """
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is None:
+            (reverse, current_position) = (False, None)
+        else:
+            (_, reverse, current_position) = self.cursor
+
+        if reverse:
+            queryset = queryset.order_by(*_reverse_ordering(self.ordering))
+        else:
+            queryset = queryset.order_by(*self.ordering)
+
+        if current_position is not None:
+            try:
+                queryset = queryset.filter(self.position_filter(current_position, reverse))
+            except (TypeError, ValueError, ValidationError):
+                raise NotFound(self.invalid_cursor_message)
+
+        # Fetch one extra item to know whether a following page exists
+        results = list(queryset[:self.page_size + 1])
+        self.page = list(results[:self.page_size])
+
+        if len(results) > len(self.page):
+            has_following_position = True
+            following_position = self._get_position_from_instance(results[-1], self.ordering)
+        else:
+            has_following_position = False
+            following_position = None
+
+        if reverse:
+            self.page = list(reversed(self.page))
+            self.has_next = current_position is not None
+            self.has_previous = has_following_position
+            if self.has_next:
+                self.next_position = current_position
+            if self.has_previous:
+                self.previous_position = following_position
+        else:
+            self.has_next = has_following_position
+            self.has_previous = current_position is not None
+            if self.has_next:
+                self.next_position = following_position
+            if self.has_previous:
+                self.previous_position = current_position
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+
+        return self.page
+
+    def position_filter(self, position, reverse):
+        """
+        Build the filter for the items strictly after ``position``.
+
+        For an ordering ``(a, b)`` and a position ``(x, y)`` this is
+        ``a > x OR (a = x AND b > y)``, with ``>`` turned into ``<`` for
+        descending fields and for reverse cursors.
+
+        :param position: The encoded position from the cursor
+        :param reverse: Whether the cursor walks backwards
+        :return: The filter
+        :rtype: Q
+        :raises ValueError: If the position does not match the ordering
+        """
+        values = json.loads(position)
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise ValueError("Cursor position does not match the ordering")
+
+        condition = None
+        for field, value in reversed(list(zip(self.ordering, values))):
+            name = field.lstrip("-")
+            lookup = "lt" if reverse != field.startswith("-") else "gt"
+            after = Q(**{f"{name}__{lookup}": value})
+            condition = after if condition is None else after | (Q(**{name: value}) & condition)
+        return condition
+
+    def _get_position_from_instance(self, instance, ordering):
+        values = []
+        for field in ordering:
+            name = field.lstrip("-")
+            value = instance[name] if isinstance(instance, dict) else getattr(instance, name)
+            values.append(str(value))
+        return json.dumps(values)
+
+
+class CourseSearchCursorPagination(CourseCursorPagination):
+    """
+    Cursor pagination over ranked search results.
+
+    Pages follow the ``search_rank`` annotation added by the search backend,
+    so the best matches come first and every page is still a keyset range.
+    Ranks tie often (bm25 scores of similar documents, and the constant rank
+    of ``BasicSearchBackend``), so the slug tiebreaker is part of both the
+    ``ORDER BY`` and the cursor.
+    """
+
+    ordering = "search_rank"
@@ -0,0 +1,75 @@
+"""
+Stateless password reset links.
+
+A reset link carries the user id and a token from Django's
+``PasswordResetTokenGenerator``: an HMAC, keyed with ``SECRET_KEY``, over the
+user id, password hash, last login and the time the link was issued. Nothing
+is stored when a link is issued. A token expires after
+``PASSWORD_RESET_TIMEOUT`` seconds and stops matching as soon as the password
+changes, so a link works once and concurrent reset requests never overwrite
+each other; the password change itself is a conditional UPDATE on the old
+hash, so two requests racing with the same link cannot both succeed.
+"""
+
+from django.conf import settings
+from django.contrib.auth.tokens import PasswordResetTokenGenerator
+from django.utils.encoding import force_bytes, force_str
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
+
+from userauth.models import CustomUser
+
+
+class ResetTokenGenerator(PasswordResetTokenGenerator):
+    key_salt = "api.password_reset.ResetTokenGenerator"  # Not interchangeable with admin reset tokens
+
+
+token_generator = ResetTokenGenerator()
+
+
+def make_link(user):
+    """
+    Return the frontend link that lets a user choose a new password.
+
+    :param user: The CustomUser who asked for the reset
+    :return: The absolute link
+    :rtype: str
+    """
+    uidb64 = urlsafe_base64_encode(force_bytes(user.pk))
+    token = token_generator.make_token(user)
+    return f"{settings.FRONTEND_SITE_URL}/create-new-password/?uuid={uidb64}&token={token}"
+
+
+def get_user(uidb64, token):
+    """
+    Return the user a reset link was issued to, if the token is still valid.
+
+    :param uidb64: The base64-encoded user id from the link
+    :param token: The token from the link
+    :return: The CustomUser, or None for a malformed, expired or used link
+    :rtype: CustomUser
+    """
+    if not uidb64 or not token or "-" not in token:
+        return None
+    try:
+        user_id = int(force_str(urlsafe_base64_decode(uidb64)))
+    except (TypeError, ValueError):
+        return None
+    user = CustomUser.objects.filter(pk=user_id).first()
+    if user is None or not token_generator.check_token(user, token):
+        return None
+    return user
+
+
+def reset_password(user, password):
+    """
+    Set a new password if it was not changed since the link was checked.
+
+    :param user: The CustomUser returned by ``get_user``
+    :param password: The new raw password
+    :return: True if this call changed the password
+    :rtype: bool
+    """
+    old_hash = user.password
+    user.set_password(password)
+    changed = CustomUser.objects.filter(pk=user.pk, password=old_hash).update(password=user.password)
+    return changed == 1
@@ -0,0 +1,113 @@
+"""
+Payment finalization for course orders.
+
+An order is finalized exactly once, however many times and from however many
+places the payment is reported (the success redirect, a Stripe webhook, a
+retry of either). The ``processing`` -> ``Paid`` transition is a conditional
+UPDATE, so only one caller can win it; the winner then creates the
+enrollments and notifications in the same transaction.
+"""
+
+import logging
+
+from django.db import transaction
+from django.utils import timezone
+
+from api import models as api_models
+
+logger = logging.getLogger(__name__)
+
+# Results of finalize_order
+PAID = "paid"
+ALREADY_PROCESSED = "already_processed"
+NOT_FOUND = "not_found"
+UNPAID = "unpaid"
+AMOUNT_MISMATCH = "amount_mismatch"
+
+
+def finalize_order(order, idempotency_key):
+    """
+    Mark an order as paid and enroll its student in the purchased courses.
+
+    :param order: The CartOrder that was paid
+    :param idempotency_key: Identifier of the payment (e.g. the Stripe checkout
+        session id); a key that was already recorded is not processed again
+    :return: ``PAID`` if this call finalized the order, ``ALREADY_PROCESSED`` otherwise
+    :rtype: str
+    """
+    if api_models.CartOrder.objects.filter(payment_idempotency_key=idempotency_key).exists():
+        return ALREADY_PROCESSED
+
+    with transaction.atomic():
+        won = api_models.CartOrder.objects.filter(pk=order.pk, payment_status="processing").update(
+            payment_status="Paid",
+            paid_at=timezone.now(),
+            payment_idempotency_key=idempotency_key,
+        )
+        if not won:
+            return ALREADY_PROCESSED
+
+        order_items = list(
+            api_models.CartOrderItem.objects.filter(order_id=order.pk).only("id", "course_id", "teacher_id")
+        )
+        notifications = [
+            api_models.Notification(
+                user_id=order.student_id,
+                order_id=order.pk,
+                type="Course Enrollment Completed",
+            )
+        ]
+        notifications += [
+            api_models.Notification(
+                teacher_id=item.teacher_id,
+                order_id=order.pk,
+                order_item_id=item.pk,
+                type="New Order",
+            )
+            for item in order_items
+        ]
+        api_models.Notification.objects.bulk_create(notifications)
+
+        api_models.EnrolledCourse.bulk_enroll([
+            api_models.EnrolledCourse(
+                course_id=item.course_id,
+                user_id=order.student_id,
+                teacher_id=item.teacher_id,
+                order_item_id=item.pk,
+            )
+            for item in order_items
+        ])
+        api_models.invalidate_checkout(order.order_id)
+
+    order.payment_status = "Paid"
+    order.payment_idempotency_key = idempotency_key
+    return PAID
+
+
+def finalize_checkout_session(session):
+    """
+    Finalize the order paid through a Stripe Checkout session.
+
+    The session may come from ``stripe.checkout.Session.retrieve`` or from the
+    ``data.object`` of a ``checkout.session.completed`` webhook event; only its
+    fields are read, so no request is made to Stripe.
+
+    :param session: The Stripe checkout session (a StripeObject or a dict)
+    :return: One of ``PAID``, ``ALREADY_PROCESSED``, ``NOT_FOUND``, ``UNPAID``
+        or ``AMOUNT_MISMATCH``
+    :rtype: str
+    """
+    order_id = session.get("client_reference_id") or (session.get("metadata") or {}).get("order_id")
+    order = api_models.CartOrder.objects.filter(order_id=order_id).first()
+    if order is None:
+        return NOT_FOUND
+    if session.get("payment_status") != "paid":
+        return UNPAID
+    if session.get("amount_total") is not None and session["amount_total"] != int(order.total * 100):
+        # The student was charged but is not enrolled; this needs a refund or a manual fix
+        logger.error(
+            "Paid checkout session %s for order %s charged %s cents but the order total is %s",
+            session.get("id"), order.order_id, session["amount_total"], order.total,
+        )
+        return AMOUNT_MISMATCH
+    return finalize_order(order, idempotency_key=session["id"])
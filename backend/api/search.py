@@ -0,0 +1,220 @@
+"""
+Full-text search over the course catalog.
+
+Courses are indexed on their title, description, category title and teacher
+name. Each backend narrows a Course queryset to the matching rows and
+annotates it with ``search_rank`` (lower is a better match), so the search
+view can page through ranked results with a cursor like the rest of the
+catalog.
+
+The backend is picked from ``settings.COURSE_SEARCH_BACKEND`` (a dotted path)
+or, when that is unset, from the database vendor.
+"""
+
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+
+def tokenize(query):
+    """
+    Split a search query into lower-cased word tokens.
+
+    Punctuation and search-syntax characters are dropped, so the tokens are
+    safe to embed in a backend query expression.
+
+    :param query: The raw query string from the request
+    :return: List of tokens
+    :rtype: list
+    """
+    return re.findall(r"\w+", (query or "").lower())
+
+
+class BaseSearchBackend:
+    def search(self, queryset, query):
+        """
+        Return the courses of ``queryset`` matching ``query``, best match first.
+
+        Every token must match, and the tokens are matched as prefixes so a
+        partially typed word already finds its course (type-ahead).
+
+        :param queryset: Course queryset to search in
+        :param query: The raw query string
+        :return: Queryset annotated with ``search_rank``
+        :rtype: QuerySet
+        """
+        tokens = tokenize(query)
+        if not tokens:
+            return queryset.none().annotate(search_rank=Value(0.0, output_field=FloatField()))
+        return self.filter_matches(queryset, tokens)
+
+    def filter_matches(self, queryset, tokens):
+        raise NotImplementedError
+
+    def index_courses(self, courses):
+        """Add or refresh the index entries of the given courses."""
+
+    def remove_course(self, course_id):
+        """Drop the index entry of a deleted course."""
+
+    def rebuild(self):
+        """Recreate the whole index from the course table."""
+
+
+class BasicSearchBackend(BaseSearchBackend):
+    """
+    Unindexed fallback for databases without a full-text engine.
+
+    Matches tokens with ``icontains`` across the indexed fields and does not
+    rank the results.
+    """
+
+    def filter_matches(self, queryset, tokens):
+        for token in tokens:
+            queryset = queryset.filter(
+                Q(title__icontains=token)
+                | Q(description__icontains=token)
+                | Q(category__title__icontains=token)
+                | Q(teacher__full_name__icontains=token)
+            )
+        return queryset.annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+
+class SQLiteFTS5SearchBackend(BaseSearchBackend):
+    """
+    Search backed by an SQLite FTS5 inverted index.
+
+    The index is the ``api_course_fts`` virtual table, keyed by course id. It
+    is created by migration and kept current by the Course, Teacher and
+    Category signal receivers. Results are ranked with BM25, weighting title
+    matches above category and teacher matches, and those above description
+    matches.
+    """
+
+    table = "api_course_fts"
+    weights = (10.0, 1.0, 4.0, 4.0)  # title, description, category, teacher
+
+    def create_index(self, cursor):
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.table} USING fts5("
+            "title, description, category, teacher, "
+            "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+        )
+
+    def drop_index(self, cursor):
+        cursor.execute(f"DROP TABLE IF EXISTS {self.table}")
+
+    def match_expression(self, tokens):
+        return " ".join(f'"{token}"*' for token in tokens)
+
+    def filter_matches(self, queryset, tokens):
+        match = self.match_expression(tokens)
+        weights = ", ".join(str(weight) for weight in self.weights)
+        return queryset.filter(
+            id__in=RawSQL(f"SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s", [match])
+        ).annotate(
+            search_rank=RawSQL(
+                f"SELECT bm25({self.table}, {weights}) FROM {self.table} "
+                f'WHERE {self.table} MATCH %s AND rowid = "api_course"."id"',
+                [match],
+                output_field=FloatField(),
+            )
+        )
+
+    def index_courses(self, courses):
+        rows = [
+            (
+                course.id,
+                course.title,
+                course.description or "",
+                course.category.title if course.category else "",
+                course.teacher.full_name,
+            )
+            for course in courses
+        ]
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"DELETE FROM {self.table} WHERE rowid = %s", [(row[0],) for row in rows]
+            )
+            cursor.executemany(
+                f"INSERT INTO {self.table} (rowid, title, description, category, teacher) "
+                "VALUES (%s, %s, %s, %s, %s)",
+                rows,
+            )
+
+    def remove_course(self, course_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table} WHERE rowid = %s", [course_id])
+
+    def rebuild(self, cursor=None):
+        if cursor is None:
+            with connection.cursor() as cursor:
+                return self.rebuild(cursor)
+        cursor.execute(f"DELETE FROM {self.table}")
+        cursor.execute(
+            f"INSERT INTO {self.table} (rowid, title, description, category, teacher) "
+            "SELECT course.id, course.title, COALESCE(course.description, ''), "
+            "COALESCE(category.title, ''), COALESCE(teacher.full_name, '') "
+            "FROM api_course course "
+            "LEFT JOIN api_category category ON category.id = course.category_id "
+            "LEFT JOIN api_teacher teacher ON teacher.id = course.teacher_id"
+        )
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    """
+    Search backed by PostgreSQL ``tsvector``/``tsquery``.
+
+    The vector is built in the query from the same weighted fields as the
+    SQLite index, so no index table has to be maintained. A GIN expression
+    index over the vector can be added on the database side for large
+    catalogs.
+    """
+
+    def filter_matches(self, queryset, tokens):
+        from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+
+        vector = (
+            SearchVector("title", weight="A")
+            + SearchVector("category__title", weight="B")
+            + SearchVector("teacher__full_name", weight="B")
+            + SearchVector("description", weight="D")
+        )
+        search_query = SearchQuery(
+            " & ".join(f"{token}:*" for token in tokens), search_type="raw"
+        )
+        return (
+            queryset.annotate(search_vector=vector)
+            .filter(search_vector=search_query)
+            .annotate(search_rank=-SearchRank(vector, search_query))  # Lower is better, like bm25
+        )
+
+
+VENDOR_BACKENDS = {
+    "sqlite": SQLiteFTS5SearchBackend,
+    "postgresql": PostgresSearchBackend,
+}
+
+_backend = None
+
+
+def get_search_backend():
+    """
+    Return the configured search backend instance.
+
+    :return: The search backend used for the course catalog
+    :rtype: BaseSearchBackend
+    """
+    global _backend
+    if _backend is None:
+        backend_path = getattr(settings, "COURSE_SEARCH_BACKEND", None)
+        if backend_path:
+            backend_class = import_string(backend_path)
+        else:
+            backend_class = VENDOR_BACKENDS.get(connection.vendor, BasicSearchBackend)
+        _backend = backend_class()
+    return _backend
@@ -21,6 +21,7 @@ class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
         token["full_name"] = user.full_name
         token["email"] = user.email
         token["username"] = user.username
+        token["is_staff"] = user.is_staff
 
         return token
 
@@ -116,13 +117,15 @@ class TeacherSerializer(serializers.ModelSerializer):
 
 
 class VariantItemSerializer(serializers.ModelSerializer):
+    hls_url = serializers.CharField(read_only=True)
+
     class Meta:
         model = api_models.VariantItem
         fields = "__all__"
 
 
 class VariantSerializer(serializers.ModelSerializer):
-    variant_item = VariantItemSerializer()
+    variant_items = VariantItemSerializer(many=True, read_only=True)
 
     class Meta:
         model = api_models.Variant
@@ -138,7 +141,7 @@ class QuestionAnswerMessageSerializer(serializers.ModelSerializer):
 
 
 class QuestionAnswerSerializer(serializers.ModelSerializer):
-    messages = QuestionAnswerMessageSerializer(many=True)
+    messages = QuestionAnswerMessageSerializer(many=True, source="message")
     profile = ProfileSerializer(many=False)
 
     class Meta:
@@ -217,12 +220,19 @@ class CountrySerializer(serializers.ModelSerializer):
 
 
 class EnrolledCourseSerializer(serializers.ModelSerializer):
+    """
+    One student's enrollment with their notes, progress and questions.
+
+    This is private to the student; never nest it in the public course
+    serializers.
+    """
+
     lectures = VariantItemSerializer(many=True, read_only=True)
     completedLessons = CompletedCourseSerializer(many=True, read_only=True)
-    curriculum = VariantItemSerializer(many=True, read_only=True)
+    curriculum = VariantSerializer(many=True, read_only=True)
     note = NoteSerializer(many=True, read_only=True)
     question_answer = QuestionAnswerSerializer(many=True, read_only=True)
-    review = ReviewSerializer(many=True, read_only=True)
+    review = ReviewSerializer(many=False, read_only=True)
 
     class Meta:
         model = api_models.EnrolledCourse
@@ -230,16 +240,16 @@ class EnrolledCourseSerializer(serializers.ModelSerializer):
 
 
 class CourseSerializer(serializers.ModelSerializer):
-
-    students = EnrolledCourseSerializer(
-        many=True
-    )  # array that contains all the enrolled students
+    # Served to anyone by the catalog views, so no per-student data (enrollments, notes, progress)
     curriculum = VariantItemSerializer(
         many=True
     )  # array that contains all the curriculum items
     lectures = VariantItemSerializer(
         many=True
     )  # array that contains all the lecture items
+    reviews = ReviewSerializer(
+        many=True
+    )  # array that contains all the active reviews
 
     class Meta:
         model = api_models.Course
@@ -261,8 +271,140 @@ class CourseSerializer(serializers.ModelSerializer):
             "featured",
             "course_id",
             "date",
-            "students",
+            "rating_avg",
+            "rating_count",
+            "rating_histogram",
             "curriculum",
             "lectures",
             "reviews",
         ]
+
+
+class CourseCardSerializer(serializers.ModelSerializer):
+    """
+    Slim course representation for catalog listings (``?view=card``).
+
+    Expects a queryset built with ``Course.objects.with_card_data()``.
+    """
+
+    teacher_name = serializers.CharField(source="teacher.full_name", read_only=True)
+    rating = serializers.FloatField(source="rating_avg", read_only=True)
+
+    class Meta:
+        model = api_models.Course
+        fields = [
+            "title",
+            "slug",
+            "image",
+            "price",
+            "level",
+            "teacher_name",
+            "rating",
+            "rating_count",
+        ]
+
+
+class EnrollmentProgressSerializer(serializers.ModelSerializer):
+    """
+    Progress of one enrollment for the student dashboard.
+
+    Reads only the stored progress counters, so a queryset with
+    ``select_related("course__teacher", "last_lesson")`` is rendered without
+    further queries.
+    """
+
+    course = CourseCardSerializer(read_only=True)
+    last_lesson_id = serializers.CharField(source="last_lesson.variant_item_id", default=None, read_only=True)
+    last_lesson_title = serializers.CharField(source="last_lesson.title", default=None, read_only=True)
+
+    class Meta:
+        model = api_models.EnrolledCourse
+        fields = [
+            "enrollment_id",
+            "date",
+            "course",
+            "completed_lessons_count",
+            "total_lectures",
+            "progress_percent",
+            "last_lesson_id",
+            "last_lesson_title",
+            "last_lesson_date",
+        ]
+
+
+class CartTotalsSerializer(serializers.Serializer):
+    price = serializers.DecimalField(max_digits=12, decimal_places=2)
+    tax = serializers.DecimalField(max_digits=12, decimal_places=2)
+    total = serializers.DecimalField(max_digits=12, decimal_places=2)
+
+
+class CartItemSerializer(serializers.ModelSerializer):
+    """
+    Cart item with a slim course, for the cart snapshot.
+
+    Expects a queryset with ``select_related("course__teacher")``.
+    """
+
+    course = CourseCardSerializer(read_only=True)
+
+    class Meta:
+        model = api_models.Cart
+        fields = ["id", "cart_id", "course", "price", "tax_fee", "total", "country", "date"]
+
+
+class CartSnapshotSerializer(serializers.Serializer):
+    cart_id = serializers.CharField()
+    items = CartItemSerializer(many=True)
+    totals = CartTotalsSerializer()
+
+
+class CheckoutItemSerializer(serializers.ModelSerializer):
+    course_title = serializers.CharField(source="course.title", read_only=True)
+    course_slug = serializers.CharField(source="course.slug", read_only=True)
+    course_image = serializers.FileField(source="course.image", read_only=True)
+    coupons = serializers.SlugRelatedField(slug_field="code", many=True, read_only=True)
+
+    class Meta:
+        model = api_models.CartOrderItem
+        fields = [
+            "oid",
+            "course_title",
+            "course_slug",
+            "course_image",
+            "price",
+            "tax_fee",
+            "total",
+            "initial_total",
+            "saved",
+            "applied_coupon",
+            "coupons",
+        ]
+
+
+class CheckoutSerializer(serializers.ModelSerializer):
+    """
+    Read model of an order for the payment page.
+
+    Expects an order loaded by ``api.checkout.load_order`` so the items,
+    their courses and all coupons are already fetched.
+    """
+
+    coupons = serializers.SlugRelatedField(slug_field="code", many=True, read_only=True)
+    order_items = CheckoutItemSerializer(source="prefetched_items", many=True, read_only=True)
+
+    class Meta:
+        model = api_models.CartOrder
+        fields = [
+            "order_id",
+            "full_name",
+            "email",
+            "country",
+            "payment_status",
+            "subtotal",
+            "tax_fee",
+            "total",
+            "initial_total",
+            "saved",
+            "coupons",
+            "order_items",
+        ]
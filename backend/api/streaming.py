@@ -0,0 +1,177 @@
+"""
+Serve files from ``MEDIA_ROOT`` with HTTP range and conditional request support.
+
+Video players seek by requesting byte ranges, so lecture files are answered
+with ``206 Partial Content`` for ``Range`` requests. ``ETag``/``Last-Modified``
+validators allow ``304`` replies and make ``If-Range`` safe. File bodies are
+streamed from an open file object, so WSGI servers with ``wsgi.file_wrapper``
+(gunicorn) hand them to ``sendfile`` without copying through Python.
+
+When ``settings.MEDIA_SENDFILE_MODE`` is ``"x-accel-redirect"`` (nginx) or
+``"x-sendfile"`` (Apache, lighttpd), Django only checks access and the
+fronting proxy sends the bytes.
+"""
+
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.http import http_date, parse_http_date_safe
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+# HLS playlists and segments; ".ts" is otherwise guessed as a Qt translation file
+mimetypes.add_type("application/vnd.apple.mpegurl", ".m3u8")
+mimetypes.add_type("video/mp2t", ".ts")
+
+
+class RangeFile:
+    """
+    File wrapper that reads at most ``length`` bytes from its current position.
+
+    It exposes ``fileno()`` so ``sendfile`` can be used on the underlying
+    descriptor, and it deliberately has no ``name`` or ``seekable()`` so
+    ``FileResponse`` does not compute a Content-Length for the whole file.
+    """
+
+    def __init__(self, file, start, length):
+        self._file = file
+        self._file.seek(start)
+        self._remaining = length
+
+    def read(self, size=-1):
+        if self._remaining <= 0:
+            return b""
+        if size < 0 or size > self._remaining:
+            size = self._remaining
+        data = self._file.read(size)
+        self._remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self._file.fileno()
+
+    def close(self):
+        self._file.close()
+
+
+def parse_range(header, size):
+    """
+    Parse a single-range ``Range`` header.
+
+    :param header: The ``Range`` header value
+    :param size: Size of the file in bytes
+    :return: ``(start, end)`` inclusive, None to serve the whole file, or
+        ``"unsatisfiable"`` when the range lies outside the file
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        return None  # Multiple or malformed ranges: answer with the full file
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:  # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            return "unsatisfiable"
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return "unsatisfiable"
+    return start, end
+
+
+def file_etag(stat):
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+def is_not_modified(request, etag, last_modified):
+    if_none_match = request.headers.get("If-None-Match")
+    if if_none_match is not None:
+        return etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*"
+    modified_since = parse_http_date_safe(request.headers.get("If-Modified-Since", ""))
+    return modified_since is not None and int(last_modified) <= modified_since
+
+
+def if_range_matches(request, etag, last_modified):
+    if_range = request.headers.get("If-Range")
+    if if_range is None:
+        return True
+    if if_range.startswith('"') or if_range.startswith("W/"):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == int(last_modified)
+
+
+def serve_file(request, name, cache_control="public, max-age=86400"):
+    """
+    Return a response for a file stored under ``MEDIA_ROOT``.
+
+    :param request: The incoming request
+    :param name: Path of the file relative to ``MEDIA_ROOT`` (a FileField name)
+    :param cache_control: Value of the ``Cache-Control`` header
+    :return: A 200, 206, 304 or 416 response
+    :rtype: HttpResponse
+    :raises Http404: If the file does not exist
+    """
+    try:
+        path = safe_join(settings.MEDIA_ROOT, name)
+    except SuspiciousFileOperation:  # Path escapes MEDIA_ROOT
+        raise Http404("File not found")
+    if not os.path.isfile(path):
+        raise Http404("File not found")
+
+    content_type, encoding = mimetypes.guess_type(path)
+    content_type = content_type or "application/octet-stream"
+    mode = settings.MEDIA_SENDFILE_MODE
+
+    if mode == "x-accel-redirect":
+        response = HttpResponse(content_type=content_type)
+        # nginx decodes the URI, so spaces, '%', '?' and non-ASCII names must be quoted
+        response["X-Accel-Redirect"] = settings.MEDIA_ACCEL_REDIRECT_PREFIX + quote(name)
+        response["Cache-Control"] = cache_control
+        return response
+    if mode == "x-sendfile":
+        response = HttpResponse(content_type=content_type)
+        response["X-Sendfile"] = path
+        response["Cache-Control"] = cache_control
+        return response
+
+    stat = os.stat(path)
+    etag = file_etag(stat)
+    last_modified = stat.st_mtime
+
+    if is_not_modified(request, etag, last_modified):
+        response = HttpResponseNotModified()
+    else:
+        byte_range = None
+        range_header = request.headers.get("Range")
+        if range_header and if_range_matches(request, etag, last_modified):
+            byte_range = parse_range(range_header, stat.st_size)
+
+        if byte_range == "unsatisfiable":
+            response = HttpResponse(status=416)
+            response["Content-Range"] = f"bytes */{stat.st_size}"
+        elif byte_range is None:
+            response = FileResponse(open(path, "rb"), content_type=content_type)
+        else:
+            start, end = byte_range
+            length = end - start + 1
+            response = FileResponse(
+                RangeFile(open(path, "rb"), start, length), status=206, content_type=content_type
+            )
+            response["Content-Length"] = str(length)
+            response["Content-Range"] = f"bytes {start}-{end}/{stat.st_size}"
+        if encoding:
+            response["Content-Encoding"] = encoding
+
+    response["Accept-Ranges"] = "bytes"
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified)
+    response["Cache-Control"] = cache_control
+    return response
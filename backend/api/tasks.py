@@ -0,0 +1,212 @@
+"""
+Background tasks run by the job queue in ``api.jobs``.
+"""
+
+import os
+import secrets
+import shutil
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from api import media
+from api import models as api_models
+from api import mail, payments, transcode
+from api.jobs import enqueue, periodic, task
+
+
+@task
+def probe_variant_item(variant_item_id):
+    """
+    Read the duration of an uploaded lecture and store it on the item.
+
+    The item moves from ``pending`` to ``processing`` and then ``ready``, or to
+    ``failed`` if the file cannot be read (the job is then retried). Nothing is
+    recorded if the file was replaced meanwhile; the new upload has its own
+    probe job.
+
+    :param variant_item_id: Primary key of the VariantItem to probe
+    :return: None
+    """
+    items = api_models.VariantItem.objects.filter(pk=variant_item_id)
+    item = items.first()
+    if item is None or not item.file:
+        return
+
+    items = items.filter(file=item.file.name)  # Only while the probed file is current
+    items.update(processing_status="processing")
+    try:
+        duration_seconds = media.probe_file_duration(item.file)
+    except Exception:
+        items.update(processing_status="failed")
+        raise
+
+    fields = {
+        "duration": timedelta(seconds=duration_seconds),
+        "content_duration": media.format_duration(duration_seconds),
+        "processing_status": "ready",
+    }
+    if settings.HLS_TRANSCODE_ENABLED:
+        fields["hls_status"] = "pending"
+    if items.update(**fields) and settings.HLS_TRANSCODE_ENABLED:
+        enqueue("transcode_variant_item", variant_item_id=variant_item_id)
+
+
+@task
+def transcode_variant_item(variant_item_id):
+    """
+    Encode an uploaded lecture into HLS renditions.
+
+    The output goes to a new version directory under the lecture's HLS
+    directory, so playlists and segments already cached by players are never
+    overwritten. The result is only recorded if the file was not replaced while
+    encoding; earlier versions are then deleted.
+
+    :param variant_item_id: Primary key of the VariantItem to transcode
+    :return: None
+    """
+    items = api_models.VariantItem.objects.filter(pk=variant_item_id)
+    item = items.first()
+    if item is None or not item.file:
+        return
+
+    version = secrets.token_hex(4)
+    item_dir = os.path.join(settings.MEDIA_ROOT, item.hls_path())
+    output_dir = os.path.join(item_dir, version)
+    try:
+        source = item.file.path
+    except NotImplementedError:  # Remote storage: ffmpeg reads the URL
+        source = item.file.url
+
+    items.update(hls_status="processing")
+    try:
+        renditions = transcode.transcode_to_hls(source, output_dir)
+    except Exception:
+        shutil.rmtree(output_dir, ignore_errors=True)
+        items.filter(file=item.file.name).update(hls_status="failed")
+        raise
+
+    updated = items.filter(file=item.file.name).update(
+        hls_status="ready",
+        hls_playlist=f"{version}/{transcode.MASTER_PLAYLIST}",
+        hls_renditions=renditions,
+    )
+    if updated:
+        transcode.remove_old_versions(item_dir, keep=version)
+    else:  # The lecture was re-uploaded meanwhile; its own job transcodes the new file
+        shutil.rmtree(output_dir, ignore_errors=True)
+
+
+# Stripe events that mean a checkout session has been paid
+CHECKOUT_PAID_EVENTS = {"checkout.session.completed", "checkout.session.async_payment_succeeded"}
+
+
+@task
+def process_stripe_event(event_id):
+    """
+    Apply a stored Stripe webhook event.
+
+    Paid checkout sessions are handed to the payment finalization service,
+    which is idempotent, so a retried or redelivered event never enrolls a
+    student twice. Other event types are marked ``ignored``.
+
+    :param event_id: The Stripe id of the StripeEvent to process
+    :return: None
+    """
+    event = api_models.StripeEvent.objects.filter(event_id=event_id).first()
+    if event is None or event.status != "received":
+        return
+
+    if event.type in CHECKOUT_PAID_EVENTS:
+        result = payments.finalize_checkout_session(event.payload["data"]["object"])
+        event_status = "processed"
+    else:
+        result = None
+        event_status = "ignored"
+
+    api_models.StripeEvent.objects.filter(pk=event.pk).update(
+        status=event_status, result=result, processed_at=timezone.now()
+    )
+
+
+def delete_in_batches(queryset, batch_size):
+    """
+    Delete the rows of a queryset in chunks of primary keys.
+
+    Each chunk is deleted in its own short transaction, so a large purge never
+    holds a long lock on the table. The delete keeps the queryset's filter, so
+    a row that stopped matching after its id was read (a guest cart touched
+    again, say) is left alone.
+
+    :param queryset: The rows to delete
+    :param batch_size: Rows deleted per chunk
+    :return: Number of rows of the queryset's model deleted, without cascades
+    :rtype: int
+    """
+    deleted = 0
+    while True:
+        ids = list(queryset.order_by("pk").values_list("pk", flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        _, per_model = queryset.filter(pk__in=ids).delete()
+        deleted += per_model.get(queryset.model._meta.label, 0)
+
+
+@periodic(seconds=settings.CART_PURGE_INTERVAL)
+def purge_stale_carts(batch_size=None):
+    """
+    Delete guest cart rows that were not touched for ``CART_GUEST_TTL_DAYS``.
+
+    :param batch_size: Rows deleted per chunk; ``CART_PURGE_BATCH_SIZE`` by default
+    :return: Number of rows deleted
+    :rtype: int
+    """
+    batch_size = batch_size or settings.CART_PURGE_BATCH_SIZE
+    cutoff = timezone.now() - timedelta(days=settings.CART_GUEST_TTL_DAYS)
+    return delete_in_batches(api_models.Cart.objects.stale_guest_carts(cutoff), batch_size)
+
+
+@periodic(seconds=settings.JOB_PURGE_INTERVAL)
+def purge_finished_jobs(batch_size=None):
+    """
+    Delete jobs that finished successfully more than ``JOB_RETENTION_DAYS`` ago.
+
+    Failed jobs are kept for inspection.
+
+    :param batch_size: Rows deleted per chunk; ``JOB_PURGE_BATCH_SIZE`` by default
+    :return: Number of rows deleted
+    :rtype: int
+    """
+    cutoff = timezone.now() - timedelta(days=settings.JOB_RETENTION_DAYS)
+    done = api_models.Job.objects.filter(status="done", finished_at__lt=cutoff)
+    return delete_in_batches(done, batch_size or settings.JOB_PURGE_BATCH_SIZE)
+
+
+@periodic(seconds=settings.EMAIL_OUTBOX_INTERVAL)
+def send_queued_emails(batch_size=None):
+    """
+    Deliver the next batch of queued emails (see ``api.mail``).
+
+    :param batch_size: Messages per batch; ``EMAIL_BATCH_SIZE`` by default
+    :return: The number of messages sent and the number that failed
+    :rtype: tuple
+    """
+    return mail.send_queued(batch_size=batch_size)
+
+
+@periodic(seconds=settings.JOB_PURGE_INTERVAL)
+def purge_sent_emails(batch_size=None):
+    """
+    Delete outbox emails sent more than ``EMAIL_RETENTION_DAYS`` ago.
+
+    Sent messages contain password reset links, so they are not kept longer
+    than needed to look into delivery problems.
+
+    :param batch_size: Rows deleted per chunk; ``JOB_PURGE_BATCH_SIZE`` by default
+    :return: Number of rows deleted
+    :rtype: int
+    """
+    cutoff = timezone.now() - timedelta(days=settings.EMAIL_RETENTION_DAYS)
+    sent = api_models.OutboxEmail.objects.filter(status="sent", sent_at__lt=cutoff)
+    return delete_in_batches(sent, batch_size or settings.JOB_PURGE_BATCH_SIZE)
@@ -0,0 +1,84 @@
+"""
+Country tax rates for cart and order pricing.
+
+Tax rates change rarely, so each worker process keeps the whole Country table
+in memory and computes taxes without database I/O. A version token in the
+cache backend tells the processes when to reload: the Country signal
+receivers replace it whenever an admin edits a country, and every worker
+picks up the edit on its next lookup. This needs a cache shared by all
+workers, so the table is only kept when ``settings.TAX_TABLE_CACHE`` is set
+(the default with ``CACHE_URL``); otherwise it is read on every lookup.
+"""
+
+import logging
+import uuid
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = "country-tax-table:version"
+DEFAULT_COUNTRY = "United States"  # Used, untaxed, when the buyer's country is unknown
+
+_table = {}
+_loaded_version = None
+
+
+def bump_version():
+    """Invalidate the tax tables of all worker processes."""
+    cache.set(VERSION_KEY, uuid.uuid4().hex, None)
+
+
+def get_table():
+    """
+    Return the ``{country name: tax rate}`` table, reloading it if it is stale.
+
+    :return: Tax rates in percent by country name
+    :rtype: dict
+    """
+    global _table, _loaded_version
+    Country = apps.get_model("api", "Country")
+    if not settings.TAX_TABLE_CACHE:
+        return dict(Country.objects.values_list("name", "tax_rate"))
+
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        version = uuid.uuid4().hex
+        if not cache.add(VERSION_KEY, version, None):  # Another process set it first
+            version = cache.get(VERSION_KEY)
+    if version != _loaded_version:
+        _table = dict(Country.objects.values_list("name", "tax_rate"))
+        _loaded_version = version
+    return _table
+
+
+def resolve(country):
+    """
+    Return the country to bill and its tax rate.
+
+    :param country: Country name sent by the client
+    :return: The country name and its tax rate in percent; unknown countries
+        fall back to ``DEFAULT_COUNTRY`` without tax
+    :rtype: tuple
+    """
+    tax_rate = get_table().get(country)
+    if tax_rate is None:
+        # Debug only: clients send placeholders such as "undefined" on every cart request
+        logger.debug("Unknown country %r, billing %s without tax", country, DEFAULT_COUNTRY)
+        return DEFAULT_COUNTRY, 0
+    return country, tax_rate
+
+
+def tax_fee(price, tax_rate):
+    """
+    Return the tax charged on a price, rounded to the cent.
+
+    :param price: Price of the item
+    :param tax_rate: Tax rate of the buyer's country in percent
+    :return: The tax amount
+    :rtype: Decimal
+    """
+    return (Decimal(price) * Decimal(tax_rate) / 100).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
@@ -1,3 +1,1821 @@
-from django.test import TestCase
+import base64
+import io
+import os
+import shutil
+import struct
+import subprocess
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core import mail as django_mail
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.http import Http404
+from django.db import IntegrityError, connection, connections
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+from rest_framework.test import APIClient
+
+from api import models as api_models
+from api import authentication, coupons, db, email_templates, jobs, mail, media, password_reset, payments, search, streaming, stripe_fakes, tasks, tax, transcode
+from api.serializer import MyTokenObtainPairSerializer
+from api.views import LectureMediaAPIView
+from userauth.models import CustomUser
+
+
+def create_user(username):
+    return CustomUser.objects.create(
+        username=username,
+        email=f"{username}@example.com",
+        full_name=username.title(),
+    )
+
+
+def create_course(teacher, title, category=None):
+    """
+    Create a published course with a small curriculum, one enrolled student
+    and the per-student data the course serializer walks.
+    """
+    course = api_models.Course.objects.create(
+        teacher=teacher,
+        category=category,
+        title=title,
+        price="10.00",
+    )
+    variant = api_models.Variant.objects.create(course=course, title=f"{title} section")
+    item = api_models.VariantItem.objects.create(variant=variant, title=f"{title} lecture")
+
+    student = create_user(f"student-{course.slug}")
+    api_models.EnrolledCourse.objects.create(course=course, user=student, teacher=teacher)
+    api_models.CompletedCourse.objects.create(course=course, user=student, variant_item=item)
+    api_models.Note.objects.create(course=course, user=student, title="note", note="note")
+    api_models.Review.objects.create(course=course, user=student, review="good", rating=5)
+    question = api_models.Question_Answer.objects.create(course=course, user=student, title="why?")
+    api_models.Question_Answer_Message.objects.create(
+        question=question, course=course, user=teacher.user, message="because"
+    )
+    return course
+
+
+# One query for the courses plus one per prefetch in Course.objects.with_related()
+COURSE_QUERY_BUDGET = 4
+
+
+class CourseQueryBudgetTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        teacher_user = create_user("teacher")
+        self.teacher = api_models.Teacher.objects.create(user=teacher_user, full_name="Teacher")
+        self.category = api_models.Category.objects.create(title="Programming")
+
+    def count_list_queries(self):
+        with self.assertNumQueries(COURSE_QUERY_BUDGET) as context:
+            response = self.client.get(reverse("course_list"))
+        self.assertEqual(response.status_code, 200)
+        return response, len(context.captured_queries)
+
+    def test_course_list_query_count_is_constant(self):
+        create_course(self.teacher, "Python", self.category)
+        _, queries_for_one = self.count_list_queries()
+
+        for title in ["Django", "React", "Rust"]:
+            create_course(self.teacher, title, self.category)
+        response, queries_for_four = self.count_list_queries()
+
+        self.assertEqual(queries_for_one, queries_for_four)
+        self.assertEqual(len(response.data["results"]), 4)
+
+    def test_course_list_serializes_curriculum_and_reviews(self):
+        create_course(self.teacher, "Python", self.category)
+
+        response = self.client.get(reverse("course_list"))
+
+        course = response.data["results"][0]
+        self.assertEqual(course["lectures"][0]["title"], "Python lecture")
+        self.assertEqual(course["reviews"][0]["review"], "good")
+
+    def test_catalog_does_not_expose_student_data(self):
+        course = create_course(self.teacher, "Python", self.category)
+
+        for response in (
+            self.client.get(reverse("course_list")).data["results"][0],
+            self.client.get(reverse("course_detail", args=[course.slug])).data,
+        ):
+            self.assertNotIn("students", response)
+            self.assertNotIn("completedLessons", str(response))
+
+    def test_course_detail_query_count(self):
+        course = create_course(self.teacher, "Python", self.category)
+
+        with self.assertNumQueries(COURSE_QUERY_BUDGET):
+            response = self.client.get(reverse("course_detail", args=[course.slug]))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["title"], "Python")
+
+
+class CoursePaginationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        teacher_user = create_user("teacher")
+        self.teacher = api_models.Teacher.objects.create(user=teacher_user, full_name="Teacher")
+        for title in ["Django", "Python", "React", "Rust", "Vue"]:
+            api_models.Course.objects.create(teacher=self.teacher, title=title)
+
+    def test_cursor_pages_walk_the_whole_catalog_in_slug_order(self):
+        url = reverse("course_list") + "?page_size=2"
+        titles = []
+        while url:
+            response = self.client.get(url)
+            self.assertLessEqual(len(response.data["results"]), 2)
+            titles += [course["title"] for course in response.data["results"]]
+            url = response.data["next"]
+
+        self.assertEqual(titles, ["Django", "Python", "React", "Rust", "Vue"])
+
+    def test_cursor_pages_walk_tied_ratings_once(self):
+        api_models.Course.objects.update(rating_avg=Decimal("4.50"), rating_count=2)
+        api_models.Course.objects.filter(title="Rust").update(rating_avg=Decimal("5.00"))
+        for ordering in ["-rating_avg", "rating_count"]:
+            url = reverse("course_list") + f"?page_size=2&ordering={ordering}"
+            titles = []
+            while url:
+                response = self.client.get(url)
+                titles += [course["title"] for course in response.data["results"]]
+                url = response.data["next"]
+            self.assertEqual(sorted(titles), ["Django", "Python", "React", "Rust", "Vue"])
+
+        self.assertEqual(titles, ["Django", "Python", "React", "Rust", "Vue"])
+
+    def test_previous_link_walks_back_through_ties(self):
+        api_models.Course.objects.update(rating_avg=Decimal("4.50"))
+        url = reverse("course_list") + "?page_size=2&ordering=-rating_avg"
+        pages = []
+        while url:
+            response = self.client.get(url)
+            pages.append([course["title"] for course in response.data["results"]])
+            url = response.data["next"]
+
+        url = response.data["previous"]
+        while url:
+            response = self.client.get(url)
+            pages.pop()
+            self.assertEqual([course["title"] for course in response.data["results"]], pages[-1])
+            url = response.data["previous"]
+        self.assertEqual(len(pages), 1)
+
+    def test_malformed_cursor_is_not_found(self):
+        cursor = base64.b64encode(b"p=%5B%22high%22%2C%22django%22%5D").decode()
+        response = self.client.get(reverse("course_list") + f"?ordering=-rating_avg&cursor={cursor}")
+
+        self.assertEqual(response.status_code, 404)
+
+    def test_page_size_is_capped(self):
+        with self.settings(COURSE_MAX_PAGE_SIZE=3):
+            response = self.client.get(reverse("course_list") + "?page_size=1000")
+
+        self.assertEqual(len(response.data["results"]), 3)
+
+
+class CourseCardViewTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        teacher_user = create_user("teacher")
+        self.teacher = api_models.Teacher.objects.create(user=teacher_user, full_name="Jane Doe")
+
+    def test_card_view_returns_slim_payload_in_one_query(self):
+        for title in ["Django", "Python", "React"]:
+            create_course(self.teacher, title)
+        course = api_models.Course.objects.get(title="Python")
+        reviewer = create_user("reviewer")
+        api_models.Review.objects.create(course=course, user=reviewer, review="ok", rating=2)
+        api_models.Review.objects.create(
+            course=course, user=reviewer, review="hidden", rating=1, active=False
+        )
+
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse("course_list") + "?view=card")
+
+        cards = {card["title"]: card for card in response.data["results"]}
+        self.assertEqual(
+            set(cards["Python"]),
+            {"title", "slug", "image", "price", "level", "teacher_name", "rating", "rating_count"},
+        )
+        self.assertEqual(cards["Python"]["teacher_name"], "Jane Doe")
+        self.assertEqual(cards["Python"]["rating"], 3.5)
+        self.assertEqual(cards["Python"]["rating_count"], 2)
+
+
+class CourseRatingStatsTests(TestCase):
+    def setUp(self):
+        teacher_user = create_user("teacher")
+        self.teacher = api_models.Teacher.objects.create(user=teacher_user, full_name="Teacher")
+        self.course = api_models.Course.objects.create(teacher=self.teacher, title="Python")
+        self.reviewer = create_user("reviewer")
+
+    def test_review_hooks_keep_course_stats_current(self):
+        first = api_models.Review.objects.create(
+            course=self.course, user=self.reviewer, review="great", rating=5
+        )
+        api_models.Review.objects.create(
+            course=self.course, user=self.reviewer, review="meh", rating=2
+        )
+        self.course.refresh_from_db()
+        self.assertEqual(str(self.course.rating_avg), "3.50")
+        self.assertEqual(self.course.rating_count, 2)
+        self.assertEqual(self.course.rating_histogram["5"], 1)
+        self.assertEqual(self.course.rating_histogram["2"], 1)
+
+        first.active = False
+        first.save()
+        self.course.refresh_from_db()
+        self.assertEqual(str(self.course.rating_avg), "2.00")
+        self.assertEqual(self.course.rating_count, 1)
+
+        api_models.Review.objects.filter(course=self.course, active=True).first().delete()
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.rating_count, 0)
+        self.assertEqual(str(self.course.rating_avg), "0.00")
+
+    def test_rebuild_command_recomputes_bulk_updated_reviews(self):
+        api_models.Review.objects.create(
+            course=self.course, user=self.reviewer, review="great", rating=5
+        )
+        api_models.Review.objects.filter(course=self.course).update(rating=1)  # bypasses signals
+
+        call_command("rebuild_course_ratings", stdout=StringIO())
+
+        self.course.refresh_from_db()
+        self.assertEqual(str(self.course.rating_avg), "1.00")
+        self.assertEqual(self.course.rating_histogram, {"1": 1, "2": 0, "3": 0, "4": 0, "5": 0})
+
+    def test_course_list_sorts_by_stored_rating(self):
+        other = api_models.Course.objects.create(teacher=self.teacher, title="Django")
+        api_models.Review.objects.create(course=other, user=self.reviewer, review="ok", rating=4)
+
+        response = APIClient().get(reverse("course_list") + "?view=card&ordering=-rating_avg")
+
+        self.assertEqual(
+            [card["title"] for card in response.data["results"]], ["Django", "Python"]
+        )
+
+
+class CourseSearchTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        teacher_user = create_user("teacher")
+        self.teacher = api_models.Teacher.objects.create(user=teacher_user, full_name="Ada Lovelace")
+        self.category = api_models.Category.objects.create(title="Data Science")
+
+    def search(self, query):
+        response = self.client.get(reverse("search"), {"query": query, "view": "card"})
+        self.assertEqual(response.status_code, 200)
+        return [card["title"] for card in response.data["results"]]
+
+    def test_search_covers_description_category_and_teacher(self):
+        api_models.Course.objects.create(
+            teacher=self.teacher, title="Intro", description="Learn pandas from scratch"
+        )
+        api_models.Course.objects.create(teacher=self.teacher, title="Stats", category=self.category)
+
+        self.assertEqual(self.search("pandas"), ["Intro"])
+        self.assertEqual(self.search("data science"), ["Stats"])
+        self.assertEqual(sorted(self.search("lovelace")), ["Intro", "Stats"])
+
+    def test_prefix_match_and_title_ranked_first(self):
+        api_models.Course.objects.create(
+            teacher=self.teacher, title="Web Apps", description="Uses python on the server"
+        )
+        api_models.Course.objects.create(teacher=self.teacher, title="Python Basics")
+
+        self.assertEqual(self.search("pyth"), ["Python Basics", "Web Apps"])
+
+    def test_missing_query_and_unpublished_courses_return_nothing(self):
+        api_models.Course.objects.create(
+            teacher=self.teacher, title="Hidden Python", platform_status="Draft"
+        )
+
+        self.assertEqual(self.client.get(reverse("search")).data["results"], [])
+        self.assertEqual(self.search("python"), [])
+
+    def test_index_follows_course_and_teacher_updates(self):
+        course = api_models.Course.objects.create(teacher=self.teacher, title="Rust")
+        course.title = "Go"
+        course.save()
+        self.assertEqual(self.search("rust"), [])
+        self.assertEqual(self.search("go"), ["Go"])
+
+        self.teacher.full_name = "Grace Hopper"
+        self.teacher.save()
+        self.assertEqual(self.search("hopper"), ["Go"])
+
+        course.delete()
+        self.assertEqual(self.search("go"), [])
+
+    def test_search_pages_follow_rank(self):
+        for index in range(5):
+            api_models.Course.objects.create(teacher=self.teacher, title=f"Python {index}")
+
+        url = reverse("search") + "?query=python&view=card&page_size=2"
+        titles = []
+        while url:
+            response = self.client.get(url)
+            titles += [card["title"] for card in response.data["results"]]
+            url = response.data["next"]
+
+        self.assertEqual(sorted(titles), [f"Python {index}" for index in range(5)])
+
+    def test_tied_ranks_are_paged_by_slug(self):
+        for index in [3, 0, 4, 1, 2]:
+            api_models.Course.objects.create(teacher=self.teacher, title=f"Python {index}")
+
+        for backend in [search.SQLiteFTS5SearchBackend(), search.BasicSearchBackend()]:
+            with mock.patch.object(search, "_backend", backend):
+                url = reverse("search") + "?query=python&view=card&page_size=2"
+                titles = []
+                while url:
+                    response = self.client.get(url)
+                    titles += [card["title"] for card in response.data["results"]]
+                    url = response.data["next"]
+                previous = self.client.get(response.data["previous"]).data["results"]
+
+            self.assertEqual(titles, [f"Python {index}" for index in range(5)])
+            self.assertEqual([card["title"] for card in previous], ["Python 2", "Python 3"])
+
+
+class VariantItemProbeTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        teacher_user = create_user("teacher")
+        teacher = api_models.Teacher.objects.create(user=teacher_user, full_name="Teacher")
+        course = api_models.Course.objects.create(teacher=teacher, title="Python")
+        self.variant = api_models.Variant.objects.create(course=course, title="Intro")
+
+    def upload(self, name="lecture.mp4"):
+        return SimpleUploadedFile(name, b"not really a video", content_type="video/mp4")
+
+    def test_upload_is_probed_in_the_background(self):
+        item = api_models.VariantItem.objects.create(
+            variant=self.variant, title="Lecture", file=self.upload()
+        )
+        item.refresh_from_db()
+        self.assertEqual(item.processing_status, "pending")
+        self.assertIsNone(item.content_duration)
+
+        with mock.patch("api.media.probe_file_duration", return_value=100.4) as probe:
+            self.assertEqual(jobs.run_pending_jobs(), 1)
+
+        self.assertEqual(probe.call_args.args[0].name, item.file.name)
+        item.refresh_from_db()
+        self.assertEqual(item.processing_status, "ready")
+        self.assertEqual(item.content_duration, "01m:40s")
+        self.assertEqual(item.duration, timedelta(seconds=100.4))
+
+    @override_settings(HLS_TRANSCODE_ENABLED=True)
+    def test_probe_of_a_replaced_file_is_discarded(self):
+        item = api_models.VariantItem.objects.create(
+            variant=self.variant, title="Lecture", file=self.upload()
+        )
+
+        def replace_file(file):
+            api_models.VariantItem.objects.filter(pk=item.pk).update(
+                file="course-file/other.mp4", processing_status="pending"
+            )
+            return 100.0
+
+        with mock.patch("api.media.probe_file_duration", side_effect=replace_file):
+            jobs.run_pending_jobs()
+
+        item.refresh_from_db()
+        self.assertEqual(item.processing_status, "pending")
+        self.assertIsNone(item.duration)
+        self.assertFalse(api_models.Job.objects.filter(name="transcode_variant_item").exists())
+
+    def test_only_file_changes_queue_a_probe(self):
+        item = api_models.VariantItem.objects.create(
+            variant=self.variant, title="Lecture", file=self.upload()
+        )
+        item = api_models.VariantItem.objects.get(pk=item.pk)
+        item.title = "Renamed"
+        item.save()
+        self.assertEqual(api_models.Job.objects.count(), 1)
+
+        item.file = self.upload("other.mp4")
+        item.save()
+        self.assertEqual(api_models.Job.objects.count(), 2)
+
+    def test_failed_probe_is_retried_then_marked_failed(self):
+        item = api_models.VariantItem.objects.create(
+            variant=self.variant, title="Lecture", file=self.upload()
+        )
+        job = api_models.Job.objects.get()
+
+        api_models.Job.objects.filter(pk=job.pk).update(max_attempts=2)
+        with mock.patch("api.media.probe_file_duration", side_effect=OSError("unreadable")):
+            with self.assertLogs("api.jobs", level="ERROR"):
+                jobs.run_pending_jobs()
+            job.refresh_from_db()
+            self.assertEqual(job.status, "pending")
+            self.assertGreater(job.run_at, job.started_at)
+
+            api_models.Job.objects.filter(pk=job.pk).update(run_at=job.started_at)
+            with self.assertLogs("api.jobs", level="ERROR"):
+                jobs.run_pending_jobs()
+
+        job.refresh_from_db()
+        item.refresh_from_db()
+        self.assertEqual(job.status, "failed")
+        self.assertEqual(job.attempts, 2)
+        self.assertIn("unreadable", job.last_error)
+        self.assertEqual(item.processing_status, "failed")
+
+
+class JobWorkerTests(TestCase):
+    def setUp(self):
+        self.transcode = jobs.enqueue("transcode_variant_item", variant_item_id=0)
+        self.webhook = jobs.enqueue("process_stripe_event", event_id="evt_missing")
+
+    def status(self, job):
+        job.refresh_from_db()
+        return job.status
+
+    def test_workers_can_be_split_by_task(self):
+        call_command("run_jobs", once=True, names=["transcode_variant_item"], stdout=StringIO())
+        self.assertEqual(self.status(self.transcode), "done")
+        self.assertEqual(self.status(self.webhook), "pending")
+
+        jobs.enqueue("transcode_variant_item", variant_item_id=0)
+        call_command("run_jobs", once=True, exclude=["transcode_variant_item"], stdout=StringIO())
+        self.assertEqual(self.status(self.webhook), "done")
+        self.assertTrue(api_models.Job.objects.filter(name="transcode_variant_item", status="pending").exists())
+
+    def test_unknown_task_names_are_rejected(self):
+        with self.assertRaises(CommandError):
+            call_command("run_jobs", once=True, names=["transcode"], stdout=StringIO())
+
+    @override_settings(JOB_LOCK_TIMEOUT=300, JOB_LOCK_TIMEOUTS={"transcode_variant_item": 3600})
+    def test_abandoned_jobs_are_reclaimed_after_their_own_lock_timeout(self):
+        started = timezone.now() - timedelta(minutes=10)
+        api_models.Job.objects.update(status="running", started_at=started)
+
+        self.assertEqual(jobs.run_pending_jobs(), 1)
+        self.assertEqual(self.status(self.webhook), "done")
+        self.assertEqual(self.status(self.transcode), "running")  # Its worker may still be encoding
+        self.assertEqual(jobs.run_pending_jobs(names=["transcode_variant_item"]), 0)
+
+
+def mp4_box(box_type, body):
+    return (8 + len(body)).to_bytes(4, "big") + box_type + body
+
+
+def mvhd(timescale, duration, version=0):
+    if version == 1:
+        times = bytes(16) + timescale.to_bytes(4, "big") + duration.to_bytes(8, "big")
+    else:
+        times = bytes(8) + timescale.to_bytes(4, "big") + duration.to_bytes(4, "big")
+    return mp4_box(b"mvhd", bytes([version, 0, 0, 0]) + times + bytes(80))
+
+
+def ebml_element(element_id, body):
+    return element_id + bytes([0x80 | len(body)]) + body
+
+
+def webm_header(duration_ms):
+    info = ebml_element(b"\x2a\xd7\xb1", (1_000_000).to_bytes(3, "big")) + ebml_element(
+        b"\x44\x89", struct.pack(">d", duration_ms)
+    )
+    segment = ebml_element(b"\x15\x49\xa9\x66", info)
+    # Segment of unknown size, as written by live muxers
+    return (
+        ebml_element(b"\x1a\x45\xdf\xa3", b"\x42\x82\x84webm")
+        + b"\x18\x53\x80\x67\x01\xff\xff\xff\xff\xff\xff\xff"
+        + segment
+    )
+
+
+class MediaHeaderTests(TestCase):
+    def write(self, data):
+        handle = tempfile.NamedTemporaryFile(delete=False)
+        handle.write(data)
+        handle.close()
+        self.addCleanup(os.remove, handle.name)
+        return handle.name
+
+    def test_mp4_duration_skips_mdat(self):
+        path = self.write(
+            mp4_box(b"ftyp", b"isom" + bytes(4))
+            + mp4_box(b"mdat", bytes(200_000))
+            + mp4_box(b"moov", mvhd(1000, 2500))
+        )
+        self.assertEqual(media.probe_duration(path), 2.5)
+
+    def test_mov_with_64_bit_mvhd(self):
+        path = self.write(mp4_box(b"wide", b"") + mp4_box(b"moov", mvhd(600, 600 * 90, version=1)))
+        self.assertEqual(media.probe_duration(path), 90.0)
+
+    def test_webm_duration(self):
+        self.assertEqual(media.probe_duration(self.write(webm_header(2500.0))), 2.5)
+
+    def test_unknown_format_falls_back_to_ffprobe(self):
+        path = self.write(b"RIFF" + bytes(100))
+        with mock.patch("api.media.ffprobe_duration", return_value=7.0) as ffprobe:
+            self.assertEqual(media.probe_duration(path), 7.0)
+        ffprobe.assert_called_once_with(path)
+
+    def test_remote_files_are_read_with_small_ranges(self):
+        data = (
+            mp4_box(b"ftyp", b"isom" + bytes(4))
+            + mp4_box(b"mdat", bytes(1_000_000))
+            + mp4_box(b"moov", mvhd(1000, 4000))
+        )
+        requested = []
+        responses = []
+
+        def get(url, headers, timeout, stream):
+            start, end = map(int, headers["Range"][len("bytes="):].split("-"))
+            requested.append(end - start + 1)
+            body = io.BytesIO(data[start:end + 1])
+            responses.append(mock.Mock(
+                status_code=206,
+                raw=mock.Mock(read=lambda amt, decode_content: body.read(amt)),
+                headers={"Content-Range": f"bytes {start}-{end}/{len(data)}"},
+            ))
+            return responses[-1]
+
+        with media.HTTPRangeReader("https://cdn.example.com/a.mp4", session=mock.Mock(get=get)) as reader:
+            self.assertEqual(media.header_duration(reader), 4.0)
+        self.assertLess(sum(requested), len(data) // 4)
+        self.assertTrue(all(response.close.called for response in responses))
+
+    def test_remote_file_without_range_support_is_not_downloaded(self):
+        response = mock.Mock(status_code=200, headers={})
+        session = mock.Mock(get=mock.Mock(return_value=response))
+
+        with self.assertRaises(OSError):
+            media.HTTPRangeReader("https://cdn.example.com/a.mp4", session=session)
+        self.assertTrue(session.get.call_args.kwargs["stream"])
+        response.raw.read.assert_not_called()
+        response.close.assert_called_once_with()
+
+
+@override_settings(MEDIA_SENDFILE_MODE=None)
+class LectureStreamingTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.client = APIClient()
+        teacher_user = create_user("teacher")
+        teacher = api_models.Teacher.objects.create(user=teacher_user, full_name="Teacher")
+        self.course = api_models.Course.objects.create(teacher=teacher, title="Python")
+        variant = api_models.Variant.objects.create(course=self.course, title="Intro")
+        self.content = bytes(range(256)) * 40
+        self.item = api_models.VariantItem.objects.create(
+            variant=variant,
+            title="Lecture",
+            file=SimpleUploadedFile("lecture.mp4", self.content, content_type="video/mp4"),
+        )
+        self.url = reverse("lecture_media", args=[self.item.variant_item_id])
+        self.student = create_user("student")
+        api_models.EnrolledCourse.objects.create(course=self.course, user=self.student)
+
+    def read(self, response):
+        return b"".join(response.streaming_content)
+
+    def test_lecture_requires_enrollment(self):
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+        self.client.force_authenticate(create_user("outsider"))
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+        self.client.force_authenticate(self.student)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.read(response), self.content)
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+
+    def test_preview_lecture_is_public(self):
+        api_models.VariantItem.objects.filter(pk=self.item.pk).update(preview=True)
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+
+    def test_range_requests(self):
+        self.client.force_authenticate(self.student)
+        size = len(self.content)
+
+        response = self.client.get(self.url, HTTP_RANGE="bytes=100-199")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response["Content-Range"], f"bytes 100-199/{size}")
+        self.assertEqual(response["Content-Length"], "100")
+        self.assertEqual(self.read(response), self.content[100:200])
+
+        response = self.client.get(self.url, HTTP_RANGE="bytes=-10")
+        self.assertEqual(self.read(response), self.content[-10:])
+
+        response = self.client.get(self.url, HTTP_RANGE=f"bytes={size}-")
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response["Content-Range"], f"bytes */{size}")
+
+    def test_conditional_requests(self):
+        self.client.force_authenticate(self.student)
+        etag = self.client.get(self.url)["ETag"]
+
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        response = self.client.get(self.url, HTTP_RANGE="bytes=0-9", HTTP_IF_RANGE=etag)
+        self.assertEqual(response.status_code, 206)
+        response = self.client.get(self.url, HTTP_RANGE="bytes=0-9", HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_proxy_offload_mode(self):
+        self.client.force_authenticate(self.student)
+        with self.settings(MEDIA_SENDFILE_MODE="x-accel-redirect"):
+            response = self.client.get(self.url)
+        self.assertEqual(response["X-Accel-Redirect"], "/protected-media/" + self.item.file.name)
+        self.assertEqual(response.content, b"")
+
+    def test_proxy_offload_quotes_the_file_name(self):
+        name = "course-file/week 1/100% done?ü.mp4"
+        os.makedirs(os.path.join(self.media_root, "course-file", "week 1"))
+        with open(os.path.join(self.media_root, name), "wb") as file:
+            file.write(b"video")
+
+        with self.settings(MEDIA_SENDFILE_MODE="x-accel-redirect"):
+            response = streaming.serve_file(RequestFactory().get("/media/x"), name)
+        self.assertEqual(
+            response["X-Accel-Redirect"],
+            "/protected-media/course-file/week%201/100%25%20done%3F%C3%BC.mp4",
+        )
+
+    def test_public_media_route_hides_lecture_files(self):
+        media_url = "/media/" + self.item.file.name
+        self.assertEqual(self.client.get(media_url).status_code, 404)
+        directory, name = self.item.file.name.rsplit("/", 1)
+        for alias in (f"{directory}//{name}", f"{directory}/./{name}", f"./{directory}/{name}", f"{directory}/x/../{name}"):
+            self.assertEqual(self.client.get("/media/" + alias).status_code, 404, alias)
+
+        api_models.VariantItem.objects.filter(pk=self.item.pk).update(preview=True)
+        response = self.client.get(media_url, HTTP_RANGE="bytes=0-3")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(self.read(response), self.content[:4])
+
+    def test_paths_outside_media_root_are_not_served(self):
+        request = RequestFactory().get("/media/x")
+        with self.assertRaises(Http404):
+            streaming.serve_file(request, "../db.sqlite3")
+
+
+def make_clip(path, seconds=2, size="320x240"):
+    subprocess.run(
+        [
+            transcode.ffmpeg_binary(), "-y", "-loglevel", "error",
+            "-f", "lavfi", "-i", f"testsrc=size={size}:rate=25:duration={seconds}",
+            "-f", "lavfi", "-i", f"sine=frequency=440:duration={seconds}",
+            "-c:v", "libx264", "-preset", "ultrafast", "-c:a", "aac", "-shortest", path,
+        ],
+        check=True,
+    )
+
+
+@override_settings(
+    MEDIA_SENDFILE_MODE=None,
+    HLS_SEGMENT_SECONDS=1,
+    HLS_RENDITIONS=[
+        {"name": "120p", "height": 120, "video_bitrate": "150k", "audio_bitrate": "64k"},
+        {"name": "240p", "height": 240, "video_bitrate": "300k", "audio_bitrate": "64k"},
+        {"name": "480p", "height": 480, "video_bitrate": "900k", "audio_bitrate": "96k"},
+    ],
+)
+class LectureHLSTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        clip = os.path.join(self.media_root, "clip.mp4")
+        make_clip(clip)
+        with open(clip, "rb") as file:
+            upload = SimpleUploadedFile("lecture.mp4", file.read(), content_type="video/mp4")
+
+        self.client = APIClient()
+        teacher = api_models.Teacher.objects.create(user=create_user("teacher"), full_name="Teacher")
+        self.course = api_models.Course.objects.create(teacher=teacher, title="Python")
+        variant = api_models.Variant.objects.create(course=self.course, title="Intro")
+        self.item = api_models.VariantItem.objects.create(variant=variant, title="Lecture", file=upload)
+        self.student = create_user("student")
+        api_models.EnrolledCourse.objects.create(course=self.course, user=self.student)
+
+    def run_jobs(self):
+        while jobs.run_pending_jobs():
+            pass
+        self.item.refresh_from_db()
+
+    def test_select_renditions_never_upscales(self):
+        renditions = [{"name": "360p", "height": 360}, {"name": "720p", "height": 720}]
+        self.assertEqual([r["name"] for r in transcode.select_renditions(720, renditions)], ["360p", "720p"])
+        self.assertEqual(transcode.select_renditions(240, renditions)[0]["height"], 240)
+
+    def test_probe_queues_transcode_into_renditions(self):
+        self.run_jobs()
+
+        self.assertEqual(self.item.processing_status, "ready")
+        self.assertEqual(self.item.hls_status, "ready")
+        self.assertEqual([r["name"] for r in self.item.hls_renditions], ["120p", "240p"])
+        self.assertTrue(self.item.hls_playlist.endswith("/master.m3u8"))
+
+        self.client.force_authenticate(self.student)
+        response = self.client.get(self.item.hls_url())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/vnd.apple.mpegurl")
+        self.assertEqual(response["Cache-Control"], "private, max-age=31536000, immutable")
+        master = b"".join(response.streaming_content).decode()
+        self.assertIn("120p/index.m3u8", master)
+        self.assertIn("240p/index.m3u8", master)
+
+        version = self.item.hls_playlist.split("/")[0]
+        base = reverse("lecture_hls", args=[self.item.variant_item_id, f"{version}/240p/"])
+        playlist = b"".join(self.client.get(base + "index.m3u8").streaming_content).decode()
+        self.assertIn("#EXT-X-ENDLIST", playlist)
+        segment = next(line for line in playlist.splitlines() if line.endswith(".ts"))
+        response = self.client.get(base + segment)
+        self.assertEqual(response["Content-Type"], "video/mp2t")
+        self.assertGreater(len(b"".join(response.streaming_content)), 0)
+
+    def test_hls_files_require_enrollment(self):
+        self.run_jobs()
+        url = self.item.hls_url()
+        self.assertEqual(self.client.get(url).status_code, 401)
+        self.client.force_authenticate(create_user("outsider"))
+        self.assertEqual(self.client.get(url).status_code, 403)
+        hls_path = self.item.hls_path(self.item.hls_playlist)
+        for alias in (hls_path, f"./{hls_path}", f"/{hls_path}", hls_path.replace("/", "//", 1)):
+            self.assertEqual(self.client.get("/media/" + alias).status_code, 404, alias)
+
+    def test_reupload_replaces_renditions(self):
+        self.run_jobs()
+        old_dir = os.path.join(self.media_root, self.item.hls_path(self.item.hls_playlist.split("/")[0]))
+
+        with open(self.item.file.path, "rb") as file:
+            self.item.file = SimpleUploadedFile("new.mp4", file.read(), content_type="video/mp4")
+        self.item.save()
+        self.assertIsNone(self.item.hls_url())
+
+        self.run_jobs()
+        self.assertEqual(self.item.hls_status, "ready")
+        self.assertFalse(os.path.exists(old_dir))
+
+    def test_failed_transcode_is_marked_failed(self):
+        with self.settings(HLS_TRANSCODE_ENABLED=False):
+            self.run_jobs()
+        api_models.Job.objects.all().delete()
+        jobs.enqueue("transcode_variant_item", max_attempts=1, variant_item_id=self.item.pk)
+
+        with mock.patch("api.transcode.transcode_to_hls", side_effect=OSError("ffmpeg failed")):
+            with self.assertLogs("api.jobs", level="ERROR"):
+                self.run_jobs()
+        self.assertEqual(self.item.hls_status, "failed")
+        self.assertIsNone(self.item.hls_url())
+
+
+class EnrollmentProgressTests(TestCase):
+    def setUp(self):
+        teacher = api_models.Teacher.objects.create(user=create_user("teacher"), full_name="Teacher")
+        self.course = api_models.Course.objects.create(teacher=teacher, title="Python")
+        variant = api_models.Variant.objects.create(course=self.course, title="Intro")
+        self.lectures = [
+            api_models.VariantItem.objects.create(variant=variant, title=f"Lecture {index}")
+            for index in range(4)
+        ]
+        self.student = create_user("student")
+        self.enrollment = api_models.EnrolledCourse.objects.create(course=self.course, user=self.student)
+
+    def complete(self, lecture):
+        return api_models.CompletedCourse.objects.create(
+            course=self.course, user=self.student, variant_item=lecture
+        )
+
+    def test_progress_follows_completed_lessons(self):
+        self.enrollment.refresh_from_db()
+        self.assertEqual(self.enrollment.total_lectures, 4)
+        self.assertEqual(self.enrollment.progress_percent, 0)
+
+        self.complete(self.lectures[0])
+        self.complete(self.lectures[2])
+        self.complete(self.lectures[2])  # Completing a lesson twice counts once
+        self.enrollment.refresh_from_db()
+        self.assertEqual(self.enrollment.completed_lessons_count, 2)
+        self.assertEqual(self.enrollment.progress_percent, 50)
+        self.assertEqual(self.enrollment.last_lesson, self.lectures[2])
+
+        api_models.CompletedCourse.objects.filter(variant_item=self.lectures[2]).delete()
+        self.enrollment.refresh_from_db()
+        self.assertEqual(self.enrollment.completed_lessons_count, 1)
+        self.assertEqual(self.enrollment.progress_percent, 25)
+        self.assertEqual(self.enrollment.last_lesson, self.lectures[0])
+
+    def test_lecture_changes_update_totals(self):
+        self.complete(self.lectures[0])
+        self.lectures[3].delete()
+        self.enrollment.refresh_from_db()
+        self.assertEqual(self.enrollment.total_lectures, 3)
+        self.assertEqual(self.enrollment.progress_percent, 33)
+
+        self.lectures[0].delete()
+        self.enrollment.refresh_from_db()
+        self.assertEqual(self.enrollment.completed_lessons_count, 0)
+        self.assertEqual(self.enrollment.total_lectures, 2)
+        self.assertEqual(self.enrollment.progress_percent, 0)
+
+    def test_dashboard_reads_all_progress_in_one_query(self):
+        other = api_models.Course.objects.create(teacher=self.course.teacher, title="Django")
+        api_models.EnrolledCourse.objects.create(course=other, user=self.student)
+        self.complete(self.lectures[1])
+
+        client = APIClient()
+        client.force_authenticate(self.student)
+        with self.assertNumQueries(1):
+            response = client.get(reverse("student_dashboard"))
+        self.assertEqual(response.status_code, 200)
+        progress = {row["course"]["title"]: row for row in response.data}
+        self.assertEqual(progress["Python"]["progress_percent"], 25)
+        self.assertEqual(progress["Python"]["last_lesson_title"], "Lecture 1")
+        self.assertEqual(progress["Django"]["total_lectures"], 0)
+        self.assertIsNone(progress["Django"]["last_lesson_id"])
+
+    def test_dashboard_requires_authentication(self):
+        self.assertEqual(APIClient().get(reverse("student_dashboard")).status_code, 401)
+
+
+class CartTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        teacher = api_models.Teacher.objects.create(user=create_user("teacher"), full_name="Teacher")
+        self.courses = [
+            api_models.Course.objects.create(teacher=teacher, title=title, price=price)
+            for title, price in [("Python", "0.10"), ("Django", "0.20"), ("React", "19.99")]
+        ]
+        api_models.Country.objects.create(name="Nigeria", tax_rate=7)
+        cache.clear()  # Reload the tax-rate table
+        self.addCleanup(cache.clear)
+
+    def add(self, course, country="Nigeria", cart_id="123456"):
+        return self.client.post(
+            reverse("course_create"),
+            {
+                "course_id": course.id,
+                "user_id": "undefined",
+                "country": country,
+                "price": str(course.price),
+                "cart_id": cart_id,
+            },
+        )
+
+    def test_add_to_cart_computes_tax_in_decimal(self):
+        response = self.add(self.courses[2])
+        self.assertEqual(response.data["message"], "Cart created successfully")
+        item = api_models.Cart.objects.get()
+        self.assertEqual(item.tax_fee, Decimal("1.40"))
+        self.assertEqual(item.total, Decimal("21.39"))
+
+        with self.assertLogs("api.tax", level="DEBUG"):
+            response = self.add(self.courses[2], country="Atlantis")
+        self.assertEqual(response.data["message"], "Cart updated successfully")
+        item = api_models.Cart.objects.get()
+        self.assertEqual(item.country, "United States")
+        self.assertEqual(item.total, Decimal("19.99"))
+
+    def test_stats_are_one_exact_aggregate(self):
+        for course in self.courses:
+            self.add(course)
+        self.add(self.courses[0], cart_id="999999")
+
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse("cart_stats", args=["123456"]))
+        self.assertEqual(response.data, {"price": "20.29", "tax": "1.42", "total": "21.71"})
+
+        response = self.client.get(reverse("cart_stats", args=["000000"]))
+        self.assertEqual(response.data, {"price": "0.00", "tax": "0.00", "total": "0.00"})
+
+    def test_snapshot_returns_items_and_totals_in_one_query(self):
+        for course in self.courses:
+            self.add(course)
+
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse("cart_snapshot", args=["123456"]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item["course"]["title"] for item in response.data["items"]], ["Python", "Django", "React"])
+        self.assertEqual(response.data["items"][0]["course"]["teacher_name"], "Teacher")
+        self.assertEqual(response.data["totals"], {"price": "20.29", "tax": "1.42", "total": "21.71"})
+
+
+class CreateOrderTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.student = create_user("student")
+        teachers = [
+            api_models.Teacher.objects.create(user=create_user(f"teacher{index}"), full_name=f"Teacher {index}")
+            for index in range(3)
+        ]
+        for index in range(6):
+            course = api_models.Course.objects.create(teacher=teachers[index % 3], title=f"Course {index}")
+            api_models.Cart.objects.create(
+                cart_id="123456", course=course, price=Decimal("10.00"), tax_fee=Decimal("0.50"), total=Decimal("10.50")
+            )
+
+    def create_order(self):
+        return self.client.post(
+            reverse("order_create/"),
+            {
+                "full_name": "Student",
+                "email": "student@example.com",
+                "country": "Nigeria",
+                "cart_id": "123456",
+                "user_id": self.student.id,
+            },
+            format="json",
+        )
+
+    def test_order_is_created_in_constant_queries(self):
+        # user, cart, savepoint, order, items, teachers, release savepoint
+        with self.assertNumQueries(7):
+            response = self.create_order()
+        self.assertEqual(response.status_code, 201)
+
+        order = api_models.CartOrder.objects.get(order_id=response.data["order_id"])
+        self.assertEqual(order.student, self.student)
+        self.assertEqual(order.subtotal, Decimal("60.00"))
+        self.assertEqual(order.tax_fee, Decimal("3.00"))
+        self.assertEqual(order.total, Decimal("63.00"))
+        self.assertEqual(order.orderitem.count(), 6)
+        self.assertEqual(order.teacher.count(), 3)
+        self.assertEqual(len({item.oid for item in order.orderitem.all()}), 6)
+
+    def test_failed_order_leaves_nothing_behind(self):
+        with mock.patch.object(
+            api_models.CartOrder.teacher.through.objects, "bulk_create", side_effect=RuntimeError("boom")
+        ):
+            with self.assertRaises(RuntimeError):
+                self.create_order()
+        self.assertFalse(api_models.CartOrder.objects.exists())
+        self.assertFalse(api_models.CartOrderItem.objects.exists())
+
+
+class PaymentFinalizationTests(TestCase):
+    def setUp(self):
+        self.student = create_user("student")
+        teacher = api_models.Teacher.objects.create(user=create_user("teacher"), full_name="Teacher")
+        self.order = api_models.CartOrder.objects.create(
+            student=self.student, total=Decimal("21.00"), stripe_session_id="cs_test_1"
+        )
+        self.courses = []
+        for index in range(3):
+            course = api_models.Course.objects.create(teacher=teacher, title=f"Course {index}")
+            variant = api_models.Variant.objects.create(course=course, title=f"Intro {index}")
+            api_models.VariantItem.objects.create(variant=variant, title="Lecture")
+            api_models.CartOrderItem.objects.create(order=self.order, course=course, teacher=teacher)
+            self.courses.append(course)
+
+    def session(self, **fields):
+        session = {
+            "id": "cs_test_1",
+            "client_reference_id": self.order.order_id,
+            "payment_status": "paid",
+            "amount_total": 2100,
+        }
+        session.update(fields)
+        return session
+
+    def test_order_is_finalized_once(self):
+        stale_copy = api_models.CartOrder.objects.get(pk=self.order.pk)
+
+        self.assertEqual(payments.finalize_checkout_session(self.session()), payments.PAID)
+        self.assertEqual(payments.finalize_checkout_session(self.session()), payments.ALREADY_PROCESSED)
+        # A concurrent caller that loaded the order before it was paid loses the conditional update
+        self.assertEqual(payments.finalize_order(stale_copy, "evt_other"), payments.ALREADY_PROCESSED)
+
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.payment_status, "Paid")
+        self.assertEqual(self.order.payment_idempotency_key, "cs_test_1")
+        self.assertIsNotNone(self.order.paid_at)
+        enrollments = api_models.EnrolledCourse.objects.filter(user=self.student)
+        self.assertEqual(enrollments.count(), 3)
+        self.assertTrue(all(enrollment.total_lectures == 1 for enrollment in enrollments))
+        self.assertEqual(api_models.Notification.objects.filter(type="New Order").count(), 3)
+        self.assertEqual(api_models.Notification.objects.filter(user=self.student).count(), 1)
+
+    def test_repurchased_course_is_not_enrolled_twice(self):
+        api_models.EnrolledCourse.objects.create(course=self.courses[0], user=self.student)
+
+        self.assertEqual(payments.finalize_order(self.order, "cs_test_1"), payments.PAID)
+        self.assertEqual(api_models.EnrolledCourse.objects.filter(user=self.student).count(), 3)
+        with self.assertRaises(IntegrityError):
+            api_models.EnrolledCourse.objects.create(course=self.courses[0], user=self.student)
+
+    def test_finalization_cost_does_not_grow_with_the_order(self):
+        # key check, savepoint, update, items, notifications, existing enrollments, totals,
+        # enrollments, progress, release
+        with self.assertNumQueries(10):
+            payments.finalize_order(self.order, "cs_test_1")
+
+    def test_unverified_sessions_are_rejected(self):
+        self.assertEqual(payments.finalize_checkout_session(self.session(payment_status="unpaid")), payments.UNPAID)
+        with self.assertLogs("api.payments", level="ERROR"):
+            self.assertEqual(payments.finalize_checkout_session(self.session(amount_total=1)), payments.AMOUNT_MISMATCH)
+        self.assertEqual(payments.finalize_checkout_session(self.session(client_reference_id="0")), payments.NOT_FOUND)
+        self.assertFalse(api_models.EnrolledCourse.objects.exists())
+
+    def test_success_endpoint(self):
+        client = APIClient()
+        url = reverse("payment_success/")
+        data = {"order_id": self.order.order_id, "session_id": "cs_test_1"}
+
+        response = client.post(url, {**data, "session_id": "cs_forged"})
+        self.assertEqual(response.status_code, 400)
+
+        with mock.patch("stripe.checkout.Session.retrieve", return_value=self.session()) as retrieve:
+            self.assertEqual(client.post(url, data).data["message"], "Payment successful")
+            self.assertEqual(client.post(url, data).data["message"], "Payment already processed")
+        retrieve.assert_called_once_with("cs_test_1")
+
+
+@override_settings(STRIPE_WEBHOOK_SECRET="whsec_test")
+class StripeWebhookTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.url = reverse("stripe_webhook")
+        self.student = create_user("student")
+        teacher = api_models.Teacher.objects.create(user=create_user("teacher"), full_name="Teacher")
+        course = api_models.Course.objects.create(teacher=teacher, title="Python")
+        self.order = api_models.CartOrder.objects.create(
+            student=self.student, total=Decimal("10.00"), stripe_session_id="cs_test_1"
+        )
+        api_models.CartOrderItem.objects.create(order=self.order, course=course, teacher=teacher)
+
+    def deliver(self, event, secret="whsec_test", timestamp=None):
+        body, signature = stripe_fakes.signed_request(event, secret, timestamp)
+        return self.client.post(
+            self.url, body, content_type="application/json", HTTP_STRIPE_SIGNATURE=signature
+        )
+
+    def test_event_is_stored_and_processed_in_the_background(self):
+        event = stripe_fakes.checkout_completed_event(self.order)
+        with mock.patch("stripe.checkout.Session.retrieve") as retrieve:
+            response = self.deliver(event)
+        retrieve.assert_not_called()
+        self.assertEqual(response.status_code, 200)
+
+        stored = api_models.StripeEvent.objects.get(event_id=event["id"])
+        self.assertEqual(stored.status, "received")
+        self.assertFalse(api_models.EnrolledCourse.objects.exists())  # Acknowledged before processing
+
+        self.assertEqual(jobs.run_pending_jobs(), 1)
+        stored.refresh_from_db()
+        self.order.refresh_from_db()
+        self.assertEqual(stored.status, "processed")
+        self.assertEqual(stored.result, payments.PAID)
+        self.assertEqual(self.order.payment_status, "Paid")
+        self.assertTrue(api_models.EnrolledCourse.objects.filter(user=self.student).exists())
+
+    def test_redelivered_events_are_deduplicated(self):
+        event = stripe_fakes.checkout_completed_event(self.order)
+        self.deliver(event)
+        self.assertEqual(self.deliver(event).status_code, 200)
+        self.assertEqual(api_models.StripeEvent.objects.count(), 1)
+        self.assertEqual(api_models.Job.objects.filter(name="process_stripe_event").count(), 1)
+
+        # A second event for the same session finalizes nothing
+        self.deliver(stripe_fakes.checkout_completed_event(self.order))
+        jobs.run_pending_jobs()
+        self.assertEqual(api_models.EnrolledCourse.objects.count(), 1)
+        results = set(api_models.StripeEvent.objects.values_list("result", flat=True))
+        self.assertEqual(results, {payments.PAID, payments.ALREADY_PROCESSED})
+
+    def test_invalid_signatures_are_rejected(self):
+        event = stripe_fakes.checkout_completed_event(self.order)
+        self.assertEqual(self.deliver(event, secret="whsec_other").status_code, 400)
+        self.assertEqual(self.deliver(event, timestamp=1).status_code, 400)  # Replayed long after signing
+        response = self.client.post(self.url, "{}", content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(api_models.StripeEvent.objects.exists())
+
+    def test_unhandled_event_types_are_ignored(self):
+        self.deliver(stripe_fakes.event("customer.created", {"id": "cus_test", "object": "customer"}))
+        jobs.run_pending_jobs()
+        self.assertEqual(api_models.StripeEvent.objects.get().status, "ignored")
+
+    def test_failed_processing_is_retried(self):
+        self.deliver(stripe_fakes.checkout_completed_event(self.order))
+        job = api_models.Job.objects.get()
+
+        with mock.patch("api.payments.finalize_checkout_session", side_effect=RuntimeError("db down")):
+            with self.assertLogs("api.jobs", level="ERROR"):
+                jobs.run_pending_jobs()
+        job.refresh_from_db()
+        self.assertEqual(job.status, "pending")
+        self.assertEqual(api_models.StripeEvent.objects.get().status, "received")
+
+        api_models.Job.objects.filter(pk=job.pk).update(run_at=job.started_at)
+        jobs.run_pending_jobs()
+        self.assertEqual(api_models.StripeEvent.objects.get().status, "processed")
+
+    def test_success_endpoint_defers_to_the_webhook(self):
+        data = {"order_id": self.order.order_id, "session_id": "cs_test_1"}
+        with mock.patch("stripe.checkout.Session.retrieve") as retrieve:
+            response = self.client.post(reverse("payment_success/"), data)
+        retrieve.assert_not_called()
+        self.assertEqual(response.status_code, 202)
+
+
+class CouponTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.client = APIClient()
+        self.teacher = api_models.Teacher.objects.create(user=create_user("teacher"), full_name="Teacher")
+        other_teacher = api_models.Teacher.objects.create(user=create_user("other"), full_name="Other")
+        self.student = create_user("student")
+        self.coupon = api_models.Coupon.objects.create(teacher=self.teacher, code="SAVE15", discount=15)
+        self.order = self.create_order([(self.teacher, "10.99"), (self.teacher, "20.00"), (other_teacher, "30.00")])
+
+    def create_order(self, items):
+        order = api_models.CartOrder.objects.create(student=self.student)
+        for index, (teacher, total) in enumerate(items):
+            course = api_models.Course.objects.create(teacher=teacher, title=f"Course {order.pk}-{index}")
+            api_models.CartOrderItem.objects.create(
+                order=order, course=course, teacher=teacher, price=Decimal(total), total=Decimal(total)
+            )
+        subtotal = sum((Decimal(total) for _, total in items), Decimal("0.00"))
+        api_models.CartOrder.objects.filter(pk=order.pk).update(subtotal=subtotal, total=subtotal)
+        order.refresh_from_db()
+        return order
+
+    def apply(self, order=None, code="SAVE15"):
+        order = order or self.order
+        return self.client.post(reverse("coupon_apply/"), {"order_id": order.order_id, "code": code})
+
+    def test_coupon_discounts_every_eligible_item(self):
+        response = self.apply()
+        self.assertEqual(response.status_code, 201)
+
+        totals = dict(self.order.orderitem.values_list("total", "saved"))
+        self.assertEqual(totals, {Decimal("9.34"): Decimal("1.65"), Decimal("17.00"): Decimal("3.00"), Decimal("30.00"): Decimal("0.00")})
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.total, Decimal("56.34"))
+        self.assertEqual(self.order.saved, Decimal("4.65"))
+        self.assertEqual(list(self.order.coupons.all()), [self.coupon])
+        self.coupon.refresh_from_db()
+        self.assertEqual(self.coupon.times_used, 1)
+        self.assertEqual(list(self.coupon.used_by.all()), [self.student])
+
+        self.assertEqual(self.apply().data["message"], "Coupon already applied")
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.total, Decimal("56.34"))
+
+    def test_usage_limit_is_enforced_atomically(self):
+        api_models.Coupon.objects.filter(pk=self.coupon.pk).update(max_uses=1)
+        second = self.create_order([(self.teacher, "10.00")])
+
+        self.assertEqual(coupons.apply_coupon(self.order, "SAVE15"), coupons.APPLIED)
+        self.assertEqual(coupons.apply_coupon(second, "SAVE15"), coupons.EXHAUSTED)
+        second.refresh_from_db()
+        self.assertEqual(second.total, Decimal("10.00"))
+        self.assertFalse(api_models.CartOrderItem.coupons.through.objects.filter(cartorderitem__order=second).exists())
+
+    def test_expired_and_inapplicable_coupons(self):
+        self.coupon.expires_at = timezone.now() - timedelta(days=1)
+        self.coupon.save()
+        self.assertEqual(self.apply().status_code, 400)
+
+        api_models.Coupon.objects.create(teacher=create_teacher("third"), code="THIRD", discount=10)
+        self.assertEqual(coupons.apply_coupon(self.order, "THIRD"), coupons.NOT_APPLICABLE)
+        self.assertEqual(self.apply(code="NOPE").status_code, 404)
+
+    def test_lookup_is_cached_and_invalidated_on_change(self):
+        coupons.get_active_coupon("SAVE15")
+        coupons.get_active_coupon("NOPE")
+        with self.assertNumQueries(0):
+            self.assertEqual(coupons.get_active_coupon("SAVE15"), self.coupon)
+        with self.assertNumQueries(1):
+            self.assertIsNone(coupons.get_active_coupon("NOPE"))  # Misses are not cached
+
+        self.coupon.active = False
+        self.coupon.save()
+        self.assertIsNone(coupons.get_active_coupon("SAVE15"))
+
+        self.coupon.active = True
+        self.coupon.code = "SAVE20"
+        self.coupon.save()
+        self.assertIsNone(coupons.get_active_coupon("SAVE15"))
+        self.assertEqual(coupons.get_active_coupon("SAVE20"), self.coupon)
+
+    def test_stale_cached_coupon_cannot_be_redeemed(self):
+        coupons.get_active_coupon("SAVE15")
+        api_models.Coupon.objects.filter(pk=self.coupon.pk).update(active=False)  # Bypasses the receivers
+        self.assertEqual(coupons.apply_coupon(self.order, "SAVE15"), coupons.EXPIRED)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.saved, Decimal("0.00"))
+
+    def test_coupon_is_rejected_once_payment_has_started(self):
+        api_models.CartOrder.objects.filter(pk=self.order.pk).update(stripe_session_id="cs_test_1")
+        self.order.refresh_from_db()
+        response = self.apply()
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["message"], "Coupons cannot be applied once payment has started")
+
+        paid = self.create_order([(self.teacher, "10.00")])
+        api_models.CartOrder.objects.filter(pk=paid.pk).update(payment_status="Paid")
+        paid.refresh_from_db()
+        self.assertEqual(coupons.apply_coupon(paid, "SAVE15"), coupons.PAYMENT_STARTED)
+
+    def test_session_created_during_application_rolls_it_back(self):
+        api_models.CartOrder.objects.filter(pk=self.order.pk).update(stripe_session_id="cs_test_1")
+        self.assertIsNone(self.order.stripe_session_id)  # Loaded before the session was created
+        self.assertEqual(coupons.apply_coupon(self.order, "SAVE15"), coupons.PAYMENT_STARTED)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.saved, Decimal("0.00"))
+        self.assertFalse(self.order.coupons.exists())
+        self.coupon.refresh_from_db()
+        self.assertEqual(self.coupon.times_used, 0)
+
+    def test_new_code_is_found_after_a_miss(self):
+        self.assertIsNone(coupons.get_active_coupon("NEW10"))
+        api_models.Coupon.objects.bulk_create(  # Bypasses the receivers, like an edit in another process
+            [api_models.Coupon(teacher=self.teacher, code="NEW10", discount=10)]
+        )
+        self.assertEqual(coupons.apply_coupon(self.order, "NEW10"), coupons.APPLIED)
+
+    def test_stale_cached_coupon_applies_the_current_discount(self):
+        coupons.get_active_coupon("SAVE15")
+        api_models.Coupon.objects.filter(pk=self.coupon.pk).update(discount=50)  # Bypasses the receivers
+        self.assertEqual(coupons.apply_coupon(self.order, "SAVE15"), coupons.APPLIED)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.saved, Decimal("15.50"))
+
+    def test_concurrent_application_is_rejected(self):
+        through = api_models.CartOrderItem.coupons.through
+        with mock.patch.object(through.objects, "bulk_create", side_effect=IntegrityError("duplicate")):
+            self.assertEqual(coupons.apply_coupon(self.order, "SAVE15"), coupons.ALREADY_APPLIED)
+        self.coupon.refresh_from_db()
+        self.assertEqual(self.coupon.times_used, 0)
+
+
+def create_teacher(username):
+    return api_models.Teacher.objects.create(user=create_user(username), full_name=username)
+
+
+@override_settings(TAX_TABLE_CACHE=True)
+class TaxTableTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.country = api_models.Country.objects.create(name="Ghana", tax_rate=12)
+
+    def test_table_is_loaded_once_per_process(self):
+        self.assertEqual(tax.resolve("Ghana"), ("Ghana", 12))
+        with self.assertNumQueries(0):
+            self.assertEqual(tax.resolve("Ghana"), ("Ghana", 12))
+            with self.assertLogs("api.tax", level="DEBUG"):
+                self.assertEqual(tax.resolve("Atlantis"), ("United States", 0))
+
+    def test_admin_edit_reloads_the_table_after_commit(self):
+        tax.resolve("Ghana")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.country.tax_rate = 15
+            self.country.save()
+        self.assertEqual(tax.resolve("Ghana"), ("Ghana", 15))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.country.delete()
+        with self.assertLogs("api.tax", level="DEBUG"):
+            self.assertEqual(tax.resolve("Ghana"), ("United States", 0))
+
+    def test_unknown_country_is_not_a_warning(self):
+        with self.assertNoLogs("api.tax", level="WARNING"):
+            self.assertEqual(tax.resolve("undefined"), ("United States", 0))
+
+    def test_table_is_read_per_lookup_without_a_shared_cache(self):
+        tax.resolve("Ghana")
+        # An edit made by another process, whose signal never reaches this one
+        api_models.Country.objects.filter(pk=self.country.pk).update(tax_rate=15)
+
+        with self.settings(TAX_TABLE_CACHE=False), self.assertNumQueries(1):
+            self.assertEqual(tax.resolve("Ghana"), ("Ghana", 15))
+
+    def test_add_to_cart_reads_no_country_rows(self):
+        teacher = api_models.Teacher.objects.create(user=create_user("teacher"), full_name="Teacher")
+        course = api_models.Course.objects.create(teacher=teacher, title="Python", price=Decimal("10.00"))
+        tax.resolve("Ghana")
+
+        with CaptureQueriesContext(connection) as queries:
+            APIClient().post(
+                reverse("course_create"),
+                {"course_id": course.id, "user_id": "undefined", "country": "Ghana", "price": "10.00", "cart_id": "1"},
+            )
+        self.assertFalse([query for query in queries if "api_country" in query["sql"]])
+        self.assertEqual(api_models.Cart.objects.get().tax_fee, Decimal("1.20"))
+
+
+class CartLifecycleTests(TestCase):
+    def setUp(self):
+        teacher = create_teacher("teacher")
+        self.courses = [
+            api_models.Course.objects.create(teacher=teacher, title=f"Course {index}") for index in range(3)
+        ]
+        self.user = create_user("student")
+
+    def add(self, cart_id, course, user=None):
+        return api_models.Cart.objects.create(cart_id=cart_id, course=course, user=user)
+
+    def test_guest_cart_is_merged_on_login(self):
+        self.add("111111", self.courses[0], user=self.user)  # Saved on another device
+        self.add("111111", self.courses[1], user=self.user)
+        self.add("222222", self.courses[1])
+        self.add("222222", self.courses[2])
+        someone_else = self.add("222222", self.courses[0], user=create_user("other"))
+
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.post(reverse("cart_merge"), {"cart_id": "222222"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            sorted(item["course"]["title"] for item in response.data["items"] if item["id"] != someone_else.id),
+            ["Course 0", "Course 1", "Course 2"],
+        )
+        mine = api_models.Cart.objects.filter(user=self.user)
+        self.assertEqual(mine.count(), 3)
+        self.assertEqual(set(mine.values_list("cart_id", flat=True)), {"222222"})
+        self.assertFalse(api_models.Cart.objects.filter(cart_id="111111").exists())
+        someone_else.refresh_from_db()
+        self.assertEqual(someone_else.user.username, "other")
+
+    def test_merge_requires_authentication(self):
+        self.assertEqual(APIClient().post(reverse("cart_merge"), {"cart_id": "1"}).status_code, 401)
+
+    def test_stale_guest_carts_are_purged_in_batches(self):
+        old = timezone.now() - timedelta(days=31)
+        for index in range(5):
+            self.add(f"9{index}", self.courses[0])
+        self.add("fresh", self.courses[0])
+        self.add("owned", self.courses[0], user=self.user)
+        api_models.Cart.objects.exclude(cart_id="fresh").update(updated_at=old)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(tasks.purge_stale_carts(batch_size=2), 5)
+        deletes = [query for query in queries if query["sql"].startswith("DELETE")]
+        self.assertEqual(len(deletes), 3)
+        self.assertEqual(set(api_models.Cart.objects.values_list("cart_id", flat=True)), {"fresh", "owned"})
+
+    def test_purge_runs_periodically_on_the_job_queue(self):
+        self.assertIn("purge_stale_carts", jobs.schedule_periodic_jobs())
+        self.assertEqual(jobs.schedule_periodic_jobs(), [])  # Already queued
+
+        first_run = api_models.Job.objects.get(name="purge_stale_carts")
+        jobs.run_pending_jobs(names=["purge_stale_carts"])
+        next_run = api_models.Job.objects.get(name="purge_stale_carts")  # The same row is rescheduled
+        self.assertEqual(next_run.pk, first_run.pk)
+        self.assertEqual(next_run.status, "pending")
+        self.assertEqual(next_run.attempts, 0)
+        self.assertGreater(next_run.run_at, timezone.now() + timedelta(hours=23))
+
+    def test_finished_jobs_and_sent_emails_are_purged(self):
+        old = timezone.now() - timedelta(days=8)
+        for status in ("done", "done", "failed"):
+            job = jobs.enqueue("probe_variant_item", variant_item_id=0)
+            api_models.Job.objects.filter(pk=job.pk).update(status=status, finished_at=old)
+        recent = jobs.enqueue("probe_variant_item", variant_item_id=0)
+        api_models.Job.objects.filter(pk=recent.pk).update(status="done", finished_at=timezone.now())
+        for status, sent_at in (("sent", old), ("sent", timezone.now()), ("failed", None)):
+            email = mail.queue_email("Subject", ["user@example.com"], "Body")
+            api_models.OutboxEmail.objects.filter(pk=email.pk).update(status=status, sent_at=sent_at)
+
+        self.assertEqual(tasks.purge_finished_jobs(batch_size=1), 2)
+        self.assertEqual(set(api_models.Job.objects.values_list("status", flat=True)), {"done", "failed"})
+        self.assertEqual(tasks.purge_sent_emails(), 1)
+        self.assertEqual(api_models.OutboxEmail.objects.count(), 2)
+
+
+@override_settings(CHECKOUT_CACHE_TIMEOUT=600)
+class CheckoutReadModelTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.client = APIClient()
+        self.teacher = api_models.Teacher.objects.create(user=create_user("teacher"), full_name="Teacher")
+        self.student = create_user("student")
+        self.coupon = api_models.Coupon.objects.create(teacher=self.teacher, code="SAVE10", discount=10)
+        self.order = api_models.CartOrder.objects.create(
+            student=self.student, subtotal=Decimal("30.00"), total=Decimal("30.00")
+        )
+        for index in range(3):
+            course = api_models.Course.objects.create(
+                teacher=self.teacher, title=f"Course {index}", image=f"course-file/{index}.jpg"
+            )
+            api_models.CartOrderItem.objects.create(
+                order=self.order, course=course, teacher=self.teacher, price=Decimal("10.00"), total=Decimal("10.00")
+            )
+        self.url = reverse("order_checkout/", kwargs={"order_id": self.order.order_id})
+
+    def test_checkout_is_built_in_constant_queries_and_cached(self):
+        # order, items with courses, item coupons, order coupons
+        with self.assertNumQueries(4):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["order_items"]), 3)
+        item = response.data["order_items"][0]
+        self.assertEqual(item["course_title"], "Course 0")
+        self.assertEqual(item["course_image"], "http://testserver/media/course-file/0.jpg")
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(self.url).data, response.data)
+
+    def test_cache_is_off_without_a_timeout(self):
+        with self.settings(CHECKOUT_CACHE_TIMEOUT=0):
+            self.client.get(self.url)
+            with self.assertNumQueries(4):
+                self.client.get(self.url)
+        self.assertIsNone(cache.get(api_models.checkout_cache_key(self.order.order_id)))
+
+    def test_unknown_order_is_not_found(self):
+        response = self.client.get(reverse("order_checkout/", kwargs={"order_id": "000000"}))
+        self.assertEqual(response.status_code, 404)
+
+    def test_applying_a_coupon_invalidates_the_checkout(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(coupons.apply_coupon(self.order, "SAVE10"), coupons.APPLIED)
+
+        data = self.client.get(self.url).data
+        self.assertEqual(data["coupons"], ["SAVE10"])
+        self.assertEqual(data["total"], "27.00")
+        self.assertEqual({tuple(item["coupons"]) for item in data["order_items"]}, {("SAVE10",)})
+
+    def test_payment_invalidates_the_checkout(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(payments.finalize_order(self.order, "cs_test_checkout"), payments.PAID)
+
+        self.assertEqual(self.client.get(self.url).data["payment_status"], "Paid")
+
+    def test_saving_the_order_or_an_item_invalidates_the_checkout(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.order.full_name = "Student Name"
+            self.order.save()
+        self.assertEqual(self.client.get(self.url).data["full_name"], "Student Name")
+
+        item = self.order.orderitem.first()
+        with self.captureOnCommitCallbacks(execute=True):
+            item.delete()
+        self.assertEqual(len(self.client.get(self.url).data["order_items"]), 2)
+
+
+class HotPathIndexTests(TestCase):
+    def test_benchmark_reports_plans_and_keeps_nothing(self):
+        out = StringIO()
+        call_command(
+            "benchmark_queries", courses=20, students=10, per_student=3, repeat=1, stdout=out
+        )
+        output = out.getvalue()
+        self.assertIn("Catalog page", output)
+        self.assertIn("Teacher notifications", output)
+        if connection.vendor == "sqlite":
+            self.assertIn("USING INDEX notification_teacher_date_idx", output)
+            self.assertIn("USING INDEX enrollment_user_date_idx", output)
+        self.assertFalse(api_models.Course.objects.exists())
+        self.assertFalse(CustomUser.objects.exists())
+        with connection.cursor() as cursor:
+            indexes = connection.introspection.get_constraints(cursor, api_models.Notification._meta.db_table)
+        self.assertIn("notification_teacher_date_idx", indexes)
+
+
+class DatabaseRoutingTests(TestCase):
+    def setUp(self):
+        self.router = db.ReplicaRouter()
+
+    def test_reads_stay_on_the_primary_without_a_replica(self):
+        with db.replica_reads():
+            self.assertIsNone(self.router.db_for_read(api_models.Course))
+
+    def test_catalog_reads_use_the_replica(self):
+        with mock.patch.dict(connections.databases, {db.REPLICA_DB_ALIAS: {}}):
+            self.assertIsNone(self.router.db_for_read(api_models.Course))
+            with db.replica_reads():
+                self.assertEqual(self.router.db_for_read(api_models.Course), db.REPLICA_DB_ALIAS)
+                self.assertEqual(self.router.db_for_write(api_models.Course), "default")
+            self.assertIsNone(self.router.db_for_read(api_models.Course))
+        self.assertFalse(self.router.allow_migrate(db.REPLICA_DB_ALIAS, "api"))
+
+    def test_catalog_views_read_inside_replica_reads(self):
+        seen = []
+        original = db.ReplicaRouter.db_for_read
+
+        def record(router, model, **hints):
+            seen.append(db._use_replica.get())
+            return original(router, model, **hints)
+
+        with mock.patch.object(db.ReplicaRouter, "db_for_read", record):
+            self.client.get(reverse("course_list"))
+        self.assertTrue(seen)
+        self.assertTrue(all(seen))
+
+    def test_sqlite_connections_are_tuned(self):
+        if connection.vendor != "sqlite":
+            self.skipTest("SQLite only")
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA synchronous")
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+            cursor.execute("PRAGMA busy_timeout")
+            self.assertEqual(cursor.fetchone()[0], settings.SQLITE_BUSY_TIMEOUT_MS)
+
+
+@override_settings(EMAIL_RATE_LIMIT=0)
+class EmailOutboxTests(TestCase):
+    def setUp(self):
+        self.user = create_user("student")
+        self.url = reverse("password_reset_email_verify", kwargs={"email": self.user.email})
+
+    def test_password_reset_queues_the_email(self):
+        response = APIClient().post(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("password", response.data)
+        self.assertEqual(len(django_mail.outbox), 0)  # Nothing is sent during the request
+        email = api_models.OutboxEmail.objects.get()
+        self.assertEqual(email.to, [self.user.email])
+        self.assertIn("create-new-password", email.body)
+        self.assertIn("create-new-password", email.html_body)
+
+    def test_password_reset_is_not_a_get(self):
+        self.assertEqual(APIClient().get(self.url).status_code, 405)
+        self.assertFalse(api_models.OutboxEmail.objects.exists())
+
+    def test_unknown_email_gets_the_same_answer(self):
+        url = reverse("password_reset_email_verify", kwargs={"email": "nobody@example.com"})
+        response = APIClient().post(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, APIClient().post(self.url).data)
+        self.assertEqual(api_models.OutboxEmail.objects.count(), 1)
+
+    def test_batch_is_sent_over_one_connection(self):
+        for index in range(3):
+            mail.queue_email(f"Subject {index}", [f"user{index}@example.com"], "Body", html_body="<p>Body</p>")
+
+        with mock.patch("django.core.mail.backends.locmem.EmailBackend.open") as open_connection:
+            self.assertEqual(tasks.send_queued_emails(batch_size=2), (2, 0))
+        open_connection.assert_called_once()
+        self.assertEqual([message.subject for message in django_mail.outbox], ["Subject 0", "Subject 1"])
+        self.assertEqual(django_mail.outbox[0].alternatives, [("<p>Body</p>", "text/html")])
+        self.assertEqual(api_models.OutboxEmail.objects.filter(status="sent").count(), 2)
+
+        self.assertEqual(tasks.send_queued_emails(), (1, 0))
+        self.assertEqual(tasks.send_queued_emails(), (0, 0))
+
+    def test_failed_email_is_retried_with_backoff(self):
+        email = mail.queue_email("Subject", ["user@example.com"], "Body")
+        failing = mock.patch(
+            "django.core.mail.backends.locmem.EmailBackend.send_messages", side_effect=OSError("provider down")
+        )
+
+        with failing, self.assertLogs("api.mail", "WARNING"), override_settings(EMAIL_MAX_ATTEMPTS=2):
+            self.assertEqual(mail.send_queued(), (0, 1))
+            email.refresh_from_db()
+            self.assertEqual((email.status, email.attempts), ("queued", 1))
+            self.assertGreater(email.send_after, timezone.now() + timedelta(seconds=30))
+            self.assertEqual(mail.send_queued(), (0, 0))  # Not due yet
+
+            api_models.OutboxEmail.objects.update(send_after=timezone.now())
+            self.assertEqual(mail.send_queued(), (0, 1))
+        email.refresh_from_db()
+        self.assertEqual(email.status, "failed")
+        self.assertIn("provider down", email.last_error)
+
+    def test_abandoned_claim_is_sent_again(self):
+        email = mail.queue_email("Subject", ["user@example.com"], "Body")
+        self.assertEqual(len(mail.claim_batch(10, timezone.now())), 1)
+        self.assertEqual(mail.claim_batch(10, timezone.now()), [])  # Claimed by the first worker
+
+        later = timezone.now() + timedelta(seconds=settings.EMAIL_CLAIM_TIMEOUT + 1)
+        self.assertEqual([claimed.pk for claimed in mail.claim_batch(10, later)], [email.pk])
+
+    @override_settings(EMAIL_RATE_LIMIT=4)
+    def test_sending_is_rate_limited(self):
+        for index in range(3):
+            mail.queue_email("Subject", [f"user{index}@example.com"], "Body")
+
+        with mock.patch("api.mail.time.sleep") as sleep:
+            self.assertEqual(mail.send_queued(), (3, 0))
+        self.assertEqual(sleep.call_count, 2)
+        self.assertTrue(all(0.2 < call.args[0] <= 0.25 for call in sleep.call_args_list))
+
+
+class EmailTemplateTests(TestCase):
+    def test_style_rules_are_inlined(self):
+        html = email_templates.inline_css(
+            "<style>p { color: blue; margin: 0 } .note { color: gray } "
+            "#intro { color: black } a:hover { color: red }</style>"
+            '<p id="intro" class="note">Hi</p><p class="note" style="color: green">Bye</p><a href="#">Link</a>'
+        )
+        self.assertIn('<p class="note" id="intro" style="margin: 0;color: black;">', html)
+        self.assertIn('<p class="note" style="margin: 0;color: green">', html)  # Own style wins
+        self.assertIn('<a href="#">', html)
+        self.assertIn("a:hover { color: red; }", html)  # Not inlinable, kept
+        self.assertNotIn("#intro", html)
+
+    def test_attribute_values_and_template_tags_survive_inlining(self):
+        html = email_templates.inline_css(
+            '<style>.k { color: blue }</style>'
+            '<p data-x="a>b" class="k" title="{{ title }}">{% if a > b %}{{ x|default:"<" }}{% endif %}</p>'
+        )
+        self.assertIn(
+            '<p class="k" data-x="a>b" title="{{ title }}" style="color: blue;">{% if a > b %}{{ x|default:"<" }}{% endif %}</p>',
+            html,
+        )
+        with self.assertRaises(ValueError):
+            email_templates.inline_css('<style>p { color: blue }</style><p {% if a %}class="a"{% endif %}>x</p>')
+
+    def test_rendering_matches_the_templates_and_compiles_once(self):
+        context = {"username": "student", "link": "https://example.com/reset/?a=1&b=2"}
+        text, html = email_templates.render("password_reset", context)
+
+        self.assertIn("https://example.com/reset/?a=1&b=2", text)  # Plain text is not HTML-escaped
+        self.assertNotIn("<style>", html)
+        self.assertIn('class="button" href="https://example.com/reset/?a=1&amp;b=2" style="display: inline-block', html)
+
+        with mock.patch.object(email_templates, "inline_css") as inline_css:
+            bodies = email_templates.render_batch("password_reset", [context] * 3)
+        inline_css.assert_not_called()
+        self.assertEqual(bodies, [(text, html)] * 3)
+
+    def test_templated_emails_are_queued_in_bulk(self):
+        recipients = [(f"user{index}@example.com", {"username": f"user{index}", "link": "#"}) for index in range(3)]
+        with self.assertNumQueries(1):
+            mail.queue_templated_emails("password_reset", "Password Reset Link", recipients)
+        emails = api_models.OutboxEmail.objects.order_by("id")
+        self.assertEqual([email.to for email in emails], [[address] for address, _ in recipients])
+        self.assertIn("Hi user2,", emails[2].body)
+
+    def test_benchmark_command(self):
+        out = StringIO()
+        call_command("benchmark_email_rendering", count=5, stdout=out)
+        self.assertIn("render_batch", out.getvalue())
+
+
+class PasswordResetTests(TestCase):
+    def setUp(self):
+        self.user = create_user("student")
+        self.client = APIClient()
+
+    def request_link(self):
+        self.client.post(reverse("password_reset_email_verify", kwargs={"email": self.user.email}))
+        body = api_models.OutboxEmail.objects.latest("id").body
+        query = body.split("?", 1)[1].split()[0]
+        return dict(part.split("=", 1) for part in query.split("&"))
+
+    def change_password(self, params, password="n3w-Passw0rd"):
+        return self.client.post(
+            reverse("password_change"),
+            {"uuidb64": params["uuid"], "token": params["token"], "password": password},
+        )
+
+    def test_requesting_a_link_writes_nothing_to_the_user(self):
+        # user lookup, outbox insert
+        with self.assertNumQueries(2):
+            self.client.post(reverse("password_reset_email_verify", kwargs={"email": self.user.email}))
+        self.user.refresh_from_db()
+        self.assertIsNone(self.user.otp)
+        self.assertIsNone(self.user.refresh_token)
+
+    def test_link_changes_the_password_once(self):
+        params = self.request_link()
+        other = self.request_link()  # A concurrent request does not invalidate the first link
+
+        response = self.change_password(params)
+        self.assertEqual(response.status_code, 201)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password("n3w-Passw0rd"))
+
+        self.assertEqual(self.change_password(params, "other-Passw0rd").status_code, 400)
+        self.assertEqual(self.change_password(other, "other-Passw0rd").status_code, 400)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password("n3w-Passw0rd"))
+
+    def test_tampered_and_malformed_links_are_rejected(self):
+        params = self.request_link()
+        other_user = create_user("other")
+        forged = dict(params, uuid=urlsafe_base64_encode(force_bytes(other_user.pk)))
+        self.assertEqual(self.change_password(forged).status_code, 400)
+        last = "1" if params["token"].endswith("0") else "0"  # Always a different token
+        self.assertEqual(self.change_password(dict(params, token=params["token"][:-1] + last)).status_code, 400)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.change_password({"uuid": "!!", "token": "x"}).status_code, 400)
+
+    def test_link_expires(self):
+        params = self.request_link()
+        with override_settings(PASSWORD_RESET_TIMEOUT=-1):
+            self.assertEqual(self.change_password(params).status_code, 400)
+        self.assertEqual(self.change_password(params).status_code, 201)
+
+    def test_password_changed_in_between_wins(self):
+        params = self.request_link()
+        user = password_reset.get_user(params["uuid"], params["token"])
+        CustomUser.objects.filter(pk=user.pk).update(password="changed")
+        self.assertFalse(password_reset.reset_password(user, "n3w-Passw0rd"))
+
+
+class JWTAuthenticationTests(TestCase):
+    def setUp(self):
+        authentication.token_cache.clear()
+        self.addCleanup(authentication.token_cache.clear)
+        teacher = api_models.Teacher.objects.create(user=create_user("teacher"), full_name="Teacher")
+        self.course = api_models.Course.objects.create(teacher=teacher, title="Python")
+        self.student = create_user("student")
+        api_models.EnrolledCourse.objects.create(course=self.course, user=self.student)
+
+    def client_for(self, user):
+        token = MyTokenObtainPairSerializer.get_token(user).access_token
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+        return client, token
+
+    def test_claims_user_needs_no_user_query(self):
+        client, token = self.client_for(self.student)
+        # The enrollments only; the user comes from the token
+        with self.assertNumQueries(1):
+            response = client.get(reverse("student_dashboard"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row["course"]["title"] for row in response.data], ["Python"])
+
+        claims = authentication.ClaimsJWTAuthentication().get_validated_token(str(token).encode())
+        self.assertEqual(claims["email"], "student@example.com")
+        self.assertFalse(claims["is_staff"])
+
+    def test_verified_tokens_are_cached_by_jti(self):
+        client, token = self.client_for(self.student)
+        client.get(reverse("student_dashboard"))
+        self.assertIn(token["jti"], authentication.token_cache.tokens)
+
+        with mock.patch("rest_framework_simplejwt.authentication.JWTAuthentication.get_validated_token") as verify:
+            self.assertEqual(client.get(reverse("student_dashboard")).status_code, 200)
+        verify.assert_not_called()
+
+    def test_cache_does_not_accept_forged_or_expired_tokens(self):
+        client, token = self.client_for(self.student)
+        client.get(reverse("student_dashboard"))
+
+        header, payload, signature = str(token).split(".")
+        forged = APIClient()
+        forged.credentials(HTTP_AUTHORIZATION=f"Bearer {header}.{payload}.{signature[:-2]}AA")
+        self.assertEqual(forged.get(reverse("student_dashboard")).status_code, 401)
+        self.assertIn(token["jti"], authentication.token_cache.tokens)  # The real token stays cached
+
+        with mock.patch("api.authentication.time.time", return_value=token["exp"] + 1):
+            self.assertIsNone(authentication.token_cache.get(token["jti"], str(token).encode()))
+        self.assertNotIn(token["jti"], authentication.token_cache.tokens)
+
+    def test_cache_is_bounded(self):
+        cache = authentication.TokenCache(2)
+        for jti in ("a", "b", "c"):
+            cache.set(jti, jti, {"exp": float("inf")})
+        self.assertEqual(list(cache.tokens), ["b", "c"])
+        cache.get("b", "b")
+        cache.set("d", "d", {"exp": float("inf")})
+        self.assertEqual(list(cache.tokens), ["b", "d"])
+
+    def test_staff_claim_grants_lecture_access(self):
+        variant = api_models.Variant.objects.create(course=self.course, title="Intro")
+        item = api_models.VariantItem.objects.create(variant=variant, title="Lecture", file="lecture.mp4")
+        staff = create_user("staff")
+        staff.is_staff = True
+        staff.save()
+        request = RequestFactory().get("/")
+        request.user = authentication.ClaimsJWTAuthentication().get_user(
+            MyTokenObtainPairSerializer.get_token(staff).access_token
+        )
+        with self.assertNumQueries(1):  # The lecture only
+            self.assertEqual(LectureMediaAPIView().get_lecture(request, item.variant_item_id), item)
+
+    def test_cart_merge_loads_the_user_model(self):
+        api_models.Cart.objects.create(cart_id="111111", course=self.course, price="10.00")
+        client, _ = self.client_for(self.student)
+        response = client.post(reverse("cart_merge"), {"cart_id": "111111"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(api_models.Cart.objects.get(cart_id="111111").user, self.student)
@@ -0,0 +1,145 @@
+"""
+Offline HLS transcoding of lecture videos.
+
+A lecture is encoded once into several renditions (see
+``settings.HLS_RENDITIONS``) that share keyframe-aligned segments, plus a
+master playlist that lets the player pick a bitrate for the viewer's
+connection. Each run writes to a fresh versioned directory, so every
+playlist and segment URL is immutable and can be cached for a long time.
+"""
+
+import os
+import shutil
+import subprocess
+
+import imageio_ffmpeg
+from django.conf import settings
+from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos
+
+MASTER_PLAYLIST = "master.m3u8"
+
+
+def ffmpeg_binary():
+    """
+    Return the ffmpeg executable to use.
+
+    :return: ``settings.FFMPEG_BINARY``, the ffmpeg on PATH, or the one bundled with imageio-ffmpeg
+    :rtype: str
+    """
+    return settings.FFMPEG_BINARY or shutil.which("ffmpeg") or imageio_ffmpeg.get_ffmpeg_exe()
+
+
+def select_renditions(source_height, renditions):
+    """
+    Return the renditions worth encoding for a source of the given height.
+
+    Renditions taller than the source are dropped so nothing is upscaled; a
+    source smaller than every rendition is encoded once at its own height.
+
+    :param source_height: Height of the source video in pixels
+    :param renditions: Candidate renditions, lowest first
+    :return: Renditions to encode
+    :rtype: list
+    """
+    selected = [r for r in renditions if r["height"] <= source_height]
+    if not selected:
+        smallest = dict(renditions[0])
+        smallest.update(height=source_height, name=f"{source_height}p")
+        selected = [smallest]
+    return selected
+
+
+def build_command(source, output_dir, renditions, has_audio, segment_seconds):
+    """
+    Build the ffmpeg command that encodes all renditions in a single pass.
+
+    The source is decoded once and split into one scaled stream per
+    rendition. Keyframes are forced on segment boundaries so every rendition
+    can be switched at any segment.
+
+    :return: The ffmpeg argument list
+    :rtype: list
+    """
+    count = len(renditions)
+    splits = "".join(f"[v{index}]" for index in range(count))
+    scales = ";".join(
+        f"[v{index}]scale=-2:{rendition['height']}[v{index}out]"
+        for index, rendition in enumerate(renditions)
+    )
+    command = [
+        ffmpeg_binary(), "-y", "-loglevel", "error", "-i", source,
+        "-filter_complex", f"[0:v]split={count}{splits};{scales}",
+    ]
+
+    stream_map = []
+    for index, rendition in enumerate(renditions):
+        command += [
+            "-map", f"[v{index}out]",
+            f"-c:v:{index}", "libx264",
+            f"-b:v:{index}", rendition["video_bitrate"],
+        ]
+        entry = f"v:{index}"
+        if has_audio:
+            command += [
+                "-map", "a:0",
+                f"-c:a:{index}", "aac",
+                f"-b:a:{index}", rendition["audio_bitrate"],
+            ]
+            entry += f",a:{index}"
+        stream_map.append(f"{entry},name:{rendition['name']}")
+
+    command += [
+        "-preset", "veryfast",
+        "-force_key_frames", f"expr:gte(t,n_forced*{segment_seconds})",
+        "-f", "hls",
+        "-hls_time", str(segment_seconds),
+        "-hls_playlist_type", "vod",
+        "-hls_flags", "independent_segments",
+        "-hls_segment_filename", os.path.join(output_dir, "%v", "segment_%05d.ts"),
+        "-master_pl_name", MASTER_PLAYLIST,
+        "-var_stream_map", " ".join(stream_map),
+        os.path.join(output_dir, "%v", "index.m3u8"),
+    ]
+    return command
+
+
+def transcode_to_hls(source, output_dir):
+    """
+    Encode a video into HLS renditions under ``output_dir``.
+
+    :param source: Local path or URL of the uploaded video
+    :param output_dir: Empty directory that receives the playlists and segments
+    :return: The encoded renditions (name, height, bitrates and playlist path)
+    :rtype: list
+    """
+    infos = ffmpeg_parse_infos(source)
+    source_height = infos["video_size"][1]
+    renditions = select_renditions(source_height, settings.HLS_RENDITIONS)
+
+    os.makedirs(output_dir, exist_ok=True)
+    command = build_command(
+        source,
+        output_dir,
+        renditions,
+        has_audio=infos.get("audio_found", False),
+        segment_seconds=settings.HLS_SEGMENT_SECONDS,
+    )
+    subprocess.run(command, check=True, capture_output=True)
+
+    return [
+        dict(rendition, playlist=f"{rendition['name']}/index.m3u8") for rendition in renditions
+    ]
+
+
+def remove_old_versions(item_dir, keep):
+    """
+    Delete the HLS output of earlier transcodes of a lecture.
+
+    :param item_dir: Directory holding one sub-directory per transcode version
+    :param keep: Name of the version directory that is now current
+    """
+    if not os.path.isdir(item_dir):
+        return
+    for version in os.listdir(item_dir):
+        if version != keep:
+            shutil.rmtree(os.path.join(item_dir, version), ignore_errors=True)
@@ -13,6 +13,13 @@ urlpatterns = [
     path('course/cart-item-delete/<cart_id>/<item_id>/', api_views.CartItemDeleteAPIView.as_view(), name='cart_item_delete'),
     path('course/search/', api_views.SearchCourseAPIView.as_view(), name='search'),
     path('cart/stats/<cart_id>/', api_views.CartStatsAPIView.as_view(), name='cart_stats'),
+    path('cart/snapshot/<cart_id>/', api_views.CartSnapshotAPIView.as_view(), name='cart_snapshot'),
+    path('cart/merge/', api_views.CartMergeAPIView.as_view(), name='cart_merge'),
+    path('course/lecture-media/<variant_item_id>/', api_views.LectureMediaAPIView.as_view(), name='lecture_media'),
+    path('course/lecture-hls/<variant_item_id>/<path:path>', api_views.LectureHLSAPIView.as_view(), name='lecture_hls'),
+
+    # Student Endpoints
+    path('student/dashboard/', api_views.StudentDashboardAPIView.as_view(), name='student_dashboard'),
 
 
     # Authentication Endpoints
@@ -28,6 +35,8 @@ urlpatterns = [
 
     # Stripe Endpoints
     path('payment/stripe-checkout/<order_id>/', api_views.StripeCheckoutAPIView.as_view(), name='stripe_checkout/'),
+    path('payment/payment-success/', api_views.PaymentSuccessAPIView.as_view(), name='payment_success/'),
+    path('payment/stripe-webhook/', api_views.StripeWebhookAPIView.as_view(), name='stripe_webhook'),
 ]
 
 # ENDPOINTS
@@ -1,20 +1,27 @@
 #from django.shortcuts import render
 from django.shortcuts import redirect
 from api import serializer as api_serializers
-from rest_framework.permissions import AllowAny
-from django.core.mail import EmailMultiAlternatives
-from django.template.loader import render_to_string
+from rest_framework.permissions import SAFE_METHODS, AllowAny, IsAuthenticated
+from rest_framework.exceptions import NotAuthenticated, PermissionDenied
+from api.authentication import UserJWTAuthentication
 # Takes a set of user credentials and returns an access and refresh JSON web token pair to prove the authentication of those credentials.
 from rest_framework_simplejwt.views import TokenObtainPairView
 from rest_framework import generics, status
-from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework.filters import OrderingFilter
 from rest_framework.response import Response
+from rest_framework.views import APIView
 
 from django.conf import settings
+from django.db import transaction
 
 from userauth.models import CustomUser
 from api import models as api_models
-from .utils import generate_random_string
+from .pagination import CourseCursorPagination, CourseSearchCursorPagination
+from .search import get_search_backend
+from .streaming import serve_file
+from .db import replica_reads
+from . import checkout, coupons, email_templates, mail, password_reset, payments, tax
+from .jobs import enqueue
 from decimal import Decimal
 
 import stripe
@@ -34,20 +41,22 @@ class RegisterView(generics.CreateAPIView):
     permission_classes = [AllowAny]
 
 
-class PasswordResetEmailVerifyAPIView(generics.RetrieveAPIView):
+class PasswordResetEmailVerifyAPIView(APIView):
     permission_classes = [AllowAny]
-    serializer_class = api_serializers.CustomUserSerializer
-
-    def get_object(self):
 
+    def post(self, request, *args, **kwargs):
         """
-        Retrieve a CustomUser object based on an email provided in the URL.
+        Send a password reset link to the user with the email given in the URL.
 
-        This method fetches the first user matching the given email. If a user
-        is found, a new OTP is generated and saved, a refresh token is created
-        and stored, and a password reset link is printed to the console.
+        The link carries a signed, time-limited token (see
+        ``api.password_reset``), so nothing is written to the user. The reset
+        email is queued in the outbox; a background job delivers it, so the
+        request never waits on the email provider. The response is the same
+        whether or not the email belongs to an account.
 
-        :return: The CustomUser instance corresponding to the email, or None if no user is found.
+        :param request: The request object
+        :return: A confirmation message
+        :rtype: Response
         """
         email = self.kwargs['email'] # Get the email from the URL
 
@@ -55,43 +64,23 @@ class PasswordResetEmailVerifyAPIView(generics.RetrieveAPIView):
 
         if user:
 
-            uuidb64 = user.pk # Get the UUID of the user
-            refresh = RefreshToken.for_user(user) # Generate a refresh token
-            refresh_token = str(refresh.access_token) # Convert the refresh token to a string
-            user.refresh_token = refresh_token # Save the refresh token to the user
-
-            user.otp = generate_random_string() # Generate a new OTP
-            user.save()
-
+            link = password_reset.make_link(user) # Signed link; nothing is stored
 
-            link = f'http://localhost:5173/create-new-password/?otp={user.otp}&uuid={uuidb64}&refresh_token={refresh_token}'
-
-            # Send an email with the password reset link
+            # Queue an email with the password reset link
             merge_data = {
                 'link': link,
                 'username': user.username
             }
 
-
-
-            subject = 'Password Reset Link'
-            text_content = render_to_string('email/password_reset.txt', merge_data)
-            html_content = render_to_string('email/password_reset.html', merge_data)
-
-            msg = EmailMultiAlternatives(
-                subject=subject,
-                from_email=settings.EMAIL,
+            text_content, html_content = email_templates.render('password_reset', merge_data)
+            mail.queue_email(
+                subject='Password Reset Link',
                 to=[user.email],
-                body=text_content
-                )
-            msg.attach_alternative(html_content, "text/html")
-            msg.send()
-
-            print(link)
-            print(settings.EMAIL)
-
+                body=text_content,
+                html_body=html_content,
+            )
 
-        return user
+        return Response({'message': 'If an account exists for this email, a password reset link has been sent'})
 
 
 class PasswordChangeAPIView(generics.CreateAPIView):
@@ -104,8 +93,9 @@ class PasswordChangeAPIView(generics.CreateAPIView):
         """
         Create a new password for a user.
 
-        This method takes the OTP, UUID and new password from the request and
-        updates the user's password.
+        This method takes the user id and token of a reset link and the new
+        password from the request and updates the user's password. A link
+        works once: changing the password invalidates its token.
 
         :param request: The request object.
         :param args: Additional positional arguments.
@@ -114,39 +104,75 @@ class PasswordChangeAPIView(generics.CreateAPIView):
             was changed successfully.
         """
         payload = request.data # Get the payload from the request
-        otp = payload['otp'] # Get the OTP from the payload
-        uuidb64 = payload['uuidb64'] # Get the UUID from the payload
-        password = payload['password'] # Get the password from the payload
+        uuidb64 = payload.get('uuidb64') # Get the user id from the payload
+        token = payload.get('token') # Get the reset token from the payload
+        password = payload.get('password') # Get the password from the payload
 
-        user = CustomUser.objects.get(id=uuidb64, otp=otp) # Get the user with the given UUID and OTP
+        user = password_reset.get_user(uuidb64, token) # Check the link without storing anything
 
         # Update the user's password
-        if user:
-            user.set_password(password)
-            user.otp = None
-            user.save()
-
+        if user and password and password_reset.reset_password(user, password):
             return Response({'message': 'Password changed successfully'}, status=status.HTTP_201_CREATED)
         else:
-            return Response({'message': "User not found"}, status=status.HTTP_404_NOT_FOUND)
+            return Response({'message': 'Invalid or expired password reset link'}, status=status.HTTP_400_BAD_REQUEST)
 
 
-class CategoryListAPIView(generics.ListAPIView):
+class CatalogReplicaMixin:
+    """
+    Serve read-only requests from the read replica, when one is configured.
+
+    Only for the public catalog, where a few seconds of replication lag are
+    harmless.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method in SAFE_METHODS:
+            with replica_reads():
+                return super().dispatch(request, *args, **kwargs)
+        return super().dispatch(request, *args, **kwargs)
+
+
+class CategoryListAPIView(CatalogReplicaMixin, generics.ListAPIView):
     queryset = api_models.Category.objects.filter(active=True) # Filter active categories
     serializer_class = api_serializers.CategorySerializer
     permission_classes = [AllowAny]
 
 
-class CourseListAPIView(generics.ListAPIView):
-    queryset = api_models.Course.objects.filter(
-        platform_status="Published",
-        teacher_course_status="Published"
-    ) # Filter published courses
-    serializer_class = api_serializers.CourseSerializer
+class CourseViewModeMixin:
+    """
+    Let course listings be requested as slim cards with ``?view=card``.
+
+    Card mode swaps in ``CourseCardSerializer`` and a queryset that skips the
+    curriculum and review prefetches the full serializer needs.
+    """
+
+    def is_card_view(self):
+        return self.request.query_params.get('view') == 'card'
+
+    def get_serializer_class(self):
+        if self.is_card_view():
+            return api_serializers.CourseCardSerializer
+        return api_serializers.CourseSerializer
+
+    def get_course_queryset(self):
+        courses = api_models.Course.objects.published() # Filter published courses
+        if self.is_card_view():
+            return courses.with_card_data()
+        return courses.with_related() # Prefetch what the full serializer reads
+
+
+class CourseListAPIView(CatalogReplicaMixin, CourseViewModeMixin, generics.ListAPIView):
     permission_classes = [AllowAny]
+    pagination_class = CourseCursorPagination
+    filter_backends = [OrderingFilter]
+    ordering_fields = ['slug', 'rating_avg', 'rating_count'] # ?ordering=-rating_avg reads the stored rating columns
+    ordering = 'slug'
+
+    def get_queryset(self):
+        return self.get_course_queryset()
 
 
-class CourseDetailAPIView(generics.RetrieveAPIView):
+class CourseDetailAPIView(CatalogReplicaMixin, generics.RetrieveAPIView):
     serializer_class = api_serializers.CourseSerializer
     permission_classes = [AllowAny]
 
@@ -161,7 +187,7 @@ class CourseDetailAPIView(generics.RetrieveAPIView):
         :raises: Course.DoesNotExist if no course with the slug exists.
         """
         slug = self.kwargs['slug']
-        course = api_models.Course.objects.get(slug=slug, platform_status="Published", teacher_course_status="Published")
+        course = api_models.Course.objects.published().with_related().get(slug=slug)
         return course
 
 
@@ -190,64 +216,35 @@ class CartAPIView(generics.CreateAPIView):
         cart_id = request.data['cart_id'] # Get the cart ID from the request data
 
 
-        course = api_models.Course.objects.filter(id=course_id).first() # Get the course with the given ID
-        """
-        If the user ID is not "undefined", get the user with the given ID
-        If the user ID is "undefined", set the user to None
-        """
-        if user_id != "undefined":
-            user = CustomUser.objects.filter(id=user_id).first() # Get the user with the given ID
-        else:
-            user = None
-        """
-        If the country is not "undefined", get the country with the given name
-        If the country is "undefined", set the country to "United States"
-        """
-        try:
-            country_object = api_models.Country.objects.filter(name=country).first() # Get the country with the given name
-            country = country_object.name
-        except api_models.Country.DoesNotExist:
-            country_object = None
-            country = "United States"
-
-        if country_object:
-            tax_rate = country_object.tax_rate / 100 # Get the tax rate for the country
-        else:
-            tax_rate = 0
-
-        cart = api_models.Cart.objects.filter(cart_id=cart_id, course=course).first() # Get the cart with the given ID
+        # The course and user are set by id, and tax rates come from the in-memory table
+        if user_id == "undefined":
+            user_id = None
 
         """
-        If the cart already exists, update it
-        If the cart does not exist, create a new one
+        If the country is known, use its tax rate
+        Otherwise, fall back to "United States" without tax
         """
+        country, tax_rate = tax.resolve(country)
+
+        price = Decimal(str(price))
+        tax_fee = tax.tax_fee(price, tax_rate)
+
+        # Update the course's row in this cart, or add it
+        cart, created = api_models.Cart.objects.update_or_create(
+            cart_id=cart_id,
+            course_id=course_id,
+            defaults={
+                'user_id': user_id,
+                'country': country,
+                'price': price,
+                'tax_fee': tax_fee,
+                'total': price + tax_fee, # Calculate the total price
+            },
+        )
 
-        if cart:
-            cart.course = course
-            cart.user = user
-            cart.country = country
-            cart.price = price
-            cart.tax_fee = Decimal(price) * Decimal(tax_rate)
-            cart.country = country
-            cart.cart_id = cart_id
-            cart.total = Decimal(cart.price) + Decimal(cart.tax_fee) # Calculate the total price
-            cart.save()
-
-            return Response({'message': 'Cart updated successfully'}, status=status.HTTP_201_CREATED)
-        else:
-            cart = api_models.Cart()
-            cart.course = course
-            cart.user = user
-            cart.country = country
-            cart.price = price
-            cart.tax_fee = Decimal(price) * Decimal(tax_rate)
-            cart.country = country
-            cart.cart_id = cart_id
-            cart.total = Decimal(cart.price) + Decimal(cart.tax_fee) # Calculate the total price
-            cart.save()
-
-
+        if created:
             return Response({'message': 'Cart created successfully'}, status=status.HTTP_201_CREATED)
+        return Response({'message': 'Cart updated successfully'}, status=status.HTTP_201_CREATED)
 
 
 class CartListAPIView(generics.ListAPIView):
@@ -318,9 +315,8 @@ class CartStatsAPIView(generics.RetrieveAPIView):
         """
         Retrieve and return the total price, tax, and main total for all cart items.
 
-        This method calculates the cumulative price, tax, and main total for all items
-        in the cart associated with the specified cart ID. It retrieves the cart items
-        from the database, computes the totals, and returns them in a response.
+        The totals are summed by the database in a single aggregate query and
+        returned as decimal strings, so no precision is lost.
 
         :param request: The request object.
         :param args: Additional positional arguments.
@@ -328,74 +324,50 @@ class CartStatsAPIView(generics.RetrieveAPIView):
         :return: A response object containing the total price, tax, and main total.
         :rtype: Response
         """
-        queryset = self.get_queryset()
-
-        total_price = 0.00
-        total_tax = 0.00
-        total_main = 0.00
-
-        # Calculate the total price, tax, and main total
-        # for all items in the cart
-        for cart_item in queryset:
-            total_price += float(self.calculate_price(cart_item))
-            total_tax += float(self.calculate_tax(cart_item))
-            total_main += round(float(self.calculate_main_total(cart_item)), 2)
-
-
-        data = {
-                'price': total_price,
-                'tax': total_tax,
-                'total': total_main
-            }
+        totals = self.get_queryset().totals()
+        return Response(api_serializers.CartTotalsSerializer(totals).data, status=status.HTTP_200_OK)
 
-        return Response(data, status=status.HTTP_200_OK)
 
+class CartSnapshotAPIView(APIView):
+    permission_classes = [AllowAny]
 
-    def calculate_price(self, cart_item):
-        """
-        Calculate the price of a single item in the cart.
-
-        This method takes a Cart object as an argument and returns
-        the price of the item in the cart. The price is retrieved from
-        the Cart object.
-
-        :param self: The instance of the class
-        :param cart_item: The Cart object
-        :return: The price of the item in the cart
-        :rtype: float
+    def get(self, request, cart_id):
         """
-        return cart_item.price
+        Return the items of a cart together with its totals.
 
-    def calculate_tax(self, cart_item):
+        The items and their courses are read with one query and the totals are
+        summed from those rows, so the checkout page needs a single request.
 
+        :param request: The request object.
+        :param cart_id: The cart_id of the cart.
+        :return: A response object containing the items and totals.
+        :rtype: Response
         """
-        Calculate the tax of a single item in the cart.
+        items = list(
+            api_models.Cart.objects.filter(cart_id=cart_id)
+            .select_related('course__teacher')
+            .order_by('date', 'id')
+        )
+        snapshot = {'cart_id': cart_id, 'items': items, 'totals': api_models.cart_totals(items)}
+        serializer = api_serializers.CartSnapshotSerializer(snapshot, context={'request': request})
+        return Response(serializer.data, status=status.HTTP_200_OK)
 
-        This method takes a Cart object as an argument and returns
-        the tax of the item in the cart. The tax is retrieved from
-        the Cart object.
 
-        :param self: The instance of the class
-        :param cart_item: The Cart object
-        :return: The tax of the item in the cart
-        :rtype: float
-        """
-        return cart_item.tax_fee
+class CartMergeAPIView(CartSnapshotAPIView):
+    permission_classes = [IsAuthenticated]
+    authentication_classes = [UserJWTAuthentication] # The cart rows need the user model
 
-    def calculate_main_total(self, cart_item):
+    def post(self, request):
         """
-        Calculate the main total of a single item in the cart.
+        Merge the browser's guest cart into the cart of the user who just logged in.
 
-        This method takes a Cart object as an argument and returns
-        the main total of the item in the cart. The main total is
-        the price of the item in the cart.
-
-        :param self: The instance of the class
-        :param cart_item: The Cart object
-        :return: The main total of the item in the cart
-        :rtype: float
+        :param request: The request object containing 'cart_id'.
+        :return: The snapshot of the merged cart.
+        :rtype: Response
         """
-        return cart_item.total
+        cart_id = request.data['cart_id'] # Get the cart ID from the request data
+        api_models.Cart.objects.merge_guest_cart(cart_id, request.user)
+        return self.get(request, cart_id)
 
 
 class CreateOrderAPIView(generics.CreateAPIView):
@@ -416,55 +388,71 @@ class CreateOrderAPIView(generics.CreateAPIView):
         else:
             user = None
 
-        cart_items = api_models.Cart.objects.filter(cart_id=cart_id)
-
-        total_price = Decimal(0.00)
-        total_tax = Decimal(0.00)
-        total_initial = Decimal(0.00)
-        total_main = Decimal(0.00)
-
-
-        order = api_models.CartOrder.objects.create(
-            full_name=full_name,
-            email=email,
-            country=country,
-            student=user
+        # Load the cart with each course's teacher so no query runs per item
+        cart_items = list(
+            api_models.Cart.objects.filter(cart_id=cart_id).select_related('course__teacher')
         )
-
-        for c in cart_items:
-            api_models.CartOrderItem.objects.create(
-                order=order,
-                course=c.course,
-                price=c.price,
-                tax_fee=c.tax_fee,
-                total=c.total,
-                initial_total=c.total,
-                teacher=c.course.teacher
-
+        totals = api_models.cart_totals(cart_items)
+
+        # The order, its items and its teachers are written together or not at all
+        with transaction.atomic():
+            order = api_models.CartOrder.objects.create(
+                full_name=full_name,
+                email=email,
+                country=country,
+                student=user,
+                subtotal=totals['price'],
+                tax_fee=totals['tax'],
+                initial_total=totals['total'],
+                total=totals['total'],
             )
 
-            total_price += Decimal(c.price)
-            total_tax += Decimal(c.tax_fee)
-            total_initial += Decimal(c.total)
-            total_main += Decimal(c.total)
-
-            order.teacher.add(c.course.teacher)
-
-        order.subtotal = total_price
-        order.tax_fee = total_tax
-        order.initial_total = total_initial
-        order.total = total_main
-        order.save()
-
-        return Response({'message': 'Order created successfully'}, status=status.HTTP_201_CREATED)
+            api_models.CartOrderItem.objects.bulk_create([
+                api_models.CartOrderItem(
+                    order=order,
+                    course=c.course,
+                    price=c.price,
+                    tax_fee=c.tax_fee,
+                    total=c.total,
+                    initial_total=c.total,
+                    teacher=c.course.teacher,
+                )
+                for c in cart_items
+            ])
+
+            teacher_ids = {c.course.teacher_id for c in cart_items}
+            OrderTeacher = api_models.CartOrder.teacher.through
+            OrderTeacher.objects.bulk_create([
+                OrderTeacher(cartorder_id=order.id, teacher_id=teacher_id) for teacher_id in teacher_ids
+            ])
+
+        return Response(
+            {'message': 'Order created successfully', 'order_id': order.order_id},
+            status=status.HTTP_201_CREATED,
+        )
 
 
 class CheckoutAPIView(generics.RetrieveAPIView):
-    serializer_class = api_serializers.CartOrderSerializer
+    serializer_class = api_serializers.CheckoutSerializer
     permission_classes = [AllowAny]
-    queryset = api_models.CartOrder.objects.all()
     lookup_field = 'order_id'
 
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Return the checkout read model of an order from the cache.
+
+        :param request: The request object
+        :return: The order with its items, courses and coupons, or 404
+        :rtype: Response
+        """
+        data = checkout.get_checkout(self.kwargs['order_id'])
+        if data is None:
+            return Response({'message': 'Order not found'}, status=status.HTTP_404_NOT_FOUND)
+        for item in data['order_items']:
+            if item['course_image']:
+                item['course_image'] = request.build_absolute_uri(item['course_image'])
+        return Response(data)
+
 
 class CouponApplyAPIView(generics.CreateAPIView):
     serializer_class = api_serializers.CouponSerializer
@@ -472,39 +460,39 @@ class CouponApplyAPIView(generics.CreateAPIView):
 
 
     def create(self, request, *args, **kwargs):
-        order_id = request.data['order_id'] # Get the order ID from the request data
-        code = request.data['code'] # Get the code from the request data
-
-        order = api_models.CartOrder.objects.get(order_id=order_id)
-        coupon = api_models.Coupon.objects.get(code=code)
-
-        if coupon:
-            order_items = api_models.CartOrderItem.objects.filter(order=order, teacher=coupon.teacher)
-            for o in order_items:
-                if coupon not in o.coupons.all():
-                    discount = o.total * coupon.discount / 100
+        """
+        Apply a coupon code to an order.
 
-                    o.total -= discount
-                    o.price -= discount
-                    o.saved += discount
-                    o.applied_coupon = True
-                    o.coupons.add(coupon)
+        The coupon discounts every item of the order sold by the coupon's
+        teacher, in one transaction (see ``api.coupons``).
 
-                    order.coupons.add(coupon)
-                    order.total -= discount
-                    order.subtotal -= discount
-                    order.saved += discount
+        :param request: The request object containing 'order_id' and 'code'.
+        :param args: Additional positional arguments.
+        :param kwargs: Additional keyword arguments.
+        :return: A response describing the outcome.
+        """
+        order_id = request.data['order_id'] # Get the order ID from the request data
+        code = request.data['code'] # Get the code from the request data
 
-                    o.save()
-                    order.save()
-                    coupon.used_by.add(order.student)
+        order = api_models.CartOrder.objects.filter(order_id=order_id).first()
+        if order is None:
+            return Response({'message': 'Order not found'}, status=status.HTTP_404_NOT_FOUND)
 
-                    return Response({'message': 'Coupon Found and Activated'}, status=status.HTTP_201_CREATED)
-                else:
-                    return Response({'message': 'Coupon already applied'}, status=status.HTTP_200_OK)
+        result = coupons.apply_coupon(order, code)
 
-        else:
+        if result == coupons.APPLIED:
+            return Response({'message': 'Coupon Found and Activated'}, status=status.HTTP_201_CREATED)
+        if result == coupons.ALREADY_APPLIED:
+            return Response({'message': 'Coupon already applied'}, status=status.HTTP_200_OK)
+        if result == coupons.NOT_FOUND:
             return Response({'message': 'Coupon not found'}, status=status.HTTP_404_NOT_FOUND)
+        messages = {
+            coupons.EXPIRED: 'Coupon has expired',
+            coupons.EXHAUSTED: 'Coupon usage limit reached',
+            coupons.NOT_APPLICABLE: 'Coupon does not apply to this order',
+            coupons.PAYMENT_STARTED: 'Coupons cannot be applied once payment has started',
+        }
+        return Response({'message': messages[result]}, status=status.HTTP_400_BAD_REQUEST)
 
 
 
@@ -552,11 +540,14 @@ class StripeCheckoutAPIView(generics.CreateAPIView):
                     },
                 ],
                 mode='payment',
+                client_reference_id=order_oid, # Lets the webhook find the order
+                metadata={'order_id': order_oid},
                 success_url=settings.FRONTEND_SITE_URL + '/payment-success/' + order_oid + '?session_id={CHECKOUT_SESSION_ID}',
                 cancel_url=settings.FRONTEND_SITE_URL + '/payment-failed/'
             )
             print("Checkout Session =====", checkout_session)
             order.stripe_session_id = checkout_session['id']
+            order.save(update_fields=['stripe_session_id'])
 
 
             return redirect(checkout_session.url)
@@ -567,58 +558,226 @@ class StripeCheckoutAPIView(generics.CreateAPIView):
 
 
 
-class PaymentSuccessAPIView(generics.RetrieveAPIView):
+class PaymentSuccessAPIView(generics.CreateAPIView):
     serializer_class = api_serializers.CartOrderSerializer
+    permission_classes = [AllowAny]
     queryset = api_models.CartOrder.objects.all()
 
     def create(self, request, *args, **kwargs):
+        """
+        Confirm the payment of an order after the Stripe checkout redirect.
+
+        An order that is already paid (e.g. finalized by the Stripe webhook)
+        is answered from the database without calling Stripe. When the webhook
+        is configured, an unpaid order is reported as still processing.
+        Otherwise the checkout session is retrieved and handed to the payment
+        finalization service, which enrolls the student exactly once even if
+        this endpoint and the webhook race.
+
+        :param request: The request object containing 'order_id' and 'session_id'.
+        :param args: Additional positional arguments.
+        :param kwargs: Additional keyword arguments.
+        :return: A response describing the payment status.
+        """
         order_id = request.data['order_id']
         session_id = request.data['session_id']
 
-        order = api_models.CartOrder.objects.get(order_id=order_id)
-        order_items = api_models.CartOrderItem.objects.filter(order=order)
-
-        if session_id != "null":
-            session = stripe.checkout.Session.retrieve(session_id)
-            if session.payment_status == "paid":
-                if order.payment_status == "processing":
-                    order.payment_status = "paid"
-                    order.save()
-                    api_models.Notification.objects.create(
-                        user=order.student,
-                        type="Payment",
-                        order=order
-                    )
-                    for o in order_items:
-                        api_models.Notification.objects.create(
-                            teacher=o.teacher,
-                            order=order,
-                            order_item=o,
-                            type="New Order"
-
-                        )
-                        api_models.EnrolledCourse.objects.create(
-                            course=o.course,
-                            user=order.student,
-                            teacher=o.teacher,
-                            order_item=o
-                        )
-                    return Response({'message': 'Payment successful'}, status=status.HTTP_200_OK)
-                else:
-                    return Response({'message': 'Payment already processed'}, status=status.HTTP_200_OK)
-            else:
-                return Response({'message': 'Payment failed'}, status=status.HTTP_200_OK)
-
-
-
-class SearchCourseAPIView(generics.ListAPIView):
-    serializer_class = api_serializers.CourseSerializer
+        order = api_models.CartOrder.objects.filter(order_id=order_id).first()
+        if order is None:
+            return Response({'message': 'Order not found'}, status=status.HTTP_404_NOT_FOUND)
+        if order.payment_status != 'processing':
+            return Response({'message': 'Payment already processed'}, status=status.HTTP_200_OK)
+        if session_id in (None, '', 'null') or session_id != order.stripe_session_id:
+            return Response({'message': 'Invalid checkout session'}, status=status.HTTP_400_BAD_REQUEST)
+        if settings.STRIPE_WEBHOOK_SECRET:
+            # The webhook confirms the payment; the client checks back without us calling Stripe
+            return Response({'message': 'Payment processing'}, status=status.HTTP_202_ACCEPTED)
+
+        session = stripe.checkout.Session.retrieve(session_id)
+        result = payments.finalize_checkout_session(session)
+
+        if result == payments.PAID:
+            return Response({'message': 'Payment successful'}, status=status.HTTP_200_OK)
+        if result == payments.ALREADY_PROCESSED:
+            return Response({'message': 'Payment already processed'}, status=status.HTTP_200_OK)
+        return Response({'message': 'Payment failed'}, status=status.HTTP_200_OK)
+
+
+
+class StripeWebhookAPIView(APIView):
     permission_classes = [AllowAny]
+    authentication_classes = []
+
+    def post(self, request):
+        """
+        Receive a Stripe webhook event.
+
+        The signature is verified against ``settings.STRIPE_WEBHOOK_SECRET``,
+        the raw event is stored and a ``process_stripe_event`` job is queued;
+        the response is sent without waiting for the processing. Events that
+        were already received (Stripe delivers at least once) are acknowledged
+        without queueing them again.
+
+        :param request: The request object carrying the raw event body.
+        :return: 200 once the event is stored, 400 for an invalid signature or payload.
+        """
+        if not settings.STRIPE_WEBHOOK_SECRET:
+            return Response({'message': 'Webhook not configured'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        try:
+            event = stripe.Webhook.construct_event(
+                request.body, request.headers.get('Stripe-Signature', ''), settings.STRIPE_WEBHOOK_SECRET
+            )
+        except (ValueError, stripe.error.SignatureVerificationError):
+            return Response({'message': 'Invalid webhook event'}, status=status.HTTP_400_BAD_REQUEST)
+
+        with transaction.atomic():
+            stripe_event, created = api_models.StripeEvent.objects.get_or_create(
+                event_id=event['id'],
+                defaults={'type': event['type'], 'payload': event.to_dict_recursive()},
+            )
+            if created:
+                enqueue('process_stripe_event', event_id=stripe_event.event_id)
+
+        return Response({'received': True}, status=status.HTTP_200_OK)
+
+
+class SearchCourseAPIView(CatalogReplicaMixin, CourseViewModeMixin, generics.ListAPIView):
+    permission_classes = [AllowAny]
+    pagination_class = CourseSearchCursorPagination
 
     def get_queryset(self):
-        query = self.request.GET.get('query')
-        return api_models.Course.objects.filter(
-            title__icontains=query,
-            platform_status="Published",
-            teacher_course_status="Published"
+        """
+        Return the published courses matching ``?query=``, best match first.
+
+        Title, description, category and teacher name are searched through
+        the full-text index. A missing or empty query returns no courses.
+
+        :return: Queryset annotated with ``search_rank``
+        :rtype: QuerySet
+        """
+        query = self.request.GET.get('query', '')
+        return get_search_backend().search(self.get_course_queryset(), query)
+
+
+
+class MediaFileAPIView(APIView):
+    permission_classes = [AllowAny]
+
+    def get(self, request, path):
+        """
+        Serve a public file from MEDIA_ROOT with Range and conditional request support.
+
+        Lecture files are only served by LectureMediaAPIView, which checks
+        enrollment, unless the lecture is marked as a preview. Only canonical
+        paths are served: serve_file collapses empty and '.' segments, so a
+        path like 'course-file//x.mp4' or './hls/...' would otherwise reach a
+        lecture file or rendition without matching the checks below.
+
+        :param request: The request object.
+        :param path: The path of the file relative to MEDIA_ROOT.
+        :return: The file response.
+        """
+        if any(segment in ('', '.', '..') for segment in path.split('/')):
+            return Response({'message': 'File not found'}, status=status.HTTP_404_NOT_FOUND)
+        if path.startswith('hls/'):  # HLS renditions are served by LectureHLSAPIView; checked on the canonical path
+            return Response({'message': 'File not found'}, status=status.HTTP_404_NOT_FOUND)
+        if api_models.VariantItem.objects.filter(file=path, preview=False).exists():
+            return Response({'message': 'File not found'}, status=status.HTTP_404_NOT_FOUND)
+        return serve_file(request, path)
+
+
+class LectureMediaAPIView(APIView):
+    permission_classes = [AllowAny]
+
+    def get_lecture(self, request, variant_item_id):
+        """
+        Return the lecture if the requesting user may watch it.
+
+        Preview lectures are available to everyone. Other lectures require the
+        requesting user to be enrolled in the course or to be its teacher.
+
+        :param request: The request object.
+        :param variant_item_id: The variant_item_id of the lecture.
+        :return: The VariantItem, or None if it does not exist or has no file.
+        :raises NotAuthenticated: If an anonymous user requests a non-preview lecture.
+        :raises PermissionDenied: If the user is not enrolled in the course.
+        """
+        item = (
+            api_models.VariantItem.objects.select_related('variant__course__teacher')
+            .filter(variant_item_id=variant_item_id)
+            .first()
+        )
+        if item is None or not item.file:
+            return None
+
+        if not item.preview:
+            user = request.user
+            if not user.is_authenticated:
+                raise NotAuthenticated()
+            course = item.variant.course
+            allowed = (
+                user.is_staff
+                or course.teacher.user_id == user.id
+                or api_models.EnrolledCourse.objects.filter(course=course, user_id=user.id).exists()
             )
+            if not allowed:
+                raise PermissionDenied('You are not enrolled in this course')
+        return item
+
+    def get(self, request, variant_item_id):
+        """
+        Stream the video of a lecture to a student enrolled in its course.
+
+        Range requests are supported so players can seek without downloading
+        the whole file.
+
+        :param request: The request object.
+        :param variant_item_id: The variant_item_id of the lecture.
+        :return: The file response.
+        """
+        item = self.get_lecture(request, variant_item_id)
+        if item is None:
+            return Response({'message': 'Lecture not found'}, status=status.HTTP_404_NOT_FOUND)
+        return serve_file(request, item.file.name, cache_control='private, max-age=3600')
+
+
+class LectureHLSAPIView(LectureMediaAPIView):
+    def get(self, request, variant_item_id, path):
+        """
+        Serve a playlist or segment of a lecture's HLS renditions.
+
+        Access is checked like LectureMediaAPIView. Every transcode is written
+        to a new version directory, so these files never change and are cached
+        by the browser for a year.
+
+        :param request: The request object.
+        :param variant_item_id: The variant_item_id of the lecture.
+        :param path: Path of the file inside the lecture's HLS directory.
+        :return: The file response.
+        """
+        item = self.get_lecture(request, variant_item_id)
+        if item is None or item.hls_status != 'ready' or '..' in path.split('/'):
+            return Response({'message': 'Lecture not found'}, status=status.HTTP_404_NOT_FOUND)
+        return serve_file(
+            request, item.hls_path(path), cache_control='private, max-age=31536000, immutable'
+        )
+
+
+class StudentDashboardAPIView(generics.ListAPIView):
+    serializer_class = api_serializers.EnrollmentProgressSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        """
+        Return the requesting student's enrollments with their stored progress.
+
+        The course, its teacher and the last completed lesson are joined in,
+        so the whole dashboard is read with a single query.
+
+        :return: The student's enrollments, most recent first
+        """
+        return (
+            api_models.EnrolledCourse.objects.filter(user_id=self.request.user.id)
+            .select_related('course__teacher', 'last_lesson')
+            .order_by('-date')
+        )
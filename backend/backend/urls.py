@@ -15,7 +15,7 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.urls import path,include
+from django.urls import path,include,re_path
 from django.conf import settings
 from django.conf.urls.static import static
 
@@ -23,6 +23,8 @@ from rest_framework import permissions
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
 
+from api import views as api_views
+
 # swagger documentation
 schema_view = get_schema_view(
    openapi.Info(
@@ -44,9 +46,9 @@ urlpatterns = [
 
     path('admin/', admin.site.urls),
     path('api/v1/', include('api.urls')), # include the api urls
+    re_path(r'^%s(?P<path>.+)$' % settings.MEDIA_URL.lstrip('/'), api_views.MediaFileAPIView.as_view(), name='media'), # media urls with Range support
 ]
 
-urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT) # include the media urls
 urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT) # include the static urls
 
 
@@ -13,6 +13,12 @@ class CustomUser(AbstractUser):
     USERNAME_FIELD = 'email' # The field that will be used as the unique identifier for a user
     REQUIRED_FIELDS = ['username', 'full_name'] # The fields that are required to create a user
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._saved_full_name = instance.__dict__.get("full_name") # To detect changes mirrored to the profile
+        return instance
+
     def __str__(self):
         """
         Return a string representation of the user.
@@ -94,21 +100,33 @@ def create_profile(sender, instance, created, **kwargs):
 
 
 @receiver(post_save, sender=CustomUser)
-def save_profile(sender, instance, **kwargs):
+def save_profile(sender, instance, created, update_fields=None, **kwargs):
     """
-    Signal receiver that saves the Profile associated with a CustomUser
-    when it is updated.
+    Signal receiver that mirrors a changed full name to the user's Profile.
 
     This function listens to the `post_save` signal of the `CustomUser` model.
-    When a `CustomUser` instance is updated, it saves the associated
-    `Profile` instance.
+    A profile without a full name of its own shows the user's, so when the
+    user's `full_name` changed the profile is filled in with one conditional
+    UPDATE. Saves that leave the full name alone (password changes,
+    `last_login`, ...) do not touch the profile at all.
 
     :param sender: The model class that sent the signal.
     :param instance: The actual instance of the model being saved.
+    :param created: Boolean; True if a new record was created (handled by create_profile).
+    :param update_fields: The fields passed to `save()`, if any.
     :param **kwargs: Additional keyword arguments.
     :return: None
     """
-    instance.profile.save()
+    full_name_changed = (
+        not created
+        and (update_fields is None or "full_name" in update_fields)
+        and instance.full_name != getattr(instance, "_saved_full_name", object())
+    )
+    if full_name_changed and instance.full_name:
+        Profile.objects.filter(user=instance, full_name="").update(full_name=instance.full_name)
+        if CustomUser.profile.is_cached(instance) and not instance.profile.full_name:
+            instance.profile.full_name = instance.full_name # Keep the loaded profile in step
+    instance._saved_full_name = instance.full_name
 
 
 
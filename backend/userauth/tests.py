@@ -1,3 +1,82 @@
 from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
 
-# Create your tests here.
+from api import password_reset
+from userauth.models import CustomUser, Profile
+
+
+def create_user(email="student@example.com", full_name="Student", password="Str0ng-Passw0rd"):
+    user = CustomUser.objects.create(email=email, username=email.split("@")[0], full_name=full_name)
+    user.set_password(password)
+    user.save()
+    return CustomUser.objects.get(pk=user.pk)
+
+
+class ProfileSignalTests(TestCase):
+    def test_profile_is_created_with_the_user_name(self):
+        user = create_user()
+        self.assertEqual(Profile.objects.get(user=user).full_name, "Student")
+
+    def test_unrelated_user_saves_do_not_touch_the_profile(self):
+        user = create_user()
+        user.set_password("An0ther-Passw0rd")
+        with self.assertNumQueries(1):
+            user.save()
+        with self.assertNumQueries(1):
+            user.save(update_fields=["last_login"])
+
+    def test_changed_name_fills_an_empty_profile_name(self):
+        user = create_user()
+        Profile.objects.filter(user=user).update(full_name="")
+        user.full_name = "New Name"
+        # user update, profile update
+        with self.assertNumQueries(2):
+            user.save()
+        self.assertEqual(Profile.objects.get(user=user).full_name, "New Name")
+
+    def test_changed_name_keeps_a_profile_name_of_its_own(self):
+        user = create_user()
+        Profile.objects.filter(user=user).update(full_name="Chosen Name")
+        user.full_name = "New Name"
+        user.save()
+        self.assertEqual(Profile.objects.get(user=user).full_name, "Chosen Name")
+
+
+class AuthQueryCountTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_register(self):
+        payload = {
+            "full_name": "Student",
+            "email": "student@example.com",
+            "password": "Str0ng-Passw0rd",
+            "password2": "Str0ng-Passw0rd",
+        }
+        # email uniqueness check, user insert, profile insert, user update (password, username)
+        with self.assertNumQueries(4):
+            response = self.client.post(reverse("user_register"), payload)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Profile.objects.get(user__email="student@example.com").full_name, "Student")
+
+    def test_login(self):
+        create_user()
+        # user lookup
+        with self.assertNumQueries(1):
+            response = self.client.post(
+                reverse("token_obtain_pair"), {"email": "student@example.com", "password": "Str0ng-Passw0rd"}
+            )
+        self.assertEqual(response.status_code, 200)
+
+    def test_password_change(self):
+        user = create_user()
+        payload = {
+            "uuidb64": password_reset.make_link(user).split("uuid=")[1].split("&")[0],
+            "token": password_reset.token_generator.make_token(user),
+            "password": "An0ther-Passw0rd",
+        }
+        # user lookup, conditional password update
+        with self.assertNumQueries(2):
+            response = self.client.post(reverse("password_change"), payload)
+        self.assertEqual(response.status_code, 201)
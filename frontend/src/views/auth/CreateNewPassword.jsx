@@ -11,15 +11,14 @@ function CreateNewPassword() {
   const navigate = useNavigate();
   const [searchParam] = useSearchParams();
 
-  const otp = searchParam.get("otp");
   const uuidb64 = searchParam.get("uuid");
-  const refresh_token = searchParam.get("refresh_token");
+  const token = searchParam.get("token");
 
 /**
  * Handles the submission of the new password form.
  * Prevents the default form behavior and sets the loading state.
  * If the passwords do not match, an alert is shown and the process is halted.
- * Otherwise, it creates a FormData object with the OTP, UUID, password, and refresh token,
+ * Otherwise, it creates a FormData object with the UUID, reset token and password,
  * and sends a POST request to the password change endpoint.
  * On success, navigates the user to the login page and alerts the success message.
  * On error, logs the error and alerts the error message.
@@ -35,10 +34,9 @@ function CreateNewPassword() {
       return;
     } else {
       const formData = new FormData();
-      formData.append("otp", otp); // data for class PasswordChangeAPIView in api/views.py
       formData.append("uuidb64", uuidb64); // data for class PasswordChangeAPIView in api/views.py
+      formData.append("token", token); // data for class PasswordChangeAPIView in api/views.py
       formData.append("password", password);// data for class PasswordChangeAPIView in api/views.py
-      formData.append("refresh_token", refresh_token);// data for class PasswordChangeAPIView in api/views.py
 
       try {
         await apiInstance
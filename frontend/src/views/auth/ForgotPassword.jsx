@@ -15,7 +15,7 @@ function ForgotPassword() {
     e.preventDefault()
     setIsLoading(true)
    try{
-    await apiInstance.get(`user/password-reset-email/${email}/`).then((res) => {
+    await apiInstance.post(`user/password-reset-email/${email}/`).then((res) => {
       console.log(res.data)
       setIsLoading(false)
     })